@@ -0,0 +1,41 @@
+"""add clinic_twilio_accounts table
+
+auth_token es un secreto y queda en texto plano: restringir el acceso a la
+tabla y a los backups, y cifrarlo (o reemplazarlo por una referencia a un
+gestor de secretos) antes de cargar cuentas reales.
+
+Revision ID: 0a6c4e9b2d71
+Revises: f52b8e6d3a19
+Create Date: 2026-10-17 16:40:12.306418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6c4e9b2d71'
+down_revision: Union[str, Sequence[str], None] = 'f52b8e6d3a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('clinic_twilio_accounts',
+    sa.Column('clinic_id', sa.Integer(), nullable=False),
+    sa.Column('account_sid', sa.String(length=64), nullable=False),
+    sa.Column('auth_token', sa.String(length=128), nullable=False),
+    sa.Column('phone_number', sa.String(length=20), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id'], ),
+    sa.PrimaryKeyConstraint('clinic_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('clinic_twilio_accounts')
@@ -0,0 +1,30 @@
+"""appointments list index on (clinic_id, start_time, id) for keyset pagination
+
+Revision ID: 1d8f3b7a5c60
+Revises: 0a6c4e9b2d71
+Create Date: 2026-10-17 18:05:37.120954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1d8f3b7a5c60'
+down_revision: Union[str, Sequence[str], None] = '0a6c4e9b2d71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_appointments_clinic_start_id', 'appointments', ['clinic_id', 'start_time', 'id'], unique=False)
+    op.drop_index('ix_appointments_clinic_start', table_name='appointments')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_appointments_clinic_start', 'appointments', ['clinic_id', 'start_time'], unique=False)
+    op.drop_index('ix_appointments_clinic_start_id', table_name='appointments')
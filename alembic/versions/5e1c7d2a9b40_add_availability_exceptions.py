@@ -0,0 +1,43 @@
+"""add availability_exceptions table
+
+Revision ID: 5e1c7d2a9b40
+Revises: 2a5b2c0fbaec
+Create Date: 2026-10-17 10:02:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1c7d2a9b40'
+down_revision: Union[str, Sequence[str], None] = '2a5b2c0fbaec'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('availability_exceptions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('clinic_id', sa.Integer(), nullable=False),
+    sa.Column('provider_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('start_hhmm', sa.String(length=5), nullable=True),
+    sa.Column('end_hhmm', sa.String(length=5), nullable=True),
+    sa.Column('reason', sa.String(length=200), nullable=True),
+    sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id'], ),
+    sa.ForeignKeyConstraint(['provider_id'], ['providers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_availability_exceptions_clinic_id'), 'availability_exceptions', ['clinic_id'], unique=False)
+    op.create_index(op.f('ix_availability_exceptions_id'), 'availability_exceptions', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_availability_exceptions_id'), table_name='availability_exceptions')
+    op.drop_index(op.f('ix_availability_exceptions_clinic_id'), table_name='availability_exceptions')
+    op.drop_table('availability_exceptions')
@@ -0,0 +1,43 @@
+"""add composite indexes for hot queries
+
+Revision ID: c83f4a61d7e2
+Revises: 5e1c7d2a9b40
+Create Date: 2026-10-17 11:24:07.905112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c83f4a61d7e2'
+down_revision: Union[str, Sequence[str], None] = '5e1c7d2a9b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    return name in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_appointments_clinic_provider_start', 'appointments', ['clinic_id', 'provider_id', 'start_time'], unique=False)
+    op.create_index('ix_appointments_clinic_start', 'appointments', ['clinic_id', 'start_time'], unique=False)
+    op.create_index('ix_patients_clinic_phone', 'patients', ['clinic_id', 'phone'], unique=False)
+
+    # medical_evolutions nació con create_all, no con una migración
+    if _has_table('medical_evolutions'):
+        op.create_index('ix_medical_evolutions_clinic_patient_datetime', 'medical_evolutions', ['clinic_id', 'patient_id', 'evolution_datetime'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_table('medical_evolutions'):
+        op.drop_index('ix_medical_evolutions_clinic_patient_datetime', table_name='medical_evolutions')
+
+    op.drop_index('ix_patients_clinic_phone', table_name='patients')
+    op.drop_index('ix_appointments_clinic_start', table_name='appointments')
+    op.drop_index('ix_appointments_clinic_provider_start', table_name='appointments')
@@ -0,0 +1,39 @@
+"""add whatsapp_sessions table
+
+Revision ID: d41f0a9c7b25
+Revises: c83f4a61d7e2
+Create Date: 2026-10-17 12:10:52.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f0a9c7b25'
+down_revision: Union[str, Sequence[str], None] = 'c83f4a61d7e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('whatsapp_sessions',
+    sa.Column('user_id', sa.String(length=100), nullable=False),
+    sa.Column('mode', sa.String(length=20), nullable=False),
+    sa.Column('voice_session_id', sa.Integer(), nullable=True),
+    sa.Column('clinic_slug', sa.String(length=100), nullable=True),
+    sa.Column('to_number', sa.String(length=100), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['voice_session_id'], ['voice_sessions.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_whatsapp_sessions_expires_at'), 'whatsapp_sessions', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_whatsapp_sessions_expires_at'), table_name='whatsapp_sessions')
+    op.drop_table('whatsapp_sessions')
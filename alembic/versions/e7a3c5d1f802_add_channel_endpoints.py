@@ -0,0 +1,45 @@
+"""add channel_endpoints table
+
+Revision ID: e7a3c5d1f802
+Revises: d41f0a9c7b25
+Create Date: 2026-10-17 12:31:08.447190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3c5d1f802'
+down_revision: Union[str, Sequence[str], None] = 'd41f0a9c7b25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('channel_endpoints',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.String(length=20), nullable=False),
+    sa.Column('address', sa.String(length=100), nullable=False),
+    sa.Column('clinic_id', sa.Integer(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_channel_endpoints_id'), 'channel_endpoints', ['id'], unique=False)
+    op.create_index(op.f('ix_channel_endpoints_clinic_id'), 'channel_endpoints', ['clinic_id'], unique=False)
+    op.create_index(op.f('ix_channel_endpoints_updated_at'), 'channel_endpoints', ['updated_at'], unique=False)
+    op.create_index('ux_channel_endpoints_channel_address', 'channel_endpoints', ['channel', 'address'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_channel_endpoints_channel_address', table_name='channel_endpoints')
+    op.drop_index(op.f('ix_channel_endpoints_updated_at'), table_name='channel_endpoints')
+    op.drop_index(op.f('ix_channel_endpoints_clinic_id'), table_name='channel_endpoints')
+    op.drop_index(op.f('ix_channel_endpoints_id'), table_name='channel_endpoints')
+    op.drop_table('channel_endpoints')
@@ -0,0 +1,74 @@
+"""add call_campaigns and call_jobs tables
+
+Revision ID: f52b8e6d3a19
+Revises: e7a3c5d1f802
+Create Date: 2026-10-17 15:02:44.913521
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f52b8e6d3a19'
+down_revision: Union[str, Sequence[str], None] = 'e7a3c5d1f802'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('call_campaigns',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('clinic_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('base_url', sa.String(length=300), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_call_campaigns_id'), 'call_campaigns', ['id'], unique=False)
+    op.create_index(op.f('ix_call_campaigns_clinic_id'), 'call_campaigns', ['clinic_id'], unique=False)
+
+    op.create_table('call_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('campaign_id', sa.Integer(), nullable=False),
+    sa.Column('clinic_id', sa.Integer(), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=False),
+    sa.Column('patient_name', sa.String(length=200), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('call_sid', sa.String(length=64), nullable=True),
+    sa.Column('last_status', sa.String(length=30), nullable=True),
+    sa.Column('last_error', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['campaign_id'], ['call_campaigns.id'], ),
+    sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_call_jobs_id'), 'call_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_call_jobs_campaign_id'), 'call_jobs', ['campaign_id'], unique=False)
+    op.create_index(op.f('ix_call_jobs_clinic_id'), 'call_jobs', ['clinic_id'], unique=False)
+    op.create_index(op.f('ix_call_jobs_call_sid'), 'call_jobs', ['call_sid'], unique=False)
+    op.create_index('ix_call_jobs_status_next_attempt', 'call_jobs', ['status', 'next_attempt_at'], unique=False)
+    op.create_index('ux_call_jobs_campaign_phone', 'call_jobs', ['campaign_id', 'phone'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_call_jobs_campaign_phone', table_name='call_jobs')
+    op.drop_index('ix_call_jobs_status_next_attempt', table_name='call_jobs')
+    op.drop_index(op.f('ix_call_jobs_call_sid'), table_name='call_jobs')
+    op.drop_index(op.f('ix_call_jobs_clinic_id'), table_name='call_jobs')
+    op.drop_index(op.f('ix_call_jobs_campaign_id'), table_name='call_jobs')
+    op.drop_index(op.f('ix_call_jobs_id'), table_name='call_jobs')
+    op.drop_table('call_jobs')
+    op.drop_index(op.f('ix_call_campaigns_clinic_id'), table_name='call_campaigns')
+    op.drop_index(op.f('ix_call_campaigns_id'), table_name='call_campaigns')
+    op.drop_table('call_campaigns')
@@ -1,6 +1,9 @@
 from sqlalchemy.orm import Session
+import json
+import time as _time
 from datetime import timedelta
-from app.models import Patient, Appointment, AppointmentType, MedicalRecord
+from app.models import Patient, Appointment, AppointmentType, MedicalRecord, Provider
+from app.services import slot_cache, slot_holds
 
 
 def get_or_create_patient(db: Session, clinic_id: int, full_name: str, phone: str):
@@ -61,6 +64,53 @@ def get_or_create_patient(db: Session, clinic_id: int, full_name: str, phone: st
     return p
 
 
+class SlotConflictError(Exception):
+    """El horario pedido ya está ocupado para ese doctor."""
+
+    def __init__(self, provider_id: int, start_time, end_time):
+        self.provider_id = provider_id
+        self.start_time = start_time
+        self.end_time = end_time
+        super().__init__(f"Horario ocupado para provider {provider_id}: {start_time} - {end_time}")
+
+
+def _lock_provider_schedule(db: Session, clinic_id: int, provider_id: int) -> None:
+    """
+    Serializa las reservas de un mismo doctor dentro de la transacción actual.
+    - SQLite: BEGIN IMMEDIATE (toma el lock de escritura antes de leer).
+    - Postgres: SELECT ... FOR UPDATE sobre la fila del doctor.
+    Lanza ValueError si el doctor no existe en la clínica: sin fila no hay
+    nada que bloquear y dos reservas podrían pasar el chequeo de solapes.
+    """
+    conn = db.connection()
+    dialect = conn.dialect.name
+
+    if dialect == "sqlite":
+        raw = conn.connection.dbapi_connection
+        if not raw.in_transaction:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    q = db.query(Provider.id).filter(Provider.id == provider_id, Provider.clinic_id == clinic_id)
+    if dialect == "postgresql":
+        q = q.with_for_update()
+    if q.first() is None:
+        raise ValueError("Provider not found")
+
+
+def find_overlapping_appointment(db: Session, clinic_id: int, provider_id: int, start_time, end_time):
+    return (
+        db.query(Appointment)
+        .filter(
+            Appointment.clinic_id == clinic_id,
+            Appointment.provider_id == provider_id,
+            Appointment.start_time < end_time,
+            Appointment.end_time > start_time,
+            Appointment.status.notin_(slot_cache.CANCELLED_STATUSES),
+        )
+        .first()
+    )
+
+
 def create_appointment(db: Session,
     clinic_id: int,
     patient_id: int,
@@ -68,6 +118,11 @@ def create_appointment(db: Session,
     type_id: int,
     start_time
 ):
+    """
+    Reserva el horario de forma atómica: bloquea la agenda del doctor,
+    verifica solapes e inserta en la misma transacción.
+    Lanza SlotConflictError si el horario ya fue tomado.
+    """
     appt_type = db.query(AppointmentType).filter(AppointmentType.id == type_id).first()
 
     if not appt_type:
@@ -75,25 +130,40 @@ def create_appointment(db: Session,
 
     end_time = start_time + timedelta(minutes=appt_type.duration_minutes)
 
-    appt = Appointment(
-    clinic_id=clinic_id,
-    patient_id=patient_id,
-    provider_id=provider_id,
-    type_id=type_id,
-    start_time=start_time,
-    end_time=end_time,
-    status="scheduled",
-)
-
-    db.add(appt)
-    db.commit()
+    try:
+        _lock_provider_schedule(db, clinic_id, provider_id)
+
+        if find_overlapping_appointment(db, clinic_id, provider_id, start_time, end_time):
+            raise SlotConflictError(provider_id, start_time, end_time)
+
+        appt = Appointment(
+            clinic_id=clinic_id,
+            patient_id=patient_id,
+            provider_id=provider_id,
+            type_id=type_id,
+            start_time=start_time,
+            end_time=end_time,
+            status="scheduled",
+        )
+
+        db.add(appt)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
     db.refresh(appt)
+    slot_cache.mark_busy(clinic_id, provider_id, appt.start_time, appt.end_time)
     return appt
 
-import json
 from app.models import VoiceSession
+from app.services import session_codec, session_store
+from app.services.session_store import VoiceSessionState
+
+# Con un store activo (ver app/services/session_store.py) el estado de las
+# sesiones en curso vive ahí: SQL solo ve el INSERT inicial y el guardado final.
 
-def create_voice_session(db, clinic_id: int) -> VoiceSession:
+def create_voice_session(db, clinic_id: int) -> VoiceSession | VoiceSessionState:
     sess = VoiceSession(
         clinic_id=clinic_id,
         state="ASK_NAME",
@@ -102,29 +172,69 @@ def create_voice_session(db, clinic_id: int) -> VoiceSession:
     db.add(sess)
     db.commit()
     db.refresh(sess)
-    return sess
 
+    store = session_store.get_session_store()
+    if store is None:
+        return sess
+    state = VoiceSessionState.from_row(sess)
+    store.put(state)
+    return state
 
-def get_voice_session(db, session_id: int, clinic_id: int) -> VoiceSession | None:
-    return (
+
+def get_voice_session(db, session_id: int, clinic_id: int) -> VoiceSession | VoiceSessionState | None:
+    store = session_store.get_session_store()
+    if store is not None:
+        cached = store.get(session_id)
+        if cached is not None:
+            return cached if cached.clinic_id == clinic_id else None
+
+    row = (
         db.query(VoiceSession)
         .filter(VoiceSession.id == session_id, VoiceSession.clinic_id == clinic_id)
         .first()
     )
-
-def session_data(sess: VoiceSession) -> dict:
+    if row is None or store is None:
+        return row
+    state = VoiceSessionState.from_row(row)
+    store.put(state)
+    return state
+
+def session_data(sess: VoiceSession | VoiceSessionState, config=None) -> dict:
+    """Datos de la sesión (JSON viejo o formato compacto, ver session_codec)."""
     try:
-        return json.loads(sess.data_json or "{}")
+        return session_codec.decode(sess.data_json, config)
     except Exception:
         return {}
 
-def update_voice_session(db: Session, sess: VoiceSession, state: str, data: dict) -> VoiceSession:
+def update_voice_session(
+    db: Session,
+    sess: VoiceSession | VoiceSessionState,
+    state: str,
+    data: dict,
+    refresh: bool = True,
+    config=None,
+) -> VoiceSession | VoiceSessionState:
+    # con `config` los menús se guardan como ids (las etiquetas salen del config)
+    session_id = sess.id
     sess.state = state
-    sess.data_json = json.dumps(data, ensure_ascii=False)
-    db.commit()
-    db.refresh(sess)
-    return sess
-
-import json
-
+    if state == "END":
+        # la fila final queda para auditoría: JSON legible, con etiquetas
+        sess.data_json = json.dumps(data, ensure_ascii=False)
+    else:
+        sess.data_json = session_codec.encode(data, config)
+
+    store = session_store.get_session_store()
+    if store is not None and isinstance(sess, VoiceSessionState):
+        sess.updated_at = _time.time()
+        store.put(sess)
+        if state == "END":
+            session_store.schedule_flush([sess])
+    else:
+        db.commit()
+        # refresh=False ahorra el SELECT posterior cuando el llamador ya no lee `sess`
+        if refresh:
+            db.refresh(sess)
 
+    if state == "END":
+        slot_holds.release(session_id)
+    return sess
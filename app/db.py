@@ -1,3 +1,7 @@
+import functools
+import os
+
+import anyio
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings  # <- IMPORT ABSOLUTO (más estable en Windows)
@@ -21,3 +25,32 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Pool acotado para trabajo síncrono de BD desde endpoints async:
+# evita bloquear el event loop y limita cuántas sesiones corren a la vez.
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+_db_limiter: anyio.CapacityLimiter | None = None
+
+
+async def run_db(fn, *args, **kwargs):
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(DB_THREADS)
+    return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_db_limiter)
+
+
+# Backpressure: con más de DB_MAX_WAITING tareas esperando hilo, los webhooks
+# con plazo (Twilio) responden "un momento" en vez de encolarse.
+DB_MAX_WAITING = int(os.getenv("DB_MAX_WAITING", "16"))
+
+
+def db_backlog() -> int:
+    """Tareas esperando un hilo de BD (0 si el pool todavía no se usó)."""
+    if _db_limiter is None:
+        return 0
+    return _db_limiter.statistics().tasks_waiting
+
+
+def db_overloaded() -> bool:
+    return db_backlog() >= DB_MAX_WAITING
@@ -0,0 +1,90 @@
+"""
+Imprime el plan de ejecución de las queries más frecuentes.
+
+Uso:
+    python -m app.explain_hot_queries
+
+Usa DATABASE_URL (SQLite o Postgres). Sirve para verificar que cada query
+caliente use su índice compuesto y detectar regresiones tras cambiar modelos
+o migraciones: si aparece "SCAN" (SQLite) o "Seq Scan" (Postgres) sobre una
+tabla grande, algo se perdió.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, text
+
+from app.db import SessionLocal, engine
+from app import models
+from app.services.slot_cache import CANCELLED_STATUSES
+
+
+def hot_queries(db):
+    now = datetime(2026, 1, 1, 9, 0)
+    window_end = now + timedelta(days=15)
+
+    return {
+        "busy_slots (slot_cache._load)": db.query(
+            models.Appointment.provider_id, models.Appointment.start_time, models.Appointment.end_time
+        ).filter(
+            models.Appointment.clinic_id == 1,
+            models.Appointment.provider_id.in_([1, 2]),
+            models.Appointment.start_time < window_end,
+            models.Appointment.end_time > now,
+            models.Appointment.status.notin_(CANCELLED_STATUSES),
+        ),
+        "overlap_check (crud.find_overlapping_appointment)": db.query(models.Appointment).filter(
+            models.Appointment.clinic_id == 1,
+            models.Appointment.provider_id == 1,
+            models.Appointment.start_time < now + timedelta(minutes=30),
+            models.Appointment.end_time > now,
+            models.Appointment.status.notin_(CANCELLED_STATUSES),
+        ),
+        "appointments_list (GET /appointments)": db.query(models.Appointment).filter(
+            models.Appointment.clinic_id == 1,
+        ).order_by(desc(models.Appointment.start_time)).limit(50),
+        "voice_session (crud.get_voice_session)": db.query(models.VoiceSession).filter(
+            models.VoiceSession.id == 1,
+            models.VoiceSession.clinic_id == 1,
+        ),
+        "patient_by_phone (crud.get_or_create_patient)": db.query(models.Patient).filter(
+            models.Patient.phone == "+593999999999",
+            models.Patient.clinic_id == 1,
+        ),
+        "evolutions_by_patient (list_medical_evolutions_by_patient)": db.query(models.MedicalEvolution).filter(
+            models.MedicalEvolution.patient_id == 1,
+            models.MedicalEvolution.clinic_id == 1,
+        ).order_by(models.MedicalEvolution.evolution_datetime.desc(), models.MedicalEvolution.id.desc()),
+        "clinic_by_slug (tenancy.require_clinic)": db.query(models.Clinic).filter(
+            models.Clinic.slug == "demo",
+            models.Clinic.active.is_(True),
+        ),
+    }
+
+
+def explain(db, query) -> list[str]:
+    dialect = engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == "sqlite":
+        rows = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        return [row[-1] for row in rows]
+
+    rows = db.execute(text(f"EXPLAIN {sql}")).fetchall()
+    return [row[0] for row in rows]
+
+
+def main():
+    db = SessionLocal()
+    try:
+        print(f"Dialecto: {engine.dialect.name}\n")
+        for name, query in hot_queries(db).items():
+            print(f"== {name}")
+            for line in explain(db, query):
+                print(f"   {line}")
+            print()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
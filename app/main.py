@@ -1,3 +1,7 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 print(">>> MAIN REAL EJECUTADO")
 from app.db import Base, engine
@@ -9,10 +13,57 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routers.auth import router as auth_router
 from app.routers.medical_records import router as medical_records_router
 from app.routers.medical_evolutions import router as medical_evolutions_router
+from app.routers.campaigns import router as campaigns_router
 
 from app.seed import seed_data  # <-- NUEVO
+from app.services.speech import close_speech_backends
+from app.services import channel_routing, metrics, tts_cache, twilio_clients
+from app.services.session_store import close_session_store
+
+# Apagado por defecto: con varios workers cada uno sintetizaría todos los
+# prompts contra OpenAI al arrancar. Prenderlo en un solo proceso (o con
+# TTS_CACHE_DIR compartido, donde lo ya sintetizado se lee del disco).
+TTS_PREWARM = os.getenv("TTS_PREWARM", "0") == "1"
+
 
-app = FastAPI(title="Cataratas Voice MVP - SQLite")
+async def prewarm_tts():
+    from app.db import SessionLocal, run_db
+    from app.routers.voice import warmup_prompts
+
+    def load_prompts():
+        db = SessionLocal()
+        try:
+            return warmup_prompts(db)
+        finally:
+            db.close()
+
+    try:
+        prompts = await run_db(load_prompts)
+        warmed = await tts_cache.prewarm(prompts)
+        print(f"✅ TTS cache: {warmed}/{len(prompts)} prompts pre-calentados")
+    except Exception as e:
+        print(f"⚠️ TTS prewarm falló: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # en segundo plano: el servidor acepta requests mientras se calienta
+    prewarm_task = asyncio.create_task(prewarm_tts()) if TTS_PREWARM else None
+    # índice de números entrantes -> clínica, refrescado en segundo plano
+    routing_task = asyncio.create_task(channel_routing.refresh_forever())
+    yield
+    routing_task.cancel()
+    if prewarm_task is not None and not prewarm_task.done():
+        prewarm_task.cancel()
+    # cierra el pool de conexiones compartido con OpenAI
+    await close_speech_backends()
+    # y las conexiones abiertas con Twilio
+    twilio_clients.close_all()
+    # guarda en SQL las sesiones de voz que siguen en memoria
+    await asyncio.to_thread(close_session_store)
+
+
+app = FastAPI(title="Cataratas Voice MVP - SQLite", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +71,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # cursor de la página siguiente de GET /appointments
+    expose_headers=["X-Next-Cursor"],
 )
 
 Base.metadata.create_all(bind=engine)
@@ -32,6 +85,7 @@ app.include_router(whatsapp_router)
 app.include_router(auth_router)
 app.include_router(medical_records_router)
 app.include_router(medical_evolutions_router)
+app.include_router(campaigns_router)
 
 @app.get("/")
 def root():
@@ -56,5 +110,9 @@ def debug_seed():
     finally:
         db.close()
 
+@app.get("/debug/metrics")
+def debug_metrics():
+    return {"latency": metrics.snapshot(), "tts_cache": tts_cache.stats()}
+
 from app.twilio_voice import router as twilio_router
 app.include_router(twilio_router)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db import Base
@@ -35,6 +35,11 @@ class Patient(Base):
     appointments = relationship("Appointment", back_populates="patient")
     medical_evolutions = relationship("MedicalEvolution", back_populates="patient")
 
+    __table_args__ = (
+        # get_or_create_patient: WHERE clinic_id = ? AND phone = ?
+        Index("ix_patients_clinic_phone", "clinic_id", "phone"),
+    )
+
 class Provider(Base):
     __tablename__ = "providers"
     id = Column(Integer, primary_key=True, index=True)
@@ -69,6 +74,20 @@ class AvailabilityRule(Base):
     clinic = relationship("Clinic")
 
 
+class AvailabilityException(Base):
+    """Bloqueo puntual de agenda: feriado de la clínica o ausencia de un doctor."""
+    __tablename__ = "availability_exceptions"
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False, index=True)
+    provider_id = Column(Integer, ForeignKey("providers.id"), nullable=True)  # NULL = toda la clínica
+    date = Column(Date, nullable=False)
+    start_hhmm = Column(String(5), nullable=True)  # NULL = todo el día
+    end_hhmm = Column(String(5), nullable=True)
+    reason = Column(String(200), nullable=True)
+
+    clinic = relationship("Clinic")
+
+
 class Appointment(Base):
     __tablename__ = "appointments"
     id = Column(Integer, primary_key=True, index=True)
@@ -85,6 +104,13 @@ class Appointment(Base):
 
     clinic = relationship("Clinic")
 
+    __table_args__ = (
+        # búsqueda de horarios ocupados y chequeo de solapes al reservar
+        Index("ix_appointments_clinic_provider_start", "clinic_id", "provider_id", "start_time"),
+        # listado de citas de la clínica: ORDER BY start_time DESC, id DESC y keyset por (start_time, id)
+        Index("ix_appointments_clinic_start_id", "clinic_id", "start_time", "id"),
+    )
+
 
 
 class VoiceSession(Base):
@@ -98,6 +124,93 @@ class VoiceSession(Base):
     clinic = relationship("Clinic")
 
 
+class ChannelEndpoint(Base):
+    """Número entrante (WhatsApp o voz) -> clínica que lo atiende."""
+    __tablename__ = "channel_endpoints"
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String(20), nullable=False)   # "whatsapp" | "voice"
+    address = Column(String(100), nullable=False)  # normalizado: "whatsapp:+1415...", "+593..."
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False, index=True)
+    active = Column(Boolean, default=True, nullable=False)  # desactivar en vez de borrar
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    clinic = relationship("Clinic")
+
+    __table_args__ = (
+        Index("ux_channel_endpoints_channel_address", "channel", "address", unique=True),
+    )
+
+
+class WhatsAppSession(Base):
+    """Qué conversación tiene abierta cada número de WhatsApp (compartido entre workers)."""
+    __tablename__ = "whatsapp_sessions"
+    user_id = Column(String(100), primary_key=True)  # "whatsapp:+593..."
+    mode = Column(String(20), nullable=False, default="MENU")
+    voice_session_id = Column(Integer, ForeignKey("voice_sessions.id"), nullable=True)
+    clinic_slug = Column(String(100), nullable=True)
+    to_number = Column(String(100), nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class ClinicTwilioAccount(Base):
+    """
+    Cuenta (o subcuenta) de Twilio propia de una clínica; sin fila usa la
+    global, con active=False no llama.
+    """
+    __tablename__ = "clinic_twilio_accounts"
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), primary_key=True)
+    account_sid = Column(String(64), nullable=False)
+    # SECRETO en texto plano: restringir el acceso a esta tabla y a sus
+    # backups; lo ideal es cifrarlo (o guardar solo una referencia a un
+    # gestor de secretos) antes de cargar cuentas reales
+    auth_token = Column(String(128), nullable=False)
+    phone_number = Column(String(20), nullable=False)  # E.164, número de origen
+    active = Column(Boolean, default=True, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    clinic = relationship("Clinic")
+
+
+class CallCampaign(Base):
+    """Campaña de llamadas salientes (recordatorios, recall)."""
+    __tablename__ = "call_campaigns"
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False, index=True)
+    name = Column(String(200), nullable=False)
+    status = Column(String(20), nullable=False, default="active")  # active/paused/cancelled
+    max_attempts = Column(Integer, nullable=False, default=3)
+    base_url = Column(String(300), nullable=False)  # URL pública para TwiML y callbacks
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    clinic = relationship("Clinic")
+
+
+class CallJob(Base):
+    """Una llamada de una campaña; la tabla es la cola persistente del despachador."""
+    __tablename__ = "call_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("call_campaigns.id"), nullable=False, index=True)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False, index=True)
+    phone = Column(String(20), nullable=False)  # E.164
+    patient_name = Column(String(200), nullable=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued/dialing/in_progress/completed/failed/cancelled
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    call_sid = Column(String(64), nullable=True, index=True)
+    last_status = Column(String(30), nullable=True)  # último CallStatus de Twilio
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    campaign = relationship("CallCampaign")
+
+    __table_args__ = (
+        # despachador: WHERE status = 'queued' AND next_attempt_at <= now ORDER BY next_attempt_at
+        Index("ix_call_jobs_status_next_attempt", "status", "next_attempt_at"),
+        Index("ux_call_jobs_campaign_phone", "campaign_id", "phone", unique=True),
+    )
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -169,4 +282,9 @@ class MedicalEvolution(Base):
     status = Column(String(30), nullable=False, default="draft")
 
     clinic = relationship("Clinic")
-    patient = relationship("Patient", back_populates="medical_evolutions")
\ No newline at end of file
+    patient = relationship("Patient", back_populates="medical_evolutions")
+
+    __table_args__ = (
+        # historial del paciente ordenado por fecha de evolución
+        Index("ix_medical_evolutions_clinic_patient_datetime", "clinic_id", "patient_id", "evolution_datetime"),
+    )
\ No newline at end of file
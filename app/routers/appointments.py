@@ -1,16 +1,18 @@
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+import base64
 import os
 
 import jwt
-from fastapi import APIRouter, Body, Depends, Header, HTTPException
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response
 from pydantic import BaseModel
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, tuple_
+from sqlalchemy.orm import Session, contains_eager, load_only
 
 from app import models
-from app.crud import create_appointment, get_or_create_patient
+from app.crud import SlotConflictError, create_appointment, get_or_create_patient
 from app.db import get_db
 from app.schemas import AppointmentCreate, AppointmentOut
+from app.services import slot_cache
 from app.tenancy import require_clinic
 
 router = APIRouter(prefix="/appointments", tags=["appointments"])
@@ -103,33 +105,106 @@ def create(
 
     patient = get_or_create_patient(db, clinic.id, appt.full_name, appt.phone)
 
-    created = create_appointment(
-        db,
-        clinic_id=clinic.id,
-        patient_id=patient.id,
-        provider_id=appt.provider_id,
-        type_id=appt.type_id,
-        start_time=appt.start_time,
-    )
+    try:
+        created = create_appointment(
+            db,
+            clinic_id=clinic.id,
+            patient_id=patient.id,
+            provider_id=appt.provider_id,
+            type_id=appt.type_id,
+            start_time=appt.start_time,
+        )
+    except SlotConflictError:
+        raise HTTPException(status_code=409, detail="El horario ya está ocupado para ese doctor")
+    except ValueError as e:
+        # doctor o tipo de cita que no son de la clínica
+        raise HTTPException(status_code=404, detail=str(e))
     return created
 
 
+DEFAULT_PAGE_SIZE = 100
+
+
+def encode_cursor(appt: models.Appointment) -> str:
+    raw = f"{appt.start_time.isoformat()}|{appt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        start, appt_id = raw.split("|")
+        return datetime.fromisoformat(start), int(appt_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
 @router.get("")
 def list_appointments(
+    response: Response,
+    date_from: date | None = Query(default=None),
+    date_to: date | None = Query(default=None),
+    status: str | None = Query(default=None, description="uno o varios separados por coma"),
+    provider_id: int | None = Query(default=None),
+    cursor: str | None = Query(default=None),
+    limit: int | None = Query(default=None, ge=1, le=500),
     db: Session = Depends(get_db),
     x_clinic_slug: str | None = Header(default=None),
     auth=Depends(get_current_auth),
 ):
+    """
+    Lista plana de citas, de la más reciente a la más vieja. Paginar es
+    opcional: con `limit` o `cursor` se devuelve una página (por defecto de
+    100) y, si hay más, el cursor de la siguiente en el header X-Next-Cursor.
+    """
     clinic = ensure_clinic_access(db, x_clinic_slug, auth)
 
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from no puede ser posterior a date_to")
+    after = decode_cursor(cursor) if cursor else None
+
+    Appointment = models.Appointment
+    Patient = models.Patient
+
     try:
-        appointments = (
-            db.query(models.Appointment)
-            .filter(models.Appointment.clinic_id == clinic.id)
-            .order_by(desc(models.Appointment.start_time))
-            .all()
+        # paciente en el mismo SELECT (antes: 1 query por cita) y solo las columnas que se devuelven
+        q = (
+            db.query(Appointment)
+            .outerjoin(Appointment.patient)
+            .options(
+                load_only(Appointment.id, Appointment.start_time, Appointment.status),
+                contains_eager(Appointment.patient).load_only(Patient.id, Patient.full_name, Patient.phone),
+            )
+            .filter(Appointment.clinic_id == clinic.id)
         )
 
+        if date_from:
+            q = q.filter(Appointment.start_time >= datetime.combine(date_from, time.min))
+        if date_to:
+            q = q.filter(Appointment.start_time < datetime.combine(date_to + timedelta(days=1), time.min))
+        if status:
+            statuses = {s.strip() for s in status.split(",") if s.strip()}
+            if statuses & set(slot_cache.CANCELLED_STATUSES):
+                # las citas canceladas están guardadas con las dos grafías
+                statuses |= set(slot_cache.CANCELLED_STATUSES)
+            q = q.filter(Appointment.status.in_(statuses))
+        if provider_id is not None:
+            q = q.filter(Appointment.provider_id == provider_id)
+        if after:
+            # keyset: sigue justo después de la última cita de la página anterior
+            q = q.filter(tuple_(Appointment.start_time, Appointment.id) < tuple_(*after))
+
+        q = q.order_by(desc(Appointment.start_time), desc(Appointment.id))
+
+        if cursor is None and limit is None:
+            return [serialize_appointment(appt) for appt in q.all()]
+
+        limit = limit or DEFAULT_PAGE_SIZE
+        appointments = q.limit(limit + 1).all()
+        if len(appointments) > limit:
+            appointments = appointments[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(appointments[-1])
+
         return [serialize_appointment(appt) for appt in appointments]
 
     except Exception as e:
@@ -147,6 +222,7 @@ def update_appointment(
 ):
     clinic = ensure_clinic_access(db, x_clinic_slug, auth)
     appointment = get_clinic_appointment(db, clinic.id, appointment_id)
+    previous = (appointment.provider_id, appointment.start_time, appointment.end_time)
 
     if payload.start_time is not None:
         appointment.start_time = payload.start_time
@@ -165,6 +241,7 @@ def update_appointment(
 
     db.commit()
     db.refresh(appointment)
+    slot_cache.sync_appointment(appointment, previous)
     return serialize_appointment(appointment)
 
 
@@ -177,10 +254,12 @@ def cancel_appointment(
 ):
     clinic = ensure_clinic_access(db, x_clinic_slug, auth)
     appointment = get_clinic_appointment(db, clinic.id, appointment_id)
+    previous = (appointment.provider_id, appointment.start_time, appointment.end_time)
 
     appointment.status = "canceled"
     db.commit()
     db.refresh(appointment)
+    slot_cache.sync_appointment(appointment, previous)
     return serialize_appointment(appointment)
 
 
@@ -193,8 +272,10 @@ def complete_appointment(
 ):
     clinic = ensure_clinic_access(db, x_clinic_slug, auth)
     appointment = get_clinic_appointment(db, clinic.id, appointment_id)
+    previous = (appointment.provider_id, appointment.start_time, appointment.end_time)
 
     appointment.status = "completed"
     db.commit()
     db.refresh(appointment)
+    slot_cache.sync_appointment(appointment, previous)
     return serialize_appointment(appointment)
@@ -0,0 +1,148 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from app import models
+from app.db import get_db, run_db, SessionLocal
+from app.routers.appointments import ensure_clinic_access, get_current_auth
+from app.services import campaigns
+from app.twilio_voice import _get_public_base_url
+
+router = APIRouter(prefix="/campaigns", tags=["campaigns"])
+
+
+class CampaignRecipient(BaseModel):
+    phone: str
+    name: str | None = None
+
+
+class CampaignCreate(BaseModel):
+    name: str
+    recipients: list[CampaignRecipient]
+    max_attempts: int = Field(default=3, ge=1, le=10)
+
+
+def get_clinic_campaign(db: Session, clinic_id: int, campaign_id: int) -> models.CallCampaign:
+    campaign = (
+        db.query(models.CallCampaign)
+        .filter(
+            models.CallCampaign.id == campaign_id,
+            models.CallCampaign.clinic_id == clinic_id,
+        )
+        .first()
+    )
+
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaña no encontrada")
+
+    return campaign
+
+
+@router.post("")
+def create(
+    payload: CampaignCreate,
+    request: Request,
+    db: Session = Depends(get_db),
+    x_clinic_slug: str | None = Header(default=None),
+    auth=Depends(get_current_auth),
+):
+    clinic = ensure_clinic_access(db, x_clinic_slug, auth)
+
+    campaign, rejected = campaigns.create_campaign(
+        db,
+        clinic_id=clinic.id,
+        name=payload.name.strip() or "Campaña",
+        recipients=[r.model_dump() for r in payload.recipients],
+        base_url=_get_public_base_url(request),
+        max_attempts=payload.max_attempts,
+    )
+    return {**campaigns.campaign_summary(db, campaign), "rejected": rejected}
+
+
+@router.get("/{campaign_id}")
+def get_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    x_clinic_slug: str | None = Header(default=None),
+    auth=Depends(get_current_auth),
+):
+    clinic = ensure_clinic_access(db, x_clinic_slug, auth)
+    campaign = get_clinic_campaign(db, clinic.id, campaign_id)
+    return campaigns.campaign_summary(db, campaign)
+
+
+def _set_status(db: Session, x_clinic_slug: str | None, auth: dict, campaign_id: int, status: str):
+    clinic = ensure_clinic_access(db, x_clinic_slug, auth)
+    campaign = get_clinic_campaign(db, clinic.id, campaign_id)
+    if campaign.status == campaigns.CANCELLED:
+        raise HTTPException(status_code=409, detail="La campaña ya fue cancelada")
+    campaigns.set_campaign_status(db, campaign, status)
+    return campaigns.campaign_summary(db, campaign)
+
+
+@router.patch("/{campaign_id}/pause")
+def pause_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    x_clinic_slug: str | None = Header(default=None),
+    auth=Depends(get_current_auth),
+):
+    return _set_status(db, x_clinic_slug, auth, campaign_id, "paused")
+
+
+@router.patch("/{campaign_id}/resume")
+def resume_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    x_clinic_slug: str | None = Header(default=None),
+    auth=Depends(get_current_auth),
+):
+    return _set_status(db, x_clinic_slug, auth, campaign_id, "active")
+
+
+@router.patch("/{campaign_id}/cancel")
+def cancel_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    x_clinic_slug: str | None = Header(default=None),
+    auth=Depends(get_current_auth),
+):
+    return _set_status(db, x_clinic_slug, auth, campaign_id, campaigns.CANCELLED)
+
+
+def _apply_status(job_id: int, params: dict, signature: str) -> int:
+    """Código HTTP de la respuesta al callback."""
+    db = SessionLocal()
+    try:
+        valid = campaigns.verify_status_callback(db, job_id, params, signature)
+        if valid is None:
+            return 404
+        if not valid:
+            return 403
+        campaigns.handle_status(db, job_id, params.get("CallSid", ""), params.get("CallStatus", ""))
+        return 204
+    finally:
+        db.close()
+
+
+@router.post("/twilio-status")
+async def twilio_status(request: Request):
+    """
+    Status callback de Twilio para las llamadas de campañas (?job=<id>).
+    Solo se acepta con X-Twilio-Signature válida para la cuenta de la clínica.
+    """
+    try:
+        job_id = int(request.query_params.get("job", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Falta job")
+
+    params = dict((await request.form()).items())
+    signature = request.headers.get("X-Twilio-Signature", "")
+
+    status = await run_db(_apply_status, job_id, params, signature)
+    if status == 404:
+        raise HTTPException(status_code=404, detail="Llamada no encontrada")
+    if status == 403:
+        raise HTTPException(status_code=403, detail="Firma de Twilio inválida")
+    return Response(status_code=status)
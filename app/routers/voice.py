@@ -1,82 +1,93 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, UploadFile, File, Body, Form, Header
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Request, HTTPException, UploadFile, File, Body, Form, Header, Query
+from fastapi.responses import Response, StreamingResponse
+from fastapi.routing import APIRoute
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from openai import OpenAI
 import os
-import re
-import unicodedata
-import tempfile
-
-from app.db import get_db
-from app.config import settings
-from app.services.availability import get_next_slots
+import time
+
+from app.db import SessionLocal, get_db, run_db
+from app.services.availability import get_next_slots, get_next_slots_many
+from app.services.clinic_config import get_clinic_config
+from app.services.conversation import FIXED_PROMPTS, handle_message, welcome_prompt
+from app.services.speech import get_stt
+from app.services import metrics, tts_cache
 from app import crud, schemas
 from app.tenancy import get_clinic_slug, require_clinic
 
-from sqlalchemy import asc, text
+from sqlalchemy import text
 from app import models
 
 
-router = APIRouter(prefix="/voice", tags=["voice"])
+# Tamaño máximo de un clip de voz; más grande responde 413.
+# Starlette deja cada subida en memoria hasta 1 MB (SpooledTemporaryFile) y
+# recién ahí la vuelca a disco. Ese umbral es fijo en Starlette (no se
+# configura por request ni por env); un clip típico de un turno pesa unas
+# decenas de KB, así que casi nunca toca disco.
+VOICE_MAX_CLIP_BYTES = int(os.getenv("VOICE_MAX_CLIP_BYTES", str(10 * 1024 * 1024)))
+# margen para los headers multipart y los campos de texto del formulario
+VOICE_FORM_OVERHEAD_BYTES = 64 * 1024
 
-FALLBACK_CLINIC_NAME = "la clínica"
 
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Audio demasiado grande (máx {VOICE_MAX_CLIP_BYTES // 1024} KB)",
+    )
 
-def clinic_display_name(clinic) -> str:
-    return getattr(clinic, "name", None) or FALLBACK_CLINIC_NAME
 
+class _LimitedUploadRequest(Request):
+    """Request multipart que corta la lectura al pasar del límite."""
 
-def clinic_display_address(clinic) -> str:
-    return (getattr(clinic, "address", None) or "").strip()
+    def __init__(self, scope, receive, limit: int):
+        self._received = 0
 
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                self._received += len(message.get("body", b""))
+                if self._received > limit:
+                    raise _too_large()
+            return message
 
-def appointment_type_label(appt_type) -> str:
-    return (
-        getattr(appt_type, "name", None)
-        or getattr(appt_type, "code", None)
-        or f"Especialidad {appt_type.id}"
-    )
+        super().__init__(scope, limited_receive)
 
 
-def get_appointment_types_for_clinic(db: Session, clinic_id: int):
-    return (
-        db.query(models.AppointmentType)
-        .filter(models.AppointmentType.clinic_id == clinic_id)
-        .order_by(asc(models.AppointmentType.id))
-        .all()
-    )
+class LimitedUploadRoute(APIRoute):
+    """
+    FastAPI parsea el formulario completo antes de llamar al endpoint, así
+    que el límite se aplica acá: por Content-Length si viene, y si no (o si
+    miente) mientras se recibe el cuerpo.
+    """
 
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        limit = VOICE_MAX_CLIP_BYTES + VOICE_FORM_OVERHEAD_BYTES
 
-def get_providers_for_clinic(db: Session, clinic_id: int, limit: int | None = None):
-    q = (
-        db.query(models.Provider)
-        .filter(models.Provider.clinic_id == clinic_id)
-        .order_by(asc(models.Provider.id))
-    )
-    if limit:
-        q = q.limit(limit)
-    return q.all()
+        async def limited_handler(request: Request) -> Response:
+            if request.headers.get("content-type", "").startswith("multipart/"):
+                length = request.headers.get("content-length", "")
+                if length.isdigit() and int(length) > limit:
+                    raise _too_large()
+                request = _LimitedUploadRequest(request.scope, request.receive, limit)
+            return await handler(request)
 
+        return limited_handler
 
-def build_specialty_menu(appt_types) -> tuple[str, list]:
-    lines = []
-    options = []
-    for idx, appt in enumerate(appt_types, start=1):
-        label = appointment_type_label(appt)
-        options.append({"index": idx, "id": appt.id, "label": label})
-        lines.append(f"{idx}) {label}")
-    return "\n".join(lines), options
 
+router = APIRouter(prefix="/voice", tags=["voice"], route_class=LimitedUploadRoute)
 
-def build_provider_menu(providers) -> tuple[str, list]:
-    lines = []
-    options = []
-    for idx, provider in enumerate(providers, start=1):
-        label = getattr(provider, "name", None) or f"Doctor {idx}"
-        options.append({"index": idx, "id": provider.id, "label": label})
-        lines.append(f"{idx}) {label}")
-    return "\n".join(lines), options
+
+def warmup_prompts(db: Session) -> list[str]:
+    """Prompts fijos + los de cada clínica activa (bienvenida y menú de especialidades)."""
+    prompts = list(FIXED_PROMPTS)
+    clinic_ids = db.query(models.Clinic.id).filter(models.Clinic.active.is_(True)).all()
+    for (clinic_id,) in clinic_ids:
+        config = get_clinic_config(db, clinic_id)
+        prompts.append(welcome_prompt(config.clinic))
+        if config.specialty_prompt:
+            prompts.append(config.specialty_prompt)
+    return prompts
 
 
 @router.get("/test-slots")
@@ -91,22 +102,7 @@ def test_slots(
 
     from_dt = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
 
-    prov = (
-        db.query(models.Provider)
-        .filter(models.Provider.clinic_id == clinic.id)
-        .order_by(asc(models.Provider.id))
-        .first()
-    )
-
-    appt = (
-        db.query(models.AppointmentType)
-        .filter(models.AppointmentType.clinic_id == clinic.id)
-        .order_by(asc(models.AppointmentType.id))
-        .first()
-    )
-
-    provider_id = (prov.id if prov else None) or settings.DEFAULT_PROVIDER_ID
-    type_id = (appt.id if appt else None) or settings.DEFAULT_APPT_TYPE_ID
+    provider_id, type_id = get_defaults_for_clinic(db, clinic.id)
 
     res = get_next_slots(
         db,
@@ -121,555 +117,81 @@ def test_slots(
     return [{"start": s[0].isoformat(), "end": s[1].isoformat()} for s in slots]
 
 
-@router.post("/start", response_model=schemas.VoiceStartResponse)
-def start_voice(
+@router.get("/slots")
+def search_slots(
     request: Request,
+    type_id: int | None = None,
+    date: str | None = None,
+    days_ahead: int = 0,
+    limit: int = 5,
     db: Session = Depends(get_db),
     x_clinic_slug: str | None = Header(default=None, alias="X-Clinic-Slug"),
     x_forwarded_host: str | None = Header(default=None, alias="X-Forwarded-Host"),
 ):
+    """
+    Horarios libres de todos los doctores de la clínica para un tipo de cita,
+    agrupados por doctor y ordenados por el primer horario disponible.
+    """
     slug = get_clinic_slug(request, x_clinic_slug, x_forwarded_host)
     clinic = require_clinic(db, slug)
 
-    sess = crud.create_voice_session(db, clinic_id=clinic.id)
-    return {
-        "session_id": sess.id,
-        "prompt": f"Hola 👋 Bienvenido a {clinic_display_name(clinic)}. ¿Cuál es tu nombre completo?"
-    }
-
-
-WEEKDAYS_ES = {
-    "lunes": 0,
-    "martes": 1,
-    "miercoles": 2,
-    "miércoles": 2,
-    "jueves": 3,
-    "viernes": 4,
-    "sabado": 5,
-    "sábado": 5,
-    "domingo": 6,
-}
-
-
-def normalize_es(text: str) -> str:
-    text = (text or "").strip().lower()
-    text = unicodedata.normalize("NFD", text)
-    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
-    text = re.sub(r"[^a-z0-9\s]", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-
-def parse_date_es(text: str, now: datetime) -> str | None:
-    raw = (text or "").strip()
-    if not raw:
-        return None
-
-    t = raw.strip().lower()
-    norm = normalize_es(raw)
-
-    if re.fullmatch(r"\d{8}", t):
+    if date:
         try:
-            dt = datetime.strptime(t, "%Y%m%d").date()
-            return dt.isoformat()
+            from_dt = datetime.fromisoformat(date[:10] + "T00:00:00")
         except ValueError:
-            return None
-
-    if norm == "hoy":
-        return now.date().isoformat()
-    if norm in ("manana", "mañana"):
-        return (now.date() + timedelta(days=1)).isoformat()
-
-    if norm in WEEKDAYS_ES:
-        target = WEEKDAYS_ES[norm]
-        delta = (target - now.weekday()) % 7
-        delta = 7 if delta == 0 else delta
-        return (now.date() + timedelta(days=delta)).isoformat()
-
-    m = re.search(r"(\d{4})\D+(\d{1,2})\D+(\d{1,2})", t)
-    if m:
-        y = int(m.group(1))
-        mo = int(m.group(2))
-        d = int(m.group(3))
-        try:
-            return datetime(y, mo, d).date().isoformat()
-        except Exception:
-            return None
-
-    m = re.search(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b", t)
-    if m:
-        d = int(m.group(1))
-        mo = int(m.group(2))
-        y = int(m.group(3))
-        try:
-            return datetime(y, mo, d).date().isoformat()
-        except Exception:
-            return None
-
-    month_map = {
-        "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
-        "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
-    }
-    m = re.search(
-        r"\b(\d{1,2})\s*(?:de\s+)?"
-        r"(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre)"
-        r"\s*(?:de\s+)?(\d{4})\b",
-        norm,
-    )
-    if m:
-        d = int(m.group(1))
-        month_name = m.group(2)
-        y = int(m.group(3))
-        mo = month_map.get(month_name)
-        try:
-            return datetime(y, mo, d).date().isoformat()
-        except Exception:
-            return None
-
-    return None
+            raise HTTPException(status_code=422, detail="Fecha inválida, usa YYYY-MM-DD")
+    else:
+        from_dt = datetime.now()
 
+    if type_id is None:
+        _, type_id = get_defaults_for_clinic(db, clinic.id)
 
-MONTHS_ES = {
-    1: "enero", 2: "febrero", 3: "marzo", 4: "abril", 5: "mayo", 6: "junio",
-    7: "julio", 8: "agosto", 9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre",
-}
-WEEKDAYS_NAME_ES = {
-    0: "lunes", 1: "martes", 2: "miércoles", 3: "jueves", 4: "viernes", 5: "sábado", 6: "domingo",
-}
-
-
-def format_date_es(date_iso: str) -> str:
     try:
-        d = datetime.fromisoformat(date_iso).date()
-    except Exception:
-        return date_iso
-    wd = WEEKDAYS_NAME_ES.get(d.weekday(), "")
-    month = MONTHS_ES.get(d.month, "")
-    return f"{wd}, {d.day} de {month} de {d.year}".strip()
-
-
-def format_time_hhmm(iso_dt: str) -> str:
-    return (iso_dt or "")[11:16]
-
-
-def looks_like_phone(s: str) -> bool:
-    digits = re.sub(r"\D", "", s or "")
-    return len(digits) >= 8 and (len(digits) >= int(0.7 * max(1, len(s))))
-
-
-def parse_yes_no(text: str) -> bool | None:
-    norm = normalize_es(text)
-
-    if norm == "1":
-        return True
-    if norm == "2":
-        return False
-
-    yes = {"si", "sí", "s", "claro", "ok", "okay", "acepto", "confirmo", "de acuerdo", "dale", "afirmativo"}
-    no = {"no", "n", "cancelar", "cancela", "negativo"}
-
-    for y in yes:
-        if y in norm:
-            return True
-    for n in no:
-        if n in norm:
-            return False
-    return None
-
-
-def get_defaults_for_clinic(db: Session, clinic_id: int) -> tuple[int, int]:
-    prov = (
-        db.query(models.Provider)
-        .filter(models.Provider.clinic_id == clinic_id)
-        .order_by(asc(models.Provider.id))
-        .first()
-    )
-
-    appt = (
-        db.query(models.AppointmentType)
-        .filter(models.AppointmentType.clinic_id == clinic_id)
-        .order_by(asc(models.AppointmentType.id))
-        .first()
-    )
-
-    provider_id = (prov.id if prov else None) or settings.DEFAULT_PROVIDER_ID
-    type_id = (appt.id if appt else None) or settings.DEFAULT_APPT_TYPE_ID
-    return provider_id, type_id
-
-
-def handle_message(db, clinic_id, session_id, text, provider_id: int | None = None, type_id: int | None = None):
-    sess = crud.get_voice_session(db, session_id, clinic_id=clinic_id)
-    if not sess:
-        raise HTTPException(status_code=404, detail="Sesión no encontrada")
-
-    clinic = db.query(models.Clinic).filter(models.Clinic.id == clinic_id).first()
-
-    text = (text or "").strip()
-    if not text:
-        return {
-            "session_id": session_id,
-            "prompt": "No te escuché bien 😅 ¿me repites?",
-            "done": False,
-        }
-
-    data = crud.session_data(sess)
-
-    if provider_id is None or type_id is None:
-        provider_id, type_id = get_defaults_for_clinic(db, clinic_id)
-
-    if sess.state == "ASK_NAME":
-        if len(text.split()) < 2 or looks_like_phone(text):
-            return {
-                "session_id": sess.id,
-                "prompt": "Para registrarte correctamente necesito tus *nombres y apellidos* 😊",
-                "done": False,
-            }
-
-        data["full_name"] = text
-        crud.update_voice_session(db, sess, "ASK_PHONE", data)
-        return {
-            "session_id": sess.id,
-            "prompt": f"Gracias {data['full_name']} 😊 Ahora indícame tu número telefónico por favor.",
-            "done": False,
-        }
-
-    if sess.state == "ASK_PHONE":
-        data["phone"] = text
-
-        appt_types = get_appointment_types_for_clinic(db, clinic_id)
-        if not appt_types:
-            crud.update_voice_session(db, sess, "INFO_GENERAL", data)
-            return {
-                "session_id": sess.id,
-                "prompt": "Perfecto ✅ Ahora sí, agendemos tu cita.\n¿Qué fecha deseas? (Ejemplo: 18 marzo 2026)",
-                "done": False,
-            }
-
-        menu, specialty_options = build_specialty_menu(appt_types)
-        data["specialty_options"] = specialty_options
-
-        crud.update_voice_session(db, sess, "ASK_SPECIALTY", data)
-        return {
-            "session_id": sess.id,
-            "prompt": (
-                "Perfecto ✅\n"
-                "Antes de agendar, dime por favor la *especialidad*:\n"
-                f"{menu}\n"
-                f"Responde con el número del 1 al {len(specialty_options)}."
-            ),
-            "done": False,
-        }
-
-    if sess.state == "ASK_SPECIALTY":
-        options = data.get("specialty_options") or []
-        if not options:
-            appt_types = get_appointment_types_for_clinic(db, clinic_id)
-            _, options = build_specialty_menu(appt_types)
-
-        if not options:
-            crud.update_voice_session(db, sess, "INFO_GENERAL", data)
-            return {
-                "session_id": sess.id,
-                "prompt": "No encontré especialidades configuradas. Indícame la fecha deseada.",
-                "done": False,
-            }
-
-        raw = (text or "").strip().lower()
-        choice = None
-        m = re.search(r"\b(\d+)\b", raw)
-        if m:
-            choice = int(m.group(1))
-
-        norm = normalize_es(text)
-        selected = None
-
-        if choice is not None:
-            for opt in options:
-                if opt["index"] == choice:
-                    selected = opt
-                    break
-
-        if selected is None:
-            for opt in options:
-                label_norm = normalize_es(opt["label"])
-                if label_norm in norm or norm in label_norm:
-                    selected = opt
-                    break
-
-        if selected is None:
-            menu = "\n".join([f"{opt['index']}) {opt['label']}" for opt in options])
-            return {
-                "session_id": sess.id,
-                "prompt": f"No entendí 😅 Elige una opción válida:\n{menu}",
-                "done": False,
-            }
-
-        data["specialty"] = selected["label"]
-        data["type_id"] = selected["id"]
-        crud.update_voice_session(db, sess, "INFO_GENERAL", data)
-        return {
-            "session_id": sess.id,
-            "prompt": (
-                f"Perfecto ✅ Especialidad: {data['specialty']}\n\n"
-                "Ahora sí, agendemos tu cita.\n"
-                "¿Para qué fecha deseas la cita? (Ejemplo: 18 marzo 2026)"
-            ),
-            "done": False,
-        }
-
-    if sess.state == "INFO_GENERAL":
-        date_iso = parse_date_es(text, now=datetime.now())
-        if not date_iso:
-            return {
-                "session_id": sess.id,
-                "prompt": "No entendí la fecha 😅. Repite nuevamente.",
-                "done": False,
-            }
-
-        data["date"] = date_iso
-
-        selected_type_id = int(data.get("type_id") or type_id)
-        selected_provider_id = int(data.get("doctor") or provider_id)
-
-        date_start = datetime.fromisoformat(data["date"] + "T00:00:00")
-        date_end = date_start + timedelta(days=1)
-
-        res = get_next_slots(
+        results = get_next_slots_many(
             db,
-            clinic_id=clinic_id,
-            provider_id=selected_provider_id,
-            type_id=selected_type_id,
-            from_dt=date_start,
-            days_ahead=1,
-            limit=200,
+            clinic_id=clinic.id,
+            type_id=type_id,
+            from_dt=from_dt,
+            days_ahead=max(0, min(days_ahead, 31)),
+            limit=max(1, min(limit, 50)),
         )
-        all_slots = res["value"] if isinstance(res, dict) and "value" in res else res
-        day_slots = [s for s in all_slots if date_start <= s[0] < date_end]
-
-        if not day_slots:
-            return {
-                "session_id": sess.id,
-                "prompt": "Ese día no hay disponibilidad 😬 ¿Qué otra fecha te sirve?",
-                "done": False,
-            }
-
-        options = day_slots[:5]
-        data["slot_options"] = [{"start": s[0].isoformat(), "end": s[1].isoformat()} for s in options]
-        crud.update_voice_session(db, sess, "ASK_SLOT", data)
-
-        opciones_txt = "\n".join([f"{i+1}) {opt['start'][11:16]}" for i, opt in enumerate(data["slot_options"])])
-        return {
-            "session_id": sess.id,
-            "prompt": f"Estos son los horarios disponibles para {format_date_es(data['date'])}:\n{opciones_txt}\nElige el número del 1 al {len(data['slot_options'])}.",
-            "done": False,
-        }
-
-    words_to_num = {
-        "uno": 1, "una": 1, "primero": 1, "primera": 1,
-        "dos": 2, "segundo": 2, "segunda": 2,
-        "tres": 3, "tercero": 3, "tercera": 3,
-        "cuatro": 4, "cuarto": 4, "cuarta": 4,
-        "cinco": 5, "quinto": 5, "quinta": 5,
-    }
-
-    if sess.state == "ASK_SLOT":
-        raw = (text or "").strip().lower()
-
-        m = re.search(r"\b([1-5])\b", raw)
-        if m:
-            idx = int(m.group(1)) - 1
-        else:
-            n = words_to_num.get(raw)
-            if n is None:
-                return {
-                    "session_id": sess.id,
-                    "prompt": "No entendí 😅 Elige un número de la lista (por ejemplo: '3').",
-                    "done": False,
-                }
-            idx = n - 1
-
-        try:
-            chosen = data.get("slot_options", [])[idx]
-        except Exception:
-            return {
-                "session_id": sess.id,
-                "prompt": "Elige un número válido de la lista porfa 😊",
-                "done": False,
-            }
-
-        data["chosen_slot"] = chosen
-
-        providers = get_providers_for_clinic(db, clinic_id, limit=5)
-        if not providers:
-            data["doctor"] = int(provider_id)
-            data["doctor_name"] = "Doctor asignado"
-            crud.update_voice_session(db, sess, "CONFIRM", data)
-
-            hora = format_time_hhmm(data.get("chosen_slot", {}).get("start", ""))
-            fecha_humana = format_date_es(data.get("date", ""))
-
-            return {
-                "session_id": sess.id,
-                "prompt": (
-                    "Voy a agendar tu cita con estos datos:\n"
-                    f"Paciente: {data.get('full_name', '')}\n"
-                    f"Teléfono: {data.get('phone', '')}\n"
-                    f"Especialidad: {data.get('specialty', '')}\n"
-                    f"Doctor: {data.get('doctor_name', '')}\n"
-                    f"Fecha: {fecha_humana}\n"
-                    f"Hora: {hora}\n\n"
-                    "Para confirmar tu cita, presiona 1. Para cancelar, presiona 2."
-                ),
-                "done": False,
-            }
-
-        menu, provider_options = build_provider_menu(providers)
-        data["doctor_options"] = provider_options
-        crud.update_voice_session(db, sess, "ASK_DOCTOR", data)
-
-        return {
-            "session_id": sess.id,
-            "prompt": (
-                "Perfecto ✅ Ahora elige el doctor:\n"
-                f"{menu}\n"
-                f"Responde con el número del 1 al {len(provider_options)}. (También puedes decir el nombre)"
-            ),
-            "done": False,
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    names = get_clinic_config(db, clinic.id).provider_names
+    return [
+        {
+            "provider_id": r["provider_id"],
+            "provider_name": names.get(r["provider_id"], ""),
+            "slots": [{"start": s[0].isoformat(), "end": s[1].isoformat()} for s in r["slots"]],
         }
+        for r in results
+    ]
 
-    if sess.state == "ASK_DOCTOR":
-        options = data.get("doctor_options") or []
-        if not options:
-            providers = get_providers_for_clinic(db, clinic_id, limit=5)
-            _, options = build_provider_menu(providers)
-
-        raw = (text or "").strip().lower()
-        choice = None
-        mnum = re.search(r"\b(\d+)\b", raw)
-        if mnum:
-            choice = int(mnum.group(1))
-
-        norm = normalize_es(text)
-        selected = None
-
-        if choice is not None:
-            for opt in options:
-                if opt["index"] == choice:
-                    selected = opt
-                    break
-
-        if selected is None:
-            for opt in options:
-                label_norm = normalize_es(opt["label"])
-                if label_norm in norm or norm in label_norm:
-                    selected = opt
-                    break
-
-        if selected is None:
-            menu = "\n".join([f"{opt['index']}) {opt['label']}" for opt in options])
-            return {
-                "session_id": sess.id,
-                "prompt": f"No entendí 😅 Elige una opción válida para el doctor:\n{menu}",
-                "done": False,
-            }
-
-        data["doctor"] = int(selected["id"])
-        data["doctor_name"] = selected["label"]
-        crud.update_voice_session(db, sess, "CONFIRM", data)
-
-        hora = format_time_hhmm(data.get("chosen_slot", {}).get("start", ""))
-        fecha_humana = format_date_es(data.get("date", ""))
-
-        return {
-            "session_id": sess.id,
-            "prompt": (
-                "Voy a agendar tu cita con estos datos:\n"
-                f"Paciente: {data.get('full_name', '')}\n"
-                f"Teléfono: {data.get('phone', '')}\n"
-                f"Especialidad: {data.get('specialty', '')}\n"
-                f"Doctor: {data.get('doctor_name', '')}\n"
-                f"Fecha: {fecha_humana}\n"
-                f"Hora: {hora}\n\n"
-                "Para confirmar tu cita, presiona 1. Para cancelar, presiona 2."
-            ),
-            "done": False,
-        }
-
-    if sess.state == "CONFIRM":
-        yn = parse_yes_no(text)
-
-        if yn is None:
-            return {
-                "session_id": sess.id,
-                "prompt": "Para confirmar tu cita, presiona 1. Para cancelar, presiona 2.",
-                "done": False,
-            }
-
-        if yn is False:
-            crud.update_voice_session(db, sess, "INFO_GENERAL", data)
-            return {
-                "session_id": sess.id,
-                "prompt": "De acuerdo. ¿Qué fecha prefieres? (Ej: mañana, lunes, 2026-03-18)",
-                "done": False,
-            }
-
-        start_dt = datetime.fromisoformat(data["chosen_slot"]["start"])
-
-        patient = crud.get_or_create_patient(
-            db,
-            clinic_id=clinic_id,
-            full_name=data["full_name"],
-            phone=data["phone"],
-        )
-
-        prov_id = int(data.get("doctor") or provider_id)
-        appt_type_id = int(data.get("type_id") or type_id)
 
-        crud.create_appointment(
-            db=db,
-            clinic_id=clinic_id,
-            patient_id=patient.id,
-            provider_id=prov_id,
-            type_id=appt_type_id,
-            start_time=start_dt,
-        )
-
-        crud.update_voice_session(db, sess, "END", data)
-
-        clinic_name = clinic_display_name(clinic)
-        clinic_address = clinic_display_address(clinic)
-        location_text = f" Te esperamos en {clinic_name}." if clinic_name else ""
-        if clinic_address:
-            location_text += f" {clinic_address}."
-
-        return {
-            "session_id": sess.id,
-            "prompt": (
-                "✅ Listo. "
-                f"Tu cita queda agendada para {format_date_es(data.get('date', ''))}, "
-                f"a las {format_time_hhmm(data.get('chosen_slot', {}).get('start', ''))}. "
-                f"En la especialidad de {data.get('specialty', '')}, "
-                f"con el doctor {data.get('doctor_name', '')}."
-                f"{location_text} "
-                "Que tengas un excelente día 🙌"
-            ),
-            "done": True,
-        }
-
-    if sess.state == "END":
-        return {
-            "session_id": sess.id,
-            "prompt": "La sesión ya terminó. Si deseas iniciar otra, usa /voice/start",
-            "done": True,
-        }
+@router.post("/start", response_model=schemas.VoiceStartResponse)
+def start_voice(
+    request: Request,
+    db: Session = Depends(get_db),
+    x_clinic_slug: str | None = Header(default=None, alias="X-Clinic-Slug"),
+    x_forwarded_host: str | None = Header(default=None, alias="X-Forwarded-Host"),
+):
+    slug = get_clinic_slug(request, x_clinic_slug, x_forwarded_host)
+    clinic = require_clinic(db, slug)
 
+    sess = crud.create_voice_session(db, clinic_id=clinic.id)
     return {
         "session_id": sess.id,
-        "prompt": "No entendí 😅 ¿me repites por favor?",
-        "done": False,
+        "prompt": welcome_prompt(clinic),
     }
 
 
+def get_defaults_for_clinic(db: Session, clinic_id: int) -> tuple[int, int]:
+    config = get_clinic_config(db, clinic_id)
+    return config.default_provider_id, config.default_type_id
+
+
+
 @router.post("/message", response_model=schemas.VoiceMessageResponse)
 def voice_message(
     request: Request,
@@ -680,31 +202,14 @@ def voice_message(
 ):
     slug = get_clinic_slug(request, x_clinic_slug, x_forwarded_host)
     clinic = require_clinic(db, slug)
-
-    prov = (
-        db.query(models.Provider)
-        .filter(models.Provider.clinic_id == clinic.id)
-        .order_by(asc(models.Provider.id))
-        .first()
-    )
-
-    appt = (
-        db.query(models.AppointmentType)
-        .filter(models.AppointmentType.clinic_id == clinic.id)
-        .order_by(asc(models.AppointmentType.id))
-        .first()
-    )
-
-    provider_id = (prov.id if prov else None) or settings.DEFAULT_PROVIDER_ID
-    type_id = (appt.id if appt else None) or settings.DEFAULT_APPT_TYPE_ID
+    config = get_clinic_config(db, clinic.id)
 
     return handle_message(
         db,
         clinic.id,
         payload.session_id,
         payload.text,
-        provider_id=provider_id,
-        type_id=type_id,
+        config=config,
     )
 
 
@@ -713,59 +218,96 @@ async def inbound_call(request: Request):
     return {"message": "Inbound call endpoint listo"}
 
 
+async def transcribe_upload(file: UploadFile, default_ext: str) -> str:
+    """
+    Transcribe el archivo subido tal como lo dejó Starlette (en memoria o
+    spooleado), sin copiarlo a un temporal propio.
+    """
+    size = file.size
+    if size is None:
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+    if size > VOICE_MAX_CLIP_BYTES:
+        # el cuerpo entró por el margen del formulario, pero el clip se pasa
+        raise _too_large()
+
+    filename = file.filename
+    if not os.path.splitext(filename)[1]:
+        # el backend deduce el formato por la extensión
+        filename += default_ext
+
+    await file.seek(0)
+    return await get_stt().transcribe(file.file, filename, language="es")
+
+
+MP3_HEADERS = {"Content-Disposition": 'attachment; filename="respuesta.mp3"'}
+
+
+async def tts_response(text: str, stream: bool, metric: str, started: float) -> Response:
+    """
+    Audio de `text`: desde el cache si está, si no sintetizado completo o, con
+    `stream`, reenviado chunk a chunk sin pasar por disco.
+    Registra en `metric` el tiempo hasta el primer byte desde `started`.
+    """
+    audio = await tts_cache.lookup(text)
+    if audio is not None:
+        metrics.observe_ms(f"{metric}[cache]", metrics.since_ms(started))
+        return Response(content=audio, media_type="audio/mpeg", headers=MP3_HEADERS)
+
+    if not stream:
+        audio = await tts_cache.synthesize_and_store(text)
+        metrics.observe_ms(f"{metric}[full]", metrics.since_ms(started))
+        return Response(content=audio, media_type="audio/mpeg", headers=MP3_HEADERS)
+
+    chunks = tts_cache.stream_and_store(text)
+    # esperamos el primer chunk antes de responder: si el backend falla
+    # todavía podemos devolver un error en vez de un 200 cortado
+    first = await anext(chunks, b"")
+    metrics.observe_ms(f"{metric}[stream]", metrics.since_ms(started))
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="audio/mpeg", headers=MP3_HEADERS)
+
+
+def run_voice_turn(clinic_slug: str, session_id: int, text: str) -> dict:
+    """Turno completo de conversación con su propia sesión de BD (corre en el pool de run_db)."""
+    db = SessionLocal()
+    try:
+        clinic = require_clinic(db, clinic_slug)
+        return handle_message(db, clinic.id, session_id, text)
+    finally:
+        db.close()
+
+
 @router.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     if not file.filename:
         raise HTTPException(status_code=400, detail="No se recibió archivo")
 
-    suffix = os.path.splitext(file.filename)[1].lower() or ".m4a"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp_path = tmp.name
-        tmp.write(await file.read())
-
     try:
-        client = OpenAI()
-        with open(tmp_path, "rb") as f:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f,
-                language="es",
-            )
-        return {"text": transcript.text, "filename": file.filename}
+        text = await transcribe_upload(file, ".m4a")
+        return {"text": text, "filename": file.filename}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error transcribiendo audio: {str(e)}")
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
 
 
 @router.post("/speak")
-async def speak(payload: dict = Body(...)):
+async def speak(payload: dict = Body(...), stream: bool = Query(False)):
+    started = time.perf_counter()
     text = (payload.get("text") or "").strip()
     if not text:
         raise HTTPException(status_code=400, detail="Falta 'text' en el body")
 
-    client = OpenAI()
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-        out_path = tmp.name
-
     try:
-        audio = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            voice="alloy",
-            input=text,
-        )
-        with open(out_path, "wb") as f:
-            f.write(audio.read())
-
-        return FileResponse(out_path, media_type="audio/mpeg", filename="respuesta.mp3")
+        return await tts_response(text, stream, "voice.speak.ttfb_ms", started)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error generando TTS: {str(e)}")
-    finally:
-        pass
 
 
 @router.post("/chat-audio")
@@ -773,53 +315,26 @@ async def chat_audio(
     request: Request,
     session_id: int = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    stream: bool = Form(False),
     x_clinic_slug: str | None = Header(default=None, alias="X-Clinic-Slug"),
     x_forwarded_host: str | None = Header(default=None, alias="X-Forwarded-Host"),
 ):
+    started = time.perf_counter()
     if not file.filename:
         raise HTTPException(status_code=400, detail="No se recibió archivo")
 
-    suffix = os.path.splitext(file.filename)[1].lower() or ".m4a"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp_path = tmp.name
-        tmp.write(await file.read())
-
     try:
-        client = OpenAI()
-
-        with open(tmp_path, "rb") as f:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f,
-                language="es",
-            )
-        texto_usuario = transcript.text
+        texto_usuario = await transcribe_upload(file, ".m4a")
 
         slug = get_clinic_slug(request, x_clinic_slug, x_forwarded_host)
-        clinic = require_clinic(db, slug)
-
-        result = handle_message(db, clinic.id, session_id, texto_usuario)
+        result = await run_db(run_voice_turn, slug, session_id, texto_usuario)
         prompt = result["prompt"]
 
-        audio = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            voice="alloy",
-            input=prompt,
-        )
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_out:
-            out_path = tmp_out.name
-            tmp_out.write(audio.read())
-
-        return FileResponse(out_path, media_type="audio/mpeg", filename="respuesta.mp3")
+        return await tts_response(prompt, stream, "voice.chat_audio.ttfb_ms", started)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
 
 
 @router.post("/chat-audio-json")
@@ -827,46 +342,23 @@ async def chat_audio_json(
     request: Request,
     session_id: int = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
     x_clinic_slug: str | None = Header(default=None, alias="X-Clinic-Slug"),
     x_forwarded_host: str | None = Header(default=None, alias="X-Forwarded-Host"),
 ):
     if not file.filename:
         raise HTTPException(status_code=400, detail="No se recibió archivo")
 
-    suffix = os.path.splitext(file.filename)[1].lower() or ".webm"
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp_path = tmp.name
-        tmp.write(await file.read())
-
-    try:
-        client = OpenAI()
-
-        with open(tmp_path, "rb") as f:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f,
-                language="es",
-            )
-        user_text = (transcript.text or "").strip()
+    user_text = ((await transcribe_upload(file, ".webm")) or "").strip()
 
-        slug = get_clinic_slug(request, x_clinic_slug, x_forwarded_host)
-        clinic = require_clinic(db, slug)
-
-        result = handle_message(db, clinic.id, session_id, user_text)
+    slug = get_clinic_slug(request, x_clinic_slug, x_forwarded_host)
+    result = await run_db(run_voice_turn, slug, session_id, user_text)
 
-        return {
-            "session_id": result.get("session_id", session_id),
-            "transcript": user_text,
-            "prompt": result.get("prompt"),
-            "done": bool(result.get("done", False)),
-        }
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+    return {
+        "session_id": result.get("session_id", session_id),
+        "transcript": user_text,
+        "prompt": result.get("prompt"),
+        "done": bool(result.get("done", False)),
+    }
 
 
 @router.get("/debug/clinic")
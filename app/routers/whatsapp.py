@@ -4,20 +4,16 @@ from fastapi import APIRouter, Form
 from fastapi.responses import PlainTextResponse, Response
 from twilio.twiml.messaging_response import MessagingResponse
 
-from app.db import SessionLocal
+from app.db import SessionLocal, run_db
 from app.tenancy import require_clinic
 from app import crud
-from app.routers.voice import handle_message
+from app.services import channel_routing, slot_holds, whatsapp_sessions
+from app.services.conversation import handle_message
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
 
-# Sesiones locales de WhatsApp:
-# guardan qué sesión conversacional de voice_sessions está asociada a cada número.
-# IMPORTANTE: esto sirve para staging/demo. En producción conviene persistirlo en BD/Redis.
-sessions = {}
-
-# Mapeo por número WhatsApp destino -> slug de clínica
-# Ajusta estos números reales según tu cuenta / sandbox / número asignado.
+# Números de respaldo si no están en channel_endpoints (ver services/channel_routing).
+# Los números nuevos se dan de alta en la tabla, sin redeploy.
 WHATSAPP_NUMBER_TO_CLINIC = {
     "whatsapp:+14155238886": "clinica-valle",           # Twilio Sandbox
 }
@@ -32,22 +28,24 @@ def normalize_number(value: Optional[str]) -> str:
 
 
 def get_clinic_slug_by_to_number(to_number: Optional[str]) -> Optional[str]:
+    endpoint = channel_routing.lookup(channel_routing.WHATSAPP, to_number)
+    if endpoint is not None:
+        return endpoint.clinic_slug
     return WHATSAPP_NUMBER_TO_CLINIC.get(normalize_number(to_number))
 
 
-def reset_session(user_id: str):
-    sessions[user_id] = {
-        "mode": "MENU",
-        "voice_session_id": None,
-        "clinic_slug": None,
-        "to_number": None,
-    }
+def reset_session(session: dict) -> dict:
+    # si abandonó una reserva a medias, liberamos los horarios que tenía apartados
+    if session.get("voice_session_id"):
+        slot_holds.release(session["voice_session_id"])
+
+    session.clear()
+    session.update(whatsapp_sessions.new_session())
+    return session
 
 
-def get_session(user_id: str):
-    if user_id not in sessions:
-        reset_session(user_id)
-    return sessions[user_id]
+def get_session(user_id: str) -> dict:
+    return whatsapp_sessions.get(user_id) or whatsapp_sessions.new_session()
 
 
 @router.get("/health")
@@ -72,14 +70,11 @@ async def whatsapp_inbound(
     print("Body:", Body)
 
     user_id = (From or "unknown").strip()
-    incoming = normalize_text(Body)
     to_number = normalize_number(To)
 
     resp = MessagingResponse()
     msg = resp.message()
 
-    session = get_session(user_id)
-
     clinic_slug = get_clinic_slug_by_to_number(to_number)
     if not clinic_slug:
         msg.body(
@@ -88,10 +83,26 @@ async def whatsapp_inbound(
         )
         return Response(content=str(resp), media_type="application/xml")
 
+    # todo lo que toca la BD corre en el pool de run_db, fuera del event loop
+    msg.body(await run_db(answer, user_id, Body, clinic_slug, to_number))
+    return Response(content=str(resp), media_type="application/xml")
+
+
+def answer(user_id: str, body: Optional[str], clinic_slug: str, to_number: str) -> str:
+    # la sesión se lee una vez y se guarda una vez, la atienda el worker que la atienda
+    session = get_session(user_id)
+    text = reply_to(session, body, clinic_slug, to_number)
+    whatsapp_sessions.save(user_id, session)
+    return text
+
+
+def reply_to(session: dict, body: Optional[str], clinic_slug: str, to_number: str) -> str:
+    """Responde un mensaje y deja `session` como debe quedar para el siguiente."""
+    incoming = normalize_text(body)
+
     # Si entra por otro número, reiniciamos la sesión para evitar mezclar clínicas
     if session.get("to_number") and session["to_number"] != to_number:
-        reset_session(user_id)
-        session = get_session(user_id)
+        reset_session(session)
 
     session["clinic_slug"] = clinic_slug
     session["to_number"] = to_number
@@ -102,41 +113,37 @@ async def whatsapp_inbound(
     ]
 
     if incoming in greetings:
-        reset_session(user_id)
-        session = get_session(user_id)
+        reset_session(session)
         session["clinic_slug"] = clinic_slug
         session["to_number"] = to_number
 
         db = SessionLocal()
         try:
             clinic = require_clinic(db, clinic_slug)
-            msg.body(
+            return (
                 f"Hola 👋\n"
                 f"Soy el asistente virtual de {clinic.name}.\n\n"
                 "¿Qué deseas hacer?\n"
                 "1️⃣ Agendar cita\n"
                 "2️⃣ Salir"
             )
-            return Response(content=str(resp), media_type="application/xml")
         except Exception as e:
             print("ERROR cargando clínica WhatsApp:", repr(e))
-            reset_session(user_id)
-            msg.body(
+            reset_session(session)
+            return (
                 "Ocurrió un problema técnico identificando la clínica 😥\n"
                 "Escribe *hola* para intentarlo nuevamente."
             )
-            return Response(content=str(resp), media_type="application/xml")
         finally:
             db.close()
 
     if session["mode"] == "MENU":
         if incoming in ["2", "salir", "no"]:
-            reset_session(user_id)
-            msg.body(
+            reset_session(session)
+            return (
                 "Entendido 👍\n"
                 "Cuando desees volver a agendar, escribe *hola*."
             )
-            return Response(content=str(resp), media_type="application/xml")
 
         if incoming in ["1", "si", "sí", "agendar", "cita"]:
             db = SessionLocal()
@@ -148,27 +155,24 @@ async def whatsapp_inbound(
                 session["clinic_slug"] = clinic_slug
                 session["to_number"] = to_number
 
-                msg.body("Perfecto ✅\nPor favor escribe tu *nombre completo*.")
-                return Response(content=str(resp), media_type="application/xml")
+                return "Perfecto ✅\nPor favor escribe tu *nombre completo*."
             except Exception as e:
                 print("ERROR creando sesión WhatsApp:", repr(e))
-                reset_session(user_id)
-                msg.body(
+                reset_session(session)
+                return (
                     "Hubo un problema técnico creando la sesión 😥\n"
                     "Escribe *hola* para intentarlo nuevamente."
                 )
-                return Response(content=str(resp), media_type="application/xml")
             finally:
                 db.close()
 
-        msg.body(
+        return (
             "No entendí tu mensaje.\n\n"
             "Escribe:\n"
             "1 para agendar una cita\n"
             "2 para salir\n\n"
             "O escribe *hola* para comenzar."
         )
-        return Response(content=str(resp), media_type="application/xml")
 
     if session["mode"] == "BOOKING":
         db = SessionLocal()
@@ -178,32 +182,28 @@ async def whatsapp_inbound(
                 db,
                 clinic.id,
                 session["voice_session_id"],
-                Body or ""
+                body or ""
             )
             prompt = (result or {}).get("prompt") or "No entendí tu mensaje."
             done = bool((result or {}).get("done", False))
 
-            msg.body(prompt)
-
             if done:
-                reset_session(user_id)
+                reset_session(session)
 
-            return Response(content=str(resp), media_type="application/xml")
+            return prompt
 
         except Exception as e:
             print("ERROR en flujo WhatsApp:", repr(e))
-            reset_session(user_id)
-            msg.body(
+            reset_session(session)
+            return (
                 "Ocurrió un problema técnico 😥\n"
                 "Escribe *hola* para comenzar nuevamente."
             )
-            return Response(content=str(resp), media_type="application/xml")
         finally:
             db.close()
 
-    reset_session(user_id)
-    msg.body(
+    reset_session(session)
+    return (
         "Se reinició la conversación por seguridad.\n"
         "Escribe *hola* para comenzar de nuevo."
     )
-    return Response(content=str(resp), media_type="application/xml")
@@ -1,5 +1,7 @@
 from app.db import SessionLocal
 from app.models import Clinic, Provider, AppointmentType, AvailabilityRule
+from app.services import clinic_config, slot_cache
+from app.tenancy import invalidate_clinic
 
 
 def seed_data():
@@ -17,6 +19,7 @@ def seed_data():
             db.add(clinic)
             db.commit()
             db.refresh(clinic)
+            invalidate_clinic(clinic.id, clinic.slug)
 
         # 2) Crear provider si no existe
         provider = db.query(Provider).filter(
@@ -69,6 +72,8 @@ def seed_data():
                 )
 
         db.commit()
+        slot_cache.invalidate_rules(clinic.id)
+        clinic_config.invalidate(clinic.id)
         print("✅ Seed listo: clínica demo + doctor + tipo cita + horarios")
 
     finally:
@@ -1,77 +1,111 @@
 from datetime import datetime, timedelta, time
 from sqlalchemy.orm import Session
-from app.models import AvailabilityRule, Appointment, AppointmentType
-
-def _parse_hhmm(hhmm: str) -> time:
-    hh, mm = hhmm.split(":")
-    return time(int(hh), int(mm))
-
-def get_next_slots(
-    db: Session,
-    clinic_id: int,
-    provider_id: int,
-    type_id: int,
-    from_dt: datetime,
-    days_ahead: int = 14,
-    limit: int = 3
-):
-
-    appt_type = db.query(AppointmentType).filter(AppointmentType.id == type_id).first()
+from app.models import AppointmentType
+from app.services import slot_cache, slot_holds
+from app.services.clinic_config import get_clinic_config
+
+
+def _get_duration_minutes(db: Session, type_id: int, clinic_id: int | None = None) -> int:
+    if clinic_id is not None:
+        for t in get_clinic_config(db, clinic_id).appointment_types:
+            if t.id == type_id:
+                return t.duration_minutes
+
+    q = db.query(AppointmentType).filter(AppointmentType.id == type_id)
+    if clinic_id is not None:
+        # nunca el tipo de otra clínica
+        q = q.filter(AppointmentType.clinic_id == clinic_id)
+    appt_type = q.first()
     if not appt_type:
         raise ValueError("AppointmentType not found")
+    return int(appt_type.duration_minutes)
 
-    duration = timedelta(minutes=appt_type.duration_minutes)
-    results = []
 
-    for d in range(days_ahead + 1):
-        day = (from_dt.date() + timedelta(days=d))
-        dow = day.weekday()
+def _window_days(from_dt: datetime, days_ahead: int):
+    first_day = from_dt.date()
+    return [first_day + timedelta(days=d) for d in range(days_ahead + 1)]
 
-        rules = db.query(AvailabilityRule).filter(
-        AvailabilityRule.clinic_id == clinic_id,
-        AvailabilityRule.provider_id == provider_id,
-        AvailabilityRule.day_of_week == dow
-        ).all()
 
+def _held_by_provider(clinic_id: int, hold_owner) -> dict[int, dict]:
+    held = {}
+    for (pid, day), bits in slot_holds.busy_masks(clinic_id, exclude_owner=hold_owner).items():
+        held.setdefault(pid, {})[day] = bits
+    return held
 
-        if not rules:
-            continue
 
-        day_start = datetime.combine(day, time(0, 0))
-        day_end = datetime.combine(day, time(23, 59))
+def _provider_slots(per_day, days, duration_min: int, from_dt: datetime, limit: int, held=None):
+    duration = timedelta(minutes=duration_min)
+    from_min = from_dt.hour * 60 + from_dt.minute + (1 if from_dt.second or from_dt.microsecond else 0)
+    results = []
 
-        busy = db.query(Appointment).filter(
-            Appointment.clinic_id == clinic_id,
-            Appointment.provider_id == provider_id,
-            Appointment.start_time >= day_start,
-            Appointment.start_time <= day_end,
-            Appointment.status != "cancelled"
-        ).all()
+    for day in days:
+        entry = per_day.get(day)
+        if entry is None:
+            continue
 
+        day_start = datetime.combine(day, time(0, 0))
+        extra = held.get(day, 0) if held else 0
+        for s in entry.free_starts(duration_min, from_min if day == days[0] else 0, extra):
+            slot = day_start + timedelta(minutes=s)
+            results.append((slot, slot + duration))
+            if len(results) >= limit:
+                return results
 
-        busy_ranges = [(b.start_time, b.end_time) for b in busy]
+    return results
 
-        for rule in rules:
-            start_t = _parse_hhmm(rule.start_hhmm)
-            end_t = _parse_hhmm(rule.end_hhmm)
-            slot = datetime.combine(day, start_t)
 
-            end_limit = datetime.combine(day, end_t)
-            step = timedelta(minutes=rule.slot_minutes)
+def get_next_slots(
+    db: Session,
+    clinic_id: int,
+    provider_id: int,
+    type_id: int,
+    from_dt: datetime,
+    days_ahead: int = 14,
+    limit: int = 3,
+    hold_owner=None,
+):
+    """
+    Próximos `limit` horarios libres de un doctor. Los horarios apartados
+    por otras sesiones (slot_holds) no se ofrecen; `hold_owner` es la sesión
+    que pregunta, cuyos propios holds sí cuentan como libres.
+    """
+    duration_min = _get_duration_minutes(db, type_id, clinic_id)
+    days = _window_days(from_dt, days_ahead)
 
-            while slot + duration <= end_limit:
-                if slot < from_dt:
-                    slot += step
-                    continue
+    by_provider = slot_cache.get_days(db, clinic_id, [provider_id], days)
+    held = _held_by_provider(clinic_id, hold_owner)
+    return _provider_slots(by_provider.get(provider_id, {}), days, duration_min, from_dt, limit, held.get(provider_id))
 
-                slot_end = slot + duration
-                overlaps = any(not (slot_end <= b0 or slot >= b1) for (b0, b1) in busy_ranges)
 
-                if not overlaps:
-                    results.append((slot, slot_end))
-                    if len(results) >= limit:
-                        return results
+def get_next_slots_many(
+    db: Session,
+    clinic_id: int,
+    type_id: int,
+    from_dt: datetime,
+    provider_ids: list[int] | None = None,
+    days_ahead: int = 14,
+    limit: int = 3,
+    hold_owner=None,
+) -> list[dict]:
+    """
+    Igual que get_next_slots pero para varios doctores en una sola pasada
+    (un solo lote de carga sin importar cuántos doctores tenga la clínica).
+
+    Devuelve [{"provider_id": id, "slots": [(inicio, fin), ...]}, ...]
+    ordenado por el primer horario libre; los doctores sin cupo no aparecen.
+    Respeta los holds igual que get_next_slots.
+    """
+    duration_min = _get_duration_minutes(db, type_id, clinic_id)
+    days = _window_days(from_dt, days_ahead)
+
+    by_provider = slot_cache.get_days(db, clinic_id, provider_ids, days)
+    held = _held_by_provider(clinic_id, hold_owner)
 
-                slot += step
+    results = []
+    for pid, per_day in by_provider.items():
+        slots = _provider_slots(per_day, days, duration_min, from_dt, limit, held.get(pid))
+        if slots:
+            results.append({"provider_id": pid, "slots": slots})
 
+    results.sort(key=lambda r: (r["slots"][0][0], r["provider_id"]))
     return results
@@ -0,0 +1,441 @@
+"""
+Campañas de llamadas salientes (recordatorios, recall de pacientes).
+
+La cola es la tabla call_jobs: una fila por paciente a llamar. Un
+despachador (proceso aparte: `python -m app.services.campaigns`) toma trabajos listos con un UPDATE
+condicional (status='queued' -> 'dialing'), así que con varios workers cada
+llamada la marca uno solo, y los reparte a un pool de hilos que llaman a
+Twilio con el Client de la cuenta de cada clínica (twilio_clients: uno por
+cuenta, reusa conexiones HTTP).
+
+Límites:
+    CAMPAIGN_MAX_CONCURRENCY_PER_CLINIC  llamadas en curso por clínica
+    CAMPAIGN_CALLS_PER_SECOND            llamadas por segundo por número de
+                                         origen (Twilio encola o rechaza si
+                                         se supera el CPS de la cuenta)
+    Además nunca hay dos llamadas en curso al mismo paciente.
+
+El despachador no corre dentro de los workers web: los límites se aplican
+por proceso (con varios, el de CPS se multiplica y el conteo por clínica
+compite), así que start.sh lo levanta una sola vez, aparte de uvicorn, si
+CAMPAIGN_WORKERS (hilos que llaman a Twilio) es mayor que 0. Por defecto
+vale 0 y no hay despachador.
+
+Reintentos: ocupado, no contesta, falla o error al llamar vuelve a la cola
+con backoff exponencial (CAMPAIGN_RETRY_BASE_SECONDS * 2^(intento-1), con
+jitter) hasta max_attempts de la campaña. El estado de cada llamada llega
+por el status callback de Twilio (POST /campaigns/twilio-status). Si un
+trabajo queda marcando más de CAMPAIGN_CALL_TIMEOUT_SECONDS sin callback
+(se perdió, o el proceso murió antes de llamar) cuenta como intento fallido;
+si ya había contestado se da por completado y no se vuelve a llamar.
+
+benchmarks/bench_campaigns.py lo prueba contra un Twilio falso local
+(TWILIO_API_BASE_URL).
+"""
+import asyncio
+import os
+import random
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, run_db
+from app.models import CallCampaign, CallJob, Clinic
+from app.services import metrics, twilio_clients
+from app.twilio_voice import _normalize_phone_e164
+
+CAMPAIGN_WORKERS = int(os.getenv("CAMPAIGN_WORKERS", "0"))
+CAMPAIGN_POLL_SECONDS = float(os.getenv("CAMPAIGN_POLL_SECONDS", "2"))
+CAMPAIGN_MAX_CONCURRENCY_PER_CLINIC = int(os.getenv("CAMPAIGN_MAX_CONCURRENCY_PER_CLINIC", "3"))
+CAMPAIGN_CALLS_PER_SECOND = float(os.getenv("CAMPAIGN_CALLS_PER_SECOND", "1"))
+CAMPAIGN_RETRY_BASE_SECONDS = float(os.getenv("CAMPAIGN_RETRY_BASE_SECONDS", "300"))
+CAMPAIGN_RETRY_MAX_SECONDS = float(os.getenv("CAMPAIGN_RETRY_MAX_SECONDS", str(6 * 3600)))
+CAMPAIGN_CALL_TIMEOUT_SECONDS = float(os.getenv("CAMPAIGN_CALL_TIMEOUT_SECONDS", "1800"))
+
+QUEUED = "queued"
+DIALING = "dialing"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE = (DIALING, IN_PROGRESS)
+
+# CallStatus de Twilio -> qué hacer con el trabajo
+_ANSWERED = {"in-progress", "answered"}
+_RETRY = {"busy", "no-answer", "failed", "canceled"}
+
+
+@dataclass(frozen=True)
+class DialJob:
+    """Lo necesario para llamar, sin ORM (viaja al hilo que marca)."""
+    id: int
+    clinic_id: int
+    clinic_slug: str
+    phone: str
+    base_url: str
+    attempt: int
+
+
+# =========================
+# Alta de campañas
+# =========================
+def create_campaign(
+    db: Session,
+    clinic_id: int,
+    name: str,
+    recipients: list[dict],
+    base_url: str,
+    max_attempts: int = 3,
+) -> tuple[CallCampaign, list[dict]]:
+    """
+    Crea la campaña y encola una llamada por destinatario ({"phone", "name"}).
+    Devuelve la campaña y los rechazados (teléfono inválido o repetido).
+    """
+    campaign = CallCampaign(
+        clinic_id=clinic_id,
+        name=name,
+        max_attempts=max(1, max_attempts),
+        base_url=base_url.rstrip("/"),
+    )
+    db.add(campaign)
+    db.flush()
+
+    rejected = []
+    seen = set()
+    now = datetime.utcnow()
+    jobs = []
+    for r in recipients:
+        try:
+            phone = _normalize_phone_e164(r.get("phone", ""))
+        except ValueError as e:
+            rejected.append({"phone": r.get("phone"), "error": str(e)})
+            continue
+        if phone in seen:
+            rejected.append({"phone": r.get("phone"), "error": "Teléfono repetido en la campaña."})
+            continue
+        seen.add(phone)
+        jobs.append({
+            "campaign_id": campaign.id,
+            "clinic_id": clinic_id,
+            "phone": phone,
+            "patient_name": (r.get("name") or None),
+            "status": QUEUED,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+            "updated_at": now,
+        })
+
+    if jobs:
+        db.bulk_insert_mappings(CallJob, jobs)
+    db.commit()
+    db.refresh(campaign)
+    return campaign, rejected
+
+
+def campaign_summary(db: Session, campaign: CallCampaign) -> dict:
+    counts = dict(
+        db.query(CallJob.status, func.count(CallJob.id))
+        .filter(CallJob.campaign_id == campaign.id)
+        .group_by(CallJob.status)
+        .all()
+    )
+    return {
+        "id": campaign.id,
+        "name": campaign.name,
+        "status": campaign.status,
+        "max_attempts": campaign.max_attempts,
+        "created_at": campaign.created_at.isoformat() if campaign.created_at else None,
+        "jobs": {s: counts.get(s, 0) for s in (QUEUED, DIALING, IN_PROGRESS, COMPLETED, FAILED, CANCELLED)},
+    }
+
+
+def set_campaign_status(db: Session, campaign: CallCampaign, status: str) -> CallCampaign:
+    """active/paused/cancelled. Cancelar saca de la cola lo pendiente; lo que ya sonó sigue."""
+    campaign.status = status
+    if status == CANCELLED:
+        db.query(CallJob).filter(CallJob.campaign_id == campaign.id, CallJob.status == QUEUED).update(
+            {CallJob.status: CANCELLED, CallJob.updated_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+    db.commit()
+    db.refresh(campaign)
+    return campaign
+
+
+# =========================
+# Cola
+# =========================
+def _backoff_seconds(attempt: int) -> float:
+    delay = min(CAMPAIGN_RETRY_MAX_SECONDS, CAMPAIGN_RETRY_BASE_SECONDS * 2 ** max(0, attempt - 1))
+    # jitter: que los reintentos de una tanda no caigan todos juntos
+    return delay * random.uniform(1.0, 1.2)
+
+
+def _fail_attempt(db: Session, job: CallJob, error: str, now: datetime) -> None:
+    max_attempts = db.query(CallCampaign.max_attempts).filter(CallCampaign.id == job.campaign_id).scalar() or 1
+    if job.attempts >= max_attempts:
+        job.status = FAILED
+    else:
+        job.status = QUEUED
+        job.next_attempt_at = now + timedelta(seconds=_backoff_seconds(job.attempts))
+    job.last_error = (error or "")[:500]
+    job.updated_at = now
+
+
+def _requeue_stale(db: Session, now: datetime) -> None:
+    cutoff = now - timedelta(seconds=CAMPAIGN_CALL_TIMEOUT_SECONDS)
+    stale = db.query(CallJob).filter(CallJob.status.in_(ACTIVE), CallJob.updated_at < cutoff).all()
+    for job in stale:
+        if job.status == IN_PROGRESS:
+            # el paciente contestó: se perdió el 'completed' (o la llamada es
+            # muy larga), pero nunca se lo vuelve a llamar
+            job.status = COMPLETED
+            job.last_error = "Sin status callback de fin de llamada"
+            job.updated_at = now
+        else:
+            _fail_attempt(db, job, "Sin status callback de Twilio", now)
+
+
+def claim_jobs(db: Session, limit: int) -> list[DialJob]:
+    """Marca como 'dialing' hasta `limit` llamadas listas respetando los límites."""
+    now = datetime.utcnow()
+    _requeue_stale(db, now)
+
+    active = dict(
+        db.query(CallJob.clinic_id, func.count(CallJob.id))
+        .filter(CallJob.status.in_(ACTIVE))
+        .group_by(CallJob.clinic_id)
+        .all()
+    )
+    full = [cid for cid, n in active.items() if n >= CAMPAIGN_MAX_CONCURRENCY_PER_CLINIC]
+    busy_phones = {p for (p,) in db.query(CallJob.phone).filter(CallJob.status.in_(ACTIVE)).all()}
+
+    q = (
+        db.query(CallJob.id, CallJob.clinic_id, CallJob.phone, CallJob.attempts, CallCampaign.base_url, Clinic.slug)
+        .join(CallCampaign, CallCampaign.id == CallJob.campaign_id)
+        .join(Clinic, Clinic.id == CallJob.clinic_id)
+        .filter(
+            CallJob.status == QUEUED,
+            CallJob.next_attempt_at <= now,
+            CallCampaign.status == "active",
+        )
+    )
+    if full:
+        q = q.filter(CallJob.clinic_id.notin_(full))
+    candidates = q.order_by(CallJob.next_attempt_at, CallJob.id).limit(limit * 4).all()
+
+    claimed = []
+    for job_id, clinic_id, phone, attempts, base_url, slug in candidates:
+        if len(claimed) >= limit:
+            break
+        if active.get(clinic_id, 0) >= CAMPAIGN_MAX_CONCURRENCY_PER_CLINIC or phone in busy_phones:
+            continue
+        # condicional: si otro worker ya la tomó no actualiza nada
+        taken = (
+            db.query(CallJob)
+            .filter(CallJob.id == job_id, CallJob.status == QUEUED)
+            .update(
+                {
+                    CallJob.status: DIALING,
+                    CallJob.attempts: CallJob.attempts + 1,
+                    CallJob.call_sid: None,
+                    CallJob.last_status: None,
+                    CallJob.updated_at: now,
+                },
+                synchronize_session=False,
+            )
+        )
+        if not taken:
+            continue
+        active[clinic_id] = active.get(clinic_id, 0) + 1
+        busy_phones.add(phone)
+        claimed.append(DialJob(job_id, clinic_id, slug, phone, base_url, attempts + 1))
+
+    db.commit()
+    return claimed
+
+
+def status_callback_url(base_url: str, job_id: int) -> str:
+    """URL a la que Twilio manda el estado de la llamada (y con la que la firma)."""
+    return f"{base_url}/campaigns/twilio-status?job={job_id}"
+
+
+def verify_status_callback(db: Session, job_id: int, params: dict, signature: str) -> bool | None:
+    """
+    Valida X-Twilio-Signature con el auth token de la cuenta de la clínica
+    del trabajo. None si el trabajo no existe.
+    """
+    from twilio.request_validator import RequestValidator
+
+    row = (
+        db.query(CallJob.clinic_id, CallCampaign.base_url)
+        .join(CallCampaign, CallCampaign.id == CallJob.campaign_id)
+        .filter(CallJob.id == job_id)
+        .first()
+    )
+    if row is None:
+        return None
+    try:
+        account = twilio_clients.account_for_clinic(row.clinic_id)
+    except twilio_clients.TwilioNotConfigured:
+        return False
+    if account is None or not signature:
+        return False
+    url = status_callback_url(row.base_url, job_id)
+    return RequestValidator(account.auth_token).validate(url, params, signature)
+
+
+def handle_status(db: Session, job_id: int, call_sid: str, call_status: str) -> bool:
+    """Aplica un status callback de Twilio. False si el trabajo no existe."""
+    job = db.get(CallJob, job_id)
+    if job is None:
+        return False
+    if job.status not in ACTIVE:
+        return True  # ya resuelto (o cancelado): callback tardío
+    if job.call_sid and call_sid and job.call_sid != call_sid:
+        return True  # callback de un intento anterior
+
+    now = datetime.utcnow()
+    status = (call_status or "").strip().lower()
+    job.call_sid = job.call_sid or call_sid or None
+    job.last_status = status or job.last_status
+    job.updated_at = now
+
+    if status in _ANSWERED:
+        job.status = IN_PROGRESS
+    elif status == "completed":
+        job.status = COMPLETED
+    elif status in _RETRY:
+        _fail_attempt(db, job, f"Twilio: {status}", now)
+    db.commit()
+    return True
+
+
+def _record_call_sid(job_id: int, call_sid: str) -> None:
+    db = SessionLocal()
+    try:
+        # el callback 'initiated' puede haber llegado antes y ya haberlo guardado
+        db.query(CallJob).filter(CallJob.id == job_id, CallJob.call_sid.is_(None)).update(
+            {CallJob.call_sid: call_sid}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _record_dial_error(job_id: int, error: str) -> None:
+    db = SessionLocal()
+    try:
+        job = db.get(CallJob, job_id)
+        if job is not None and job.status == DIALING:
+            _fail_attempt(db, job, error, datetime.utcnow())
+            db.commit()
+    finally:
+        db.close()
+
+
+# =========================
+# Twilio
+# =========================
+class _PerNumberRate:
+    """Espacia las llamadas de cada número de origen a `rate` por segundo."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next: dict[str, float] = {}
+
+    def wait(self, number: str) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = _time.monotonic()
+            slot = max(now, self._next.get(number, 0.0))
+            self._next[number] = slot + self.interval
+        if slot > now:
+            _time.sleep(slot - now)
+
+
+_rate = _PerNumberRate(CAMPAIGN_CALLS_PER_SECOND)
+
+
+def dial(job: DialJob) -> None:
+    """Hace la llamada (corre en un hilo del pool). El resultado llega por callback."""
+    started = _time.perf_counter()
+    try:
+        client, from_number = twilio_clients.client_for_clinic(job.clinic_id)
+        _rate.wait(from_number)
+        call = client.calls.create(
+            to=job.phone,
+            from_=from_number,
+            url=f"{job.base_url}/twilio/voice?clinic={job.clinic_slug}",
+            method="POST",
+            status_callback=status_callback_url(job.base_url, job.id),
+            status_callback_event=["initiated", "ringing", "answered", "completed"],
+            status_callback_method="POST",
+        )
+    except Exception as e:
+        print(f"⚠️ Campaña: no se pudo llamar (job {job.id}, intento {job.attempt}): {e!r}")
+        _record_dial_error(job.id, repr(e))
+        return
+    finally:
+        metrics.observe_ms("campaigns.dial_ms", metrics.since_ms(started))
+    _record_call_sid(job.id, call.sid)
+
+
+# =========================
+# Despachador
+# =========================
+def _claim_once(limit: int) -> list[DialJob]:
+    db = SessionLocal()
+    try:
+        return claim_jobs(db, limit)
+    finally:
+        db.close()
+
+
+async def run_forever(workers: int = CAMPAIGN_WORKERS, interval: float = CAMPAIGN_POLL_SECONDS) -> None:
+    """Despachador: toma llamadas de la cola y las reparte a `workers` hilos."""
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="campaign-dial")
+    loop = asyncio.get_running_loop()
+    inflight: set[asyncio.Future] = set()
+    try:
+        while True:
+            inflight = {f for f in inflight if not f.done()}
+            free = workers - len(inflight)
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = await run_db(_claim_once, free)
+                except Exception as e:
+                    print(f"⚠️ Campaña: no se pudo leer la cola: {e}")
+                for job in jobs:
+                    inflight.add(loop.run_in_executor(executor, dial, job))
+
+            if inflight and len(jobs) == free:
+                # hilos llenos y probablemente más cola: seguir apenas se libere uno
+                await asyncio.wait(inflight, timeout=interval, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(interval)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _main() -> None:
+    if CAMPAIGN_WORKERS <= 0:
+        print("⚠️ CAMPAIGN_WORKERS=0: despachador de campañas apagado")
+        return
+    try:
+        await run_forever()
+    finally:
+        twilio_clients.close_all()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
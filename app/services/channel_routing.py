@@ -0,0 +1,163 @@
+"""
+Ruteo de números entrantes a clínicas (tabla channel_endpoints).
+
+La tabla se carga completa a un dict en memoria, (canal, número) -> clínica,
+y cada CHANNEL_REFRESH_SECONDS se traen solo las filas con updated_at más
+nuevo que la última vista (menos CHANNEL_REFRESH_OVERLAP_SECONDS). Resolver
+un mensaje entrante es un lookup en el dict, sin ir a la base.
+
+updated_at lo pone la aplicación antes del commit, así que una fila puede
+aparecer después de otra con hora posterior; el solape la vuelve a buscar.
+Lo que igual se escape (commits más lentos que el solape, DELETEs, cambios
+de slug de una clínica) se corrige con la recarga completa que se hace cada
+CHANNEL_FULL_RELOAD_SECONDS o a mano con `reload()`. Para dar de baja un
+número conviene marcar active=False: el refresh incremental lo ve enseguida.
+"""
+import asyncio
+import os
+import threading
+import time as _time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, run_db
+from app.models import ChannelEndpoint, Clinic
+
+CHANNEL_REFRESH_SECONDS = float(os.getenv("CHANNEL_REFRESH_SECONDS", "30"))
+CHANNEL_REFRESH_OVERLAP_SECONDS = float(os.getenv("CHANNEL_REFRESH_OVERLAP_SECONDS", "60"))
+CHANNEL_FULL_RELOAD_SECONDS = float(os.getenv("CHANNEL_FULL_RELOAD_SECONDS", "600"))
+
+WHATSAPP = "whatsapp"
+VOICE = "voice"
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    clinic_id: int
+    clinic_slug: str
+
+
+_lock = threading.Lock()
+_index: dict[tuple[str, str], Endpoint] = {}
+_watermark: datetime | None = None
+_loaded = False
+# monotonic de la última recarga completa
+_reloaded_at = 0.0
+
+
+def normalize_address(channel: str, address: str | None) -> str:
+    """'whatsapp:+1 415-523 8886' -> 'whatsapp:+14155238886'; voz sin prefijo."""
+    a = (address or "").strip().lower()
+    for ch in " -()":
+        a = a.replace(ch, "")
+    if a.startswith("whatsapp:"):
+        a = a[len("whatsapp:"):]
+    return f"whatsapp:{a}" if channel == WHATSAPP and a else a
+
+
+def _apply(rows, full: bool) -> None:
+    global _index, _watermark, _loaded
+    with _lock:
+        # la recarga completa arma un dict nuevo y lo cambia de una vez
+        index = {} if full else _index
+        for endpoint, slug in rows:
+            key = (endpoint.channel, endpoint.address)
+            if endpoint.active and slug:
+                index[key] = Endpoint(endpoint.clinic_id, slug)
+            else:
+                index.pop(key, None)
+            if _watermark is None or endpoint.updated_at > _watermark:
+                _watermark = endpoint.updated_at
+        _index = index
+        _loaded = True
+
+
+def _query(db: Session):
+    return db.query(ChannelEndpoint, Clinic.slug).join(Clinic, Clinic.id == ChannelEndpoint.clinic_id)
+
+
+def reload(db: Session) -> int:
+    """Recarga completa del índice. Devuelve cuántos números quedaron activos."""
+    global _watermark, _reloaded_at
+    rows = _query(db).filter(ChannelEndpoint.active.is_(True)).all()
+    with _lock:
+        _watermark = None
+        _reloaded_at = _time.monotonic()
+    _apply(rows, full=True)
+    return len(_index)
+
+
+def refresh(db: Session) -> int:
+    """
+    Trae solo lo que cambió desde la última carga (o todo, si toca la recarga
+    completa). Devuelve cuántas filas aplicó.
+    """
+    if not _loaded or _time.monotonic() - _reloaded_at >= CHANNEL_FULL_RELOAD_SECONDS:
+        return reload(db)
+    with _lock:
+        since = _watermark
+    q = _query(db)
+    if since is not None:
+        # solape: filas con updated_at anterior que hicieron commit tarde
+        q = q.filter(ChannelEndpoint.updated_at >= since - timedelta(seconds=CHANNEL_REFRESH_OVERLAP_SECONDS))
+    rows = q.all()
+    _apply(rows, full=False)
+    return len(rows)
+
+
+def lookup(channel: str, address: str | None) -> Endpoint | None:
+    """Clínica que atiende `address` en `channel`, o None si no está registrado."""
+    if not _loaded:
+        # primer uso fuera del lifespan (scripts, tests): carga una vez
+        db = SessionLocal()
+        try:
+            reload(db)
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar channel_endpoints: {e}")
+            return None
+        finally:
+            db.close()
+    return _index.get((channel, normalize_address(channel, address)))
+
+
+def register(db: Session, channel: str, address: str, clinic_id: int, active: bool = True) -> ChannelEndpoint:
+    """Alta o cambio de un número; este worker lo ve al instante, el resto en el próximo refresh."""
+    address = normalize_address(channel, address)
+    endpoint = (
+        db.query(ChannelEndpoint)
+        .filter(ChannelEndpoint.channel == channel, ChannelEndpoint.address == address)
+        .first()
+    )
+    if endpoint is None:
+        endpoint = ChannelEndpoint(channel=channel, address=address, clinic_id=clinic_id, active=active)
+        db.add(endpoint)
+    else:
+        endpoint.clinic_id = clinic_id
+        endpoint.active = active
+        endpoint.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(endpoint)
+
+    slug = db.query(Clinic.slug).filter(Clinic.id == clinic_id).scalar()
+    _apply([(endpoint, slug)], full=False)
+    return endpoint
+
+
+def _refresh_once() -> int:
+    db = SessionLocal()
+    try:
+        return refresh(db)
+    finally:
+        db.close()
+
+
+async def refresh_forever(interval: float = CHANNEL_REFRESH_SECONDS) -> None:
+    """Tarea de fondo (lifespan): carga inicial y refresh incremental periódico."""
+    while True:
+        try:
+            await run_db(_refresh_once)
+        except Exception as e:
+            print(f"⚠️ No se pudo refrescar channel_endpoints: {e}")
+        await asyncio.sleep(interval)
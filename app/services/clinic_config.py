@@ -0,0 +1,190 @@
+"""
+Configuración por clínica para el motor de conversación.
+
+Junta en un objeto inmutable todo lo que `handle_message` necesitaba
+re-consultar en cada turno: la clínica, el doctor y tipo de cita por defecto,
+los doctores y especialidades en orden y el texto de los menús ya armado.
+Se carga una vez (2 queries + la clínica, que viene del cache de tenancy) y
+se comparte entre turnos, canales e hilos.
+
+Se cachea por clínica durante CLINIC_CONFIG_TTL_SECONDS y se invalida con
+`invalidate()` cuando cambian doctores, especialidades o la clínica.
+"""
+import os
+import threading
+import time as _time
+from collections import defaultdict
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from sqlalchemy import asc
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import AppointmentType, Provider
+from app.tenancy import ClinicSnapshot, get_clinic
+
+CLINIC_CONFIG_TTL_SECONDS = float(os.getenv("CLINIC_CONFIG_TTL_SECONDS", "300"))
+
+
+def appointment_type_label(appt_type) -> str:
+    return (
+        getattr(appt_type, "name", None)
+        or getattr(appt_type, "code", None)
+        or f"Especialidad {appt_type.id}"
+    )
+
+
+def provider_label(provider, idx: int) -> str:
+    return getattr(provider, "name", None) or f"Doctor {idx}"
+
+
+def build_specialty_menu(appt_types) -> tuple[str, list]:
+    lines = []
+    options = []
+    for idx, appt in enumerate(appt_types, start=1):
+        label = appointment_type_label(appt)
+        options.append({"index": idx, "id": appt.id, "label": label})
+        lines.append(f"{idx}) {label}")
+    return "\n".join(lines), options
+
+
+def build_provider_menu(providers) -> tuple[str, list]:
+    lines = []
+    options = []
+    for idx, provider in enumerate(providers, start=1):
+        label = provider_label(provider, idx)
+        options.append({"index": idx, "id": provider.id, "label": label})
+        lines.append(f"{idx}) {label}")
+    return "\n".join(lines), options
+
+
+def specialty_menu_prompt(menu: str, count: int) -> str:
+    return (
+        "Perfecto ✅\n"
+        "Antes de agendar, dime por favor la *especialidad*:\n"
+        f"{menu}\n"
+        f"Responde con el número del 1 al {count}."
+    )
+
+
+@dataclass(frozen=True)
+class ProviderInfo:
+    id: int
+    name: str | None
+
+
+@dataclass(frozen=True)
+class AppointmentTypeInfo:
+    id: int
+    name: str | None
+    code: str | None
+    duration_minutes: int
+
+
+@dataclass(frozen=True)
+class ClinicConfig:
+    clinic: ClinicSnapshot
+    version: int
+    default_provider_id: int
+    default_type_id: int
+    providers: tuple[ProviderInfo, ...]              # ordenados por id
+    appointment_types: tuple[AppointmentTypeInfo, ...]  # ordenados por id
+    specialty_menu: str
+    specialty_options: tuple[tuple[int, int, str], ...]  # (index, id, label)
+    specialty_prompt: str
+    provider_names: MappingProxyType
+
+    @property
+    def clinic_id(self) -> int:
+        return self.clinic.id
+
+    def specialty_option_dicts(self) -> list[dict]:
+        """Copia mutable de las opciones para guardar en la sesión."""
+        return [{"index": i, "id": id_, "label": label} for i, id_, label in self.specialty_options]
+
+    def providers_for(self, provider_ids=None, limit: int | None = None) -> list[ProviderInfo]:
+        """Doctores en orden, opcionalmente solo los de `provider_ids`."""
+        providers = self.providers
+        if provider_ids is not None:
+            wanted = set(provider_ids)
+            providers = [p for p in providers if p.id in wanted]
+        return list(providers[:limit] if limit else providers)
+
+
+def build_config(clinic: ClinicSnapshot, providers, appt_types, version: int = 0) -> ClinicConfig:
+    provider_infos = tuple(ProviderInfo(id=p.id, name=p.name) for p in providers)
+    type_infos = tuple(
+        AppointmentTypeInfo(
+            id=t.id,
+            name=getattr(t, "name", None),
+            code=getattr(t, "code", None),
+            duration_minutes=int(t.duration_minutes),
+        )
+        for t in appt_types
+    )
+
+    menu, options = build_specialty_menu(type_infos)
+
+    return ClinicConfig(
+        clinic=clinic,
+        version=version,
+        default_provider_id=(provider_infos[0].id if provider_infos else None) or settings.DEFAULT_PROVIDER_ID,
+        default_type_id=(type_infos[0].id if type_infos else None) or settings.DEFAULT_APPT_TYPE_ID,
+        providers=provider_infos,
+        appointment_types=type_infos,
+        specialty_menu=menu,
+        specialty_options=tuple((o["index"], o["id"], o["label"]) for o in options),
+        specialty_prompt=specialty_menu_prompt(menu, len(options)) if options else "",
+        provider_names=MappingProxyType({p.id: p.name for p in provider_infos}),
+    )
+
+
+_lock = threading.Lock()
+_configs: dict[int, tuple[ClinicConfig, float]] = {}
+_versions = defaultdict(int)
+
+
+def get_clinic_config(db: Session, clinic_id: int) -> ClinicConfig:
+    """Config de la clínica (sin queries si está en cache)."""
+    now = _time.monotonic()
+    with _lock:
+        cached = _configs.get(clinic_id)
+        if cached and now - cached[1] < CLINIC_CONFIG_TTL_SECONDS:
+            return cached[0]
+        version = _versions[clinic_id]
+
+    clinic = get_clinic(db, clinic_id)
+    if clinic is None:
+        raise ValueError(f"Clinic {clinic_id} not found")
+
+    providers = (
+        db.query(Provider)
+        .filter(Provider.clinic_id == clinic_id)
+        .order_by(asc(Provider.id))
+        .all()
+    )
+    appt_types = (
+        db.query(AppointmentType)
+        .filter(AppointmentType.clinic_id == clinic_id)
+        .order_by(asc(AppointmentType.id))
+        .all()
+    )
+    config = build_config(clinic, providers, appt_types, version=version)
+
+    with _lock:
+        if _versions[clinic_id] == version:
+            _configs[clinic_id] = (config, now)
+
+    return config
+
+
+def invalidate(clinic_id: int | None = None) -> None:
+    with _lock:
+        if clinic_id is None:
+            for cid in list(_configs):
+                _versions[cid] += 1
+            _configs.clear()
+        else:
+            _versions[clinic_id] += 1
+            _configs.pop(clinic_id, None)
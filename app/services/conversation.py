@@ -0,0 +1,625 @@
+"""
+Motor de conversación para agendar citas (voz, WhatsApp y Twilio).
+
+Cada estado de la sesión tiene un handler registrado con `@state("...")`.
+El handler recibe un `Turn` con los datos ya parseados, decide la respuesta
+y, si cambia algo, llama a `turn.goto(siguiente_estado)`. El motor escribe
+la sesión una sola vez al final del turno (sin refresh), así que agregar un
+estado o un canal nuevo no suma escrituras.
+
+Cada handler se cronometra y el tiempo se entrega a los hooks registrados
+con `add_timing_hook`; por defecto va a app.services.metrics como
+"conversation.<ESTADO>_ms".
+"""
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.services import metrics, slot_holds
+from app.services.availability import get_next_slots_many
+from app.services.clinic_config import ClinicConfig, build_provider_menu, get_clinic_config
+
+FALLBACK_CLINIC_NAME = "la clínica"
+
+# Prompts fijos: se repiten idénticos en todas las conversaciones, así que su
+# audio se pre-calienta en el cache TTS al arrancar (ver voice.warmup_prompts).
+PROMPT_NOT_HEARD = "No te escuché bien 😅 ¿me repites?"
+PROMPT_BAD_DATE = "No entendí la fecha 😅. Repite nuevamente."
+PROMPT_CONFIRM_KEYS = "Para confirmar tu cita, presiona 1. Para cancelar, presiona 2."
+PROMPT_ASK_OTHER_DATE = "De acuerdo. ¿Qué fecha prefieres? (Ej: mañana, lunes, 2026-03-18)"
+FIXED_PROMPTS = (PROMPT_NOT_HEARD, PROMPT_BAD_DATE, PROMPT_CONFIRM_KEYS, PROMPT_ASK_OTHER_DATE)
+
+WEEKDAYS_ES = {
+    "lunes": 0,
+    "martes": 1,
+    "miercoles": 2,
+    "miércoles": 2,
+    "jueves": 3,
+    "viernes": 4,
+    "sabado": 5,
+    "sábado": 5,
+    "domingo": 6,
+}
+MONTH_NUMBERS_ES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+MONTHS_ES = {
+    1: "enero", 2: "febrero", 3: "marzo", 4: "abril", 5: "mayo", 6: "junio",
+    7: "julio", 8: "agosto", 9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre",
+}
+WEEKDAYS_NAME_ES = {
+    0: "lunes", 1: "martes", 2: "miércoles", 3: "jueves", 4: "viernes", 5: "sábado", 6: "domingo",
+}
+WORDS_TO_NUM = {
+    "uno": 1, "una": 1, "primero": 1, "primera": 1,
+    "dos": 2, "segundo": 2, "segunda": 2,
+    "tres": 3, "tercero": 3, "tercera": 3,
+    "cuatro": 4, "cuarto": 4, "cuarta": 4,
+    "cinco": 5, "quinto": 5, "quinta": 5,
+}
+YES_WORDS = ("si", "sí", "s", "claro", "ok", "okay", "acepto", "confirmo", "de acuerdo", "dale", "afirmativo")
+NO_WORDS = ("no", "n", "cancelar", "cancela", "negativo")
+
+_RE_NON_ALNUM = re.compile(r"[^a-z0-9\s]")
+_RE_SPACES = re.compile(r"\s+")
+_RE_NON_DIGIT = re.compile(r"\D")
+_RE_YYYYMMDD = re.compile(r"\d{8}")
+_RE_YMD = re.compile(r"(\d{4})\D+(\d{1,2})\D+(\d{1,2})")
+_RE_DMY = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+_RE_DAY_MONTH_YEAR = re.compile(
+    r"\b(\d{1,2})\s*(?:de\s+)?"
+    r"(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre)"
+    r"\s*(?:de\s+)?(\d{4})\b"
+)
+_RE_NUMBER = re.compile(r"\b(\d+)\b")
+_RE_SLOT_NUMBER = re.compile(r"\b([1-5])\b")
+
+
+def clinic_display_name(clinic) -> str:
+    return getattr(clinic, "name", None) or FALLBACK_CLINIC_NAME
+
+
+def clinic_display_address(clinic) -> str:
+    return (getattr(clinic, "address", None) or "").strip()
+
+
+def welcome_prompt(clinic) -> str:
+    return f"Hola 👋 Bienvenido a {clinic_display_name(clinic)}. ¿Cuál es tu nombre completo?"
+
+
+def normalize_es(text: str) -> str:
+    text = (text or "").strip().lower()
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    text = _RE_NON_ALNUM.sub("", text)
+    text = _RE_SPACES.sub(" ", text).strip()
+    return text
+
+
+def parse_date_es(text: str, now: datetime) -> str | None:
+    raw = (text or "").strip()
+    if not raw:
+        return None
+
+    t = raw.strip().lower()
+    norm = normalize_es(raw)
+
+    if _RE_YYYYMMDD.fullmatch(t):
+        try:
+            dt = datetime.strptime(t, "%Y%m%d").date()
+            return dt.isoformat()
+        except ValueError:
+            return None
+
+    if norm == "hoy":
+        return now.date().isoformat()
+    if norm in ("manana", "mañana"):
+        return (now.date() + timedelta(days=1)).isoformat()
+
+    if norm in WEEKDAYS_ES:
+        target = WEEKDAYS_ES[norm]
+        delta = (target - now.weekday()) % 7
+        delta = 7 if delta == 0 else delta
+        return (now.date() + timedelta(days=delta)).isoformat()
+
+    m = _RE_YMD.search(t)
+    if m:
+        y = int(m.group(1))
+        mo = int(m.group(2))
+        d = int(m.group(3))
+        try:
+            return datetime(y, mo, d).date().isoformat()
+        except Exception:
+            return None
+
+    m = _RE_DMY.search(t)
+    if m:
+        d = int(m.group(1))
+        mo = int(m.group(2))
+        y = int(m.group(3))
+        try:
+            return datetime(y, mo, d).date().isoformat()
+        except Exception:
+            return None
+
+    m = _RE_DAY_MONTH_YEAR.search(norm)
+    if m:
+        d = int(m.group(1))
+        month_name = m.group(2)
+        y = int(m.group(3))
+        mo = MONTH_NUMBERS_ES.get(month_name)
+        try:
+            return datetime(y, mo, d).date().isoformat()
+        except Exception:
+            return None
+
+    return None
+
+
+def format_date_es(date_iso: str) -> str:
+    try:
+        d = datetime.fromisoformat(date_iso).date()
+    except Exception:
+        return date_iso
+    wd = WEEKDAYS_NAME_ES.get(d.weekday(), "")
+    month = MONTHS_ES.get(d.month, "")
+    return f"{wd}, {d.day} de {month} de {d.year}".strip()
+
+
+def format_time_hhmm(iso_dt: str) -> str:
+    return (iso_dt or "")[11:16]
+
+
+def looks_like_phone(s: str) -> bool:
+    digits = _RE_NON_DIGIT.sub("", s or "")
+    return len(digits) >= 8 and (len(digits) >= int(0.7 * max(1, len(s))))
+
+
+def parse_yes_no(text: str) -> bool | None:
+    norm = normalize_es(text)
+
+    if norm == "1":
+        return True
+    if norm == "2":
+        return False
+
+    for y in YES_WORDS:
+        if y in norm:
+            return True
+    for n in NO_WORDS:
+        if n in norm:
+            return False
+    return None
+
+
+def _match_option(text: str, options: list[dict]) -> dict | None:
+    """Opción elegida por número ("2") o por nombre ("cataratas")."""
+    m = _RE_NUMBER.search((text or "").strip().lower())
+    if m:
+        choice = int(m.group(1))
+        for opt in options:
+            if opt["index"] == choice:
+                return opt
+
+    norm = normalize_es(text)
+    for opt in options:
+        label_norm = normalize_es(opt["label"])
+        if label_norm in norm or norm in label_norm:
+            return opt
+    return None
+
+
+def _options_menu(options: list[dict]) -> str:
+    return "\n".join([f"{opt['index']}) {opt['label']}" for opt in options])
+
+
+# ---------------------------------------------------------------------------
+# Motor
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Turn:
+    db: Session
+    sess: object
+    session_id: int
+    clinic_id: int
+    config: ClinicConfig
+    text: str
+    data: dict
+    provider_id: int
+    type_id: int
+    next_state: str | None = None
+
+    def goto(self, state: str) -> None:
+        """Marca la sesión para guardarse al final del turno en `state` (con `data`)."""
+        self.next_state = state
+
+    def reply(self, prompt: str, done: bool = False) -> dict:
+        return {"session_id": self.session_id, "prompt": prompt, "done": done}
+
+
+StateHandler = Callable[[Turn], dict]
+TimingHook = Callable[[str, float], None]
+
+_handlers: dict[str, StateHandler] = {}
+_timing_hooks: list[TimingHook] = []
+
+
+def state(name: str):
+    """Registra el handler de un estado de la conversación."""
+    def register(fn: StateHandler) -> StateHandler:
+        _handlers[name] = fn
+        return fn
+    return register
+
+
+def add_timing_hook(hook: TimingHook) -> None:
+    """`hook(estado, ms)` se llama después de cada handler."""
+    _timing_hooks.append(hook)
+
+
+def remove_timing_hook(hook: TimingHook) -> None:
+    if hook in _timing_hooks:
+        _timing_hooks.remove(hook)
+
+
+def _metrics_hook(state_name: str, elapsed_ms: float) -> None:
+    metrics.observe_ms(f"conversation.{state_name}_ms", elapsed_ms)
+
+
+add_timing_hook(_metrics_hook)
+
+
+def handle_message(
+    db,
+    clinic_id,
+    session_id,
+    text,
+    provider_id: int | None = None,
+    type_id: int | None = None,
+    config: ClinicConfig | None = None,
+):
+    """
+    Un turno de conversación. `config` es el snapshot de la clínica; si el
+    llamador no lo trae se toma del cache (sin queries en el caso normal).
+    """
+    if config is None:
+        config = get_clinic_config(db, clinic_id)
+
+    sess = crud.get_voice_session(db, session_id, clinic_id=clinic_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+
+    text = (text or "").strip()
+    if not text:
+        return {
+            "session_id": session_id,
+            "prompt": PROMPT_NOT_HEARD,
+            "done": False,
+        }
+
+    turn = Turn(
+        db=db,
+        sess=sess,
+        session_id=sess.id,
+        clinic_id=clinic_id,
+        config=config,
+        text=text,
+        data=crud.session_data(sess, config),
+        provider_id=provider_id if provider_id is not None else config.default_provider_id,
+        type_id=type_id if type_id is not None else config.default_type_id,
+    )
+
+    current = sess.state
+    handler = _handlers.get(current, _unknown_state)
+
+    started = time.perf_counter()
+    try:
+        result = handler(turn)
+    finally:
+        elapsed_ms = metrics.since_ms(started)
+        for hook in _timing_hooks:
+            hook(current, elapsed_ms)
+
+    # única escritura del turno
+    if turn.next_state is not None:
+        crud.update_voice_session(db, sess, turn.next_state, turn.data, refresh=False, config=config)
+
+    return result
+
+
+def _unknown_state(turn: Turn) -> dict:
+    return turn.reply("No entendí 😅 ¿me repites por favor?")
+
+
+# ---------------------------------------------------------------------------
+# Helpers de agenda
+# ---------------------------------------------------------------------------
+
+def hold_chosen_slot(turn: Turn, provider_ids) -> None:
+    """Aparta el horario elegido para esta sesión en la agenda de `provider_ids`."""
+    chosen = turn.data.get("chosen_slot") or {}
+    if not chosen.get("start") or not chosen.get("end"):
+        return
+    start = datetime.fromisoformat(chosen["start"])
+    end = datetime.fromisoformat(chosen["end"])
+    slot_holds.hold(turn.session_id, turn.clinic_id, [(int(pid), start, end) for pid in provider_ids])
+
+
+def offer_slots_for_date(turn: Turn, type_id: int, intro: str = "") -> dict:
+    """Busca horarios libres para data["date"], los guarda en la sesión y pasa a ASK_SLOT."""
+    data = turn.data
+    date_start = datetime.fromisoformat(data["date"] + "T00:00:00")
+    date_end = date_start + timedelta(days=1)
+
+    # Si ya eligió doctor (p. ej. volvió desde CONFIRM) buscamos solo en su
+    # agenda; si no, en la de todos los doctores a la vez.
+    provider_ids = [int(data["doctor"])] if data.get("doctor") else None
+
+    by_provider = get_next_slots_many(
+        turn.db,
+        clinic_id=turn.clinic_id,
+        type_id=type_id,
+        from_dt=date_start,
+        provider_ids=provider_ids,
+        days_ahead=0,
+        limit=200,
+        hold_owner=turn.session_id,
+    )
+
+    # start -> (end, [doctores libres en ese horario])
+    merged = {}
+    for r in by_provider:
+        for s0, s1 in r["slots"]:
+            if date_start <= s0 < date_end:
+                merged.setdefault(s0, (s1, []))[1].append(r["provider_id"])
+
+    if not merged:
+        turn.goto("INFO_GENERAL")
+        return turn.reply(f"{intro}Ese día no hay disponibilidad 😬 ¿Qué otra fecha te sirve?")
+
+    options = sorted(merged.items())[:5]
+    data["slot_options"] = [
+        {"start": s0.isoformat(), "end": s1.isoformat(), "provider_ids": pids}
+        for s0, (s1, pids) in options
+    ]
+    # apartamos cada horario ofrecido (con el primer doctor libre) mientras decide
+    slot_holds.hold(turn.session_id, turn.clinic_id, [(pids[0], s0, s1) for s0, (s1, pids) in options])
+    turn.goto("ASK_SLOT")
+
+    opciones_txt = "\n".join([f"{i+1}) {opt['start'][11:16]}" for i, opt in enumerate(data["slot_options"])])
+    return turn.reply(
+        f"{intro}Estos son los horarios disponibles para {format_date_es(data['date'])}:\n"
+        f"{opciones_txt}\nElige el número del 1 al {len(data['slot_options'])}."
+    )
+
+
+def _confirm_summary(data: dict) -> str:
+    hora = format_time_hhmm(data.get("chosen_slot", {}).get("start", ""))
+    fecha_humana = format_date_es(data.get("date", ""))
+    return (
+        "Voy a agendar tu cita con estos datos:\n"
+        f"Paciente: {data.get('full_name', '')}\n"
+        f"Teléfono: {data.get('phone', '')}\n"
+        f"Especialidad: {data.get('specialty', '')}\n"
+        f"Doctor: {data.get('doctor_name', '')}\n"
+        f"Fecha: {fecha_humana}\n"
+        f"Hora: {hora}\n\n"
+        f"{PROMPT_CONFIRM_KEYS}"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Estados
+# ---------------------------------------------------------------------------
+
+@state("ASK_NAME")
+def ask_name(turn: Turn) -> dict:
+    if len(turn.text.split()) < 2 or looks_like_phone(turn.text):
+        return turn.reply("Para registrarte correctamente necesito tus *nombres y apellidos* 😊")
+
+    turn.data["full_name"] = turn.text
+    turn.goto("ASK_PHONE")
+    return turn.reply(f"Gracias {turn.data['full_name']} 😊 Ahora indícame tu número telefónico por favor.")
+
+
+@state("ASK_PHONE")
+def ask_phone(turn: Turn) -> dict:
+    turn.data["phone"] = turn.text
+
+    if not turn.config.specialty_options:
+        turn.goto("INFO_GENERAL")
+        return turn.reply("Perfecto ✅ Ahora sí, agendemos tu cita.\n¿Qué fecha deseas? (Ejemplo: 18 marzo 2026)")
+
+    turn.data["specialty_options"] = turn.config.specialty_option_dicts()
+    turn.goto("ASK_SPECIALTY")
+    return turn.reply(turn.config.specialty_prompt)
+
+
+@state("ASK_SPECIALTY")
+def ask_specialty(turn: Turn) -> dict:
+    options = turn.data.get("specialty_options") or turn.config.specialty_option_dicts()
+
+    if not options:
+        turn.goto("INFO_GENERAL")
+        return turn.reply("No encontré especialidades configuradas. Indícame la fecha deseada.")
+
+    selected = _match_option(turn.text, options)
+    if selected is None:
+        return turn.reply(f"No entendí 😅 Elige una opción válida:\n{_options_menu(options)}")
+
+    turn.data["specialty"] = selected["label"]
+    turn.data["type_id"] = selected["id"]
+    turn.goto("INFO_GENERAL")
+    return turn.reply(
+        f"Perfecto ✅ Especialidad: {turn.data['specialty']}\n\n"
+        "Ahora sí, agendemos tu cita.\n"
+        "¿Para qué fecha deseas la cita? (Ejemplo: 18 marzo 2026)"
+    )
+
+
+@state("INFO_GENERAL")
+def info_general(turn: Turn) -> dict:
+    date_iso = parse_date_es(turn.text, now=datetime.now())
+    if not date_iso:
+        return turn.reply(PROMPT_BAD_DATE)
+
+    turn.data["date"] = date_iso
+    return offer_slots_for_date(turn, int(turn.data.get("type_id") or turn.type_id))
+
+
+@state("ASK_SLOT")
+def ask_slot(turn: Turn) -> dict:
+    data = turn.data
+    raw = turn.text.strip().lower()
+
+    m = _RE_SLOT_NUMBER.search(raw)
+    if m:
+        idx = int(m.group(1)) - 1
+    else:
+        n = WORDS_TO_NUM.get(raw)
+        if n is None:
+            return turn.reply("No entendí 😅 Elige un número de la lista (por ejemplo: '3').")
+        idx = n - 1
+
+    try:
+        chosen = data.get("slot_options", [])[idx]
+    except Exception:
+        return turn.reply("Elige un número válido de la lista porfa 😊")
+
+    data["chosen_slot"] = chosen
+
+    # solo ofrecemos doctores que están libres en el horario elegido; la lista
+    # es del turno anterior, así que se descartan los que otra sesión apartó
+    provider_ids = chosen.get("provider_ids") or None
+    if provider_ids:
+        start = datetime.fromisoformat(chosen["start"])
+        end = datetime.fromisoformat(chosen["end"])
+        provider_ids = [
+            pid for pid in provider_ids
+            if not slot_holds.is_held(turn.clinic_id, int(pid), start, end, exclude_owner=turn.session_id)
+        ]
+        if not provider_ids:
+            data.pop("chosen_slot", None)
+            return offer_slots_for_date(
+                turn, int(data.get("type_id") or turn.type_id),
+                intro="😬 Ese horario acaba de ser apartado por otra persona.\n",
+            )
+    providers = turn.config.providers_for(provider_ids, limit=5)
+    if not providers:
+        data["doctor"] = int(turn.provider_id)
+        data["doctor_name"] = "Doctor asignado"
+        hold_chosen_slot(turn, [data["doctor"]])
+        turn.goto("CONFIRM")
+        return turn.reply(_confirm_summary(data))
+
+    menu, provider_options = build_provider_menu(providers)
+    data["doctor_options"] = provider_options
+    hold_chosen_slot(turn, [p.id for p in providers])
+    turn.goto("ASK_DOCTOR")
+    return turn.reply(
+        "Perfecto ✅ Ahora elige el doctor:\n"
+        f"{menu}\n"
+        f"Responde con el número del 1 al {len(provider_options)}. (También puedes decir el nombre)"
+    )
+
+
+@state("ASK_DOCTOR")
+def ask_doctor(turn: Turn) -> dict:
+    data = turn.data
+    options = data.get("doctor_options") or []
+    if not options:
+        _, options = build_provider_menu(turn.config.providers_for(limit=5))
+
+    selected = _match_option(turn.text, options)
+    if selected is None:
+        return turn.reply(f"No entendí 😅 Elige una opción válida para el doctor:\n{_options_menu(options)}")
+
+    data["doctor"] = int(selected["id"])
+    data["doctor_name"] = selected["label"]
+    hold_chosen_slot(turn, [data["doctor"]])
+    turn.goto("CONFIRM")
+    return turn.reply(_confirm_summary(data))
+
+
+@state("CONFIRM")
+def confirm(turn: Turn) -> dict:
+    data = turn.data
+    yn = parse_yes_no(turn.text)
+
+    if yn is None:
+        return turn.reply(PROMPT_CONFIRM_KEYS)
+
+    if yn is False:
+        slot_holds.release(turn.session_id)
+        turn.goto("INFO_GENERAL")
+        return turn.reply(PROMPT_ASK_OTHER_DATE)
+
+    start_dt = datetime.fromisoformat(data["chosen_slot"]["start"])
+    end_dt = datetime.fromisoformat(data["chosen_slot"].get("end") or data["chosen_slot"]["start"])
+
+    patient = crud.get_or_create_patient(
+        turn.db,
+        clinic_id=turn.clinic_id,
+        full_name=data["full_name"],
+        phone=data["phone"],
+    )
+
+    prov_id = int(data.get("doctor") or turn.provider_id)
+    appt_type_id = int(data.get("type_id") or turn.type_id)
+
+    try:
+        # un hold vigente de otra sesión gana: ella vio el horario primero
+        if slot_holds.is_held(turn.clinic_id, prov_id, start_dt, end_dt, exclude_owner=turn.session_id):
+            raise crud.SlotConflictError(prov_id, start_dt, end_dt)
+
+        crud.create_appointment(
+            db=turn.db,
+            clinic_id=turn.clinic_id,
+            patient_id=patient.id,
+            provider_id=prov_id,
+            type_id=appt_type_id,
+            start_time=start_dt,
+        )
+    except crud.SlotConflictError:
+        # Otro canal tomó el horario mientras confirmaba: volvemos a ofrecer
+        data.pop("chosen_slot", None)
+        data.pop("doctor", None)
+        data.pop("doctor_name", None)
+        return offer_slots_for_date(
+            turn, appt_type_id,
+            intro="😬 Ese horario acaba de ser reservado por otra persona.\n",
+        )
+
+    turn.goto("END")
+
+    clinic = turn.config.clinic
+    clinic_name = clinic_display_name(clinic)
+    clinic_address = clinic_display_address(clinic)
+    location_text = f" Te esperamos en {clinic_name}." if clinic_name else ""
+    if clinic_address:
+        location_text += f" {clinic_address}."
+
+    return turn.reply(
+        "✅ Listo. "
+        f"Tu cita queda agendada para {format_date_es(data.get('date', ''))}, "
+        f"a las {format_time_hhmm(data.get('chosen_slot', {}).get('start', ''))}. "
+        f"En la especialidad de {data.get('specialty', '')}, "
+        f"con el doctor {data.get('doctor_name', '')}."
+        f"{location_text} "
+        "Que tengas un excelente día 🙌",
+        done=True,
+    )
+
+
+@state("END")
+def end(turn: Turn) -> dict:
+    return turn.reply("La sesión ya terminó. Si deseas iniciar otra, usa /voice/start", done=True)
@@ -0,0 +1,222 @@
+"""
+Speech-to-text local en CPU con batching (faster-whisper).
+
+Las transcripciones que llegan casi a la vez desde distintas sesiones se
+agrupan en una sola pasada del modelo: el primer clip espera como mucho
+LOCAL_STT_MAX_WAIT_MS a que se sumen otros, hasta LOCAL_STT_MAX_BATCH.
+La inferencia corre en un hilo propio, así que el event loop nunca se
+bloquea y cualquier loop (uvicorn, TestClient, benchmarks) puede usarlo.
+
+Dependencia opcional: `pip install -r requirements-local-stt.txt` (versión
+fija: el batch usa internals de faster-whisper, no su API pública). Solo se
+importa al cargar el modelo (primer clip), así que con STT_BACKEND=openai no
+hace falta. `python benchmarks/bench_stt.py --smoke` prueba un batch.
+
+Variables de entorno:
+    LOCAL_STT_MODEL         tamaño o ruta del modelo (default "small")
+    LOCAL_STT_COMPUTE_TYPE  cuantización de CTranslate2 (default "int8")
+    LOCAL_STT_THREADS       hilos de CPU por inferencia (default 0 = automático)
+    LOCAL_STT_BEAM_SIZE     default 1 (greedy, lo más rápido)
+    LOCAL_STT_MAX_BATCH     clips por pasada (default 8)
+    LOCAL_STT_MAX_WAIT_MS   espera máxima para armar un batch (default 50)
+"""
+import asyncio
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import BinaryIO, Callable
+
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "small")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_THREADS = int(os.getenv("LOCAL_STT_THREADS", "0"))
+LOCAL_STT_BEAM_SIZE = int(os.getenv("LOCAL_STT_BEAM_SIZE", "1"))
+LOCAL_STT_MAX_BATCH = int(os.getenv("LOCAL_STT_MAX_BATCH", "8"))
+LOCAL_STT_MAX_WAIT_MS = float(os.getenv("LOCAL_STT_MAX_WAIT_MS", "50"))
+
+SAMPLING_RATE = 16000
+# Whisper procesa ventanas de 30 s; clips más largos van por el camino normal
+MAX_BATCHED_SAMPLES = 30 * SAMPLING_RATE
+
+# versión con la que se probó el camino por batch (requirements-local-stt.txt)
+TESTED_FASTER_WHISPER = "1.2.1"
+
+_STOP = object()
+
+
+class FasterWhisperBatch:
+    """Transcribe una lista de clips (bytes) en una sola llamada al modelo."""
+
+    def __init__(self, model_name: str = LOCAL_STT_MODEL):
+        self.model_name = model_name
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            import faster_whisper
+            from faster_whisper import WhisperModel
+
+            if faster_whisper.__version__ != TESTED_FASTER_WHISPER:
+                print(
+                    f"⚠️ faster-whisper {faster_whisper.__version__} no es la versión probada "
+                    f"({TESTED_FASTER_WHISPER}); correr benchmarks/bench_stt.py --smoke"
+                )
+
+            self._model = WhisperModel(
+                self.model_name,
+                device="cpu",
+                compute_type=LOCAL_STT_COMPUTE_TYPE,
+                cpu_threads=LOCAL_STT_THREADS,
+            )
+        return self._model
+
+    def __call__(self, clips: list[bytes], language: str) -> list[str]:
+        import numpy as np
+        from faster_whisper.audio import decode_audio, pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = self._load()
+        audios = [decode_audio(io.BytesIO(clip), sampling_rate=SAMPLING_RATE) for clip in clips]
+
+        texts: list[str | None] = [None] * len(audios)
+        short = []
+        for i, audio in enumerate(audios):
+            if len(audio) > MAX_BATCHED_SAMPLES:
+                segments, _ = model.transcribe(audio, language=language, beam_size=LOCAL_STT_BEAM_SIZE)
+                texts[i] = " ".join(s.text.strip() for s in segments)
+            else:
+                short.append(i)
+
+        if short:
+            features = np.stack([
+                pad_or_trim(model.feature_extractor(audios[i])[..., :-1]) for i in short
+            ])
+            tokenizer = Tokenizer(
+                model.hf_tokenizer,
+                model.model.is_multilingual,
+                task="transcribe",
+                language=language,
+            )
+            prompt = model.get_prompt(tokenizer, previous_tokens=[], without_timestamps=True)
+            results = model.model.generate(
+                model.encode(features),
+                [list(prompt) for _ in short],
+                beam_size=LOCAL_STT_BEAM_SIZE,
+                max_length=model.max_length,
+                suppress_blank=True,
+                suppress_tokens=[-1],
+            )
+            for i, result in zip(short, results):
+                texts[i] = tokenizer.decode(result.sequences_ids[0]).strip()
+
+        return texts
+
+
+class LocalBatchedSTT:
+    """
+    Backend SpeechToText que agrupa clips concurrentes. `infer` recibe
+    (lista de bytes, idioma) y devuelve la lista de textos en el mismo orden;
+    por defecto es faster-whisper, pero se puede inyectar otro (benchmarks).
+    """
+
+    def __init__(
+        self,
+        infer: Callable[[list[bytes], str], list[str]] | None = None,
+        max_batch: int = LOCAL_STT_MAX_BATCH,
+        max_wait_ms: float = LOCAL_STT_MAX_WAIT_MS,
+    ):
+        self.infer = infer or FasterWhisperBatch()
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.batches = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        worker = self._worker
+        if worker is None or not worker.is_alive():
+            with self._lock:
+                worker = self._worker
+                if worker is None or not worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="local-stt", daemon=True)
+                    self._worker.start()
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            # el que ya se canceló (timeout del cliente) no ocupa lugar en el batch
+            if item[2].set_running_or_notify_cancel():
+                batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            if not first[2].set_running_or_notify_cancel():
+                continue
+            batch = self._collect(first)
+
+            by_language: dict[str, list] = {}
+            for item in batch:
+                by_language.setdefault(item[1], []).append(item)
+
+            for language, items in by_language.items():
+                try:
+                    texts = self.infer([clip for clip, _, _ in items], language)
+                    if len(texts) != len(items):
+                        raise RuntimeError(f"STT local devolvió {len(texts)} textos para {len(items)} clips")
+                except Exception as e:
+                    for _, _, fut in items:
+                        _resolve(fut, exception=e)
+                    continue
+                self.batches += 1
+                for (_, _, fut), text in zip(items, texts):
+                    _resolve(fut, result=text or "")
+
+    async def transcribe(self, audio: BinaryIO | bytes, filename: str, language: str = "es") -> str:
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            clip = bytes(audio)
+        else:
+            # puede ser un archivo spooleado a disco: la lectura va fuera del loop
+            clip = await asyncio.to_thread(audio.read)
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((clip, language, fut))
+        return await asyncio.wrap_future(fut)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(_STOP)
+            await asyncio.to_thread(worker.join)
+            # el centinela pudo quedar en la cola si el worker salió por _collect
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+
+def _resolve(fut: Future, result=None, exception: BaseException | None = None) -> None:
+    """Completa `fut` sin tumbar el worker si ya estaba resuelto."""
+    try:
+        if exception is not None:
+            fut.set_exception(exception)
+        else:
+            fut.set_result(result)
+    except InvalidStateError:
+        pass
@@ -0,0 +1,69 @@
+"""
+Métricas de latencia en memoria, por proceso.
+
+Cada métrica guarda contador, suma, máximo y una ventana de las últimas
+METRICS_WINDOW muestras para calcular percentiles. Se consultan en
+GET /debug/metrics.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+
+
+class _Series:
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=METRICS_WINDOW)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.recent)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(pct(0.50), 2),
+            "p95_ms": round(pct(0.95), 2),
+            "max_ms": round(self.max, 2),
+        }
+
+
+_lock = threading.Lock()
+_series: dict[str, _Series] = defaultdict(_Series)
+
+
+def observe_ms(name: str, value_ms: float) -> None:
+    with _lock:
+        _series[name].add(value_ms)
+
+
+def since_ms(started: float) -> float:
+    """Milisegundos desde `started` (un time.perf_counter())."""
+    return (time.perf_counter() - started) * 1000
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {name: s.summary() for name, s in sorted(_series.items())}
+
+
+def reset() -> None:
+    with _lock:
+        _series.clear()
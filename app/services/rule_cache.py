@@ -0,0 +1,167 @@
+"""
+Reglas de disponibilidad compiladas por clínica.
+
+Las reglas se guardan como strings "HH:MM"; aquí se convierten una sola vez
+a rangos en minutos desde medianoche, se fusionan las que se solapan y se
+indexan por doctor y día de semana. Las excepciones (feriados de la clínica,
+ausencias de un doctor) viajan en la misma estructura, así que calcular la
+disponibilidad de un día no necesita ninguna query.
+
+El resultado se cachea por clínica durante RULES_CACHE_TTL_SECONDS y se
+invalida con `invalidate()` cuando cambian reglas o excepciones.
+"""
+import os
+import threading
+import time as _time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.models import AvailabilityException, AvailabilityRule
+
+MINUTES_PER_DAY = 24 * 60
+
+RULES_CACHE_TTL_SECONDS = float(os.getenv("RULES_CACHE_TTL_SECONDS", "300"))
+
+
+def _parse_hhmm(hhmm: str) -> int:
+    hh, mm = hhmm.split(":")
+    return int(hh) * 60 + int(mm)
+
+
+def range_mask(start_min: int, end_min: int) -> int:
+    """Bitmask de los minutos [start_min, end_min) del día."""
+    start_min = max(0, start_min)
+    end_min = min(MINUTES_PER_DAY, end_min)
+    if end_min <= start_min:
+        return 0
+    return ((1 << (end_min - start_min)) - 1) << start_min
+
+
+def _merge_ranges(ranges) -> tuple[tuple[int, int], ...]:
+    merged = []
+    for r0, r1 in sorted(ranges):
+        if merged and r0 <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], r1))
+        else:
+            merged.append((r0, r1))
+    return tuple(merged)
+
+
+@dataclass(frozen=True)
+class WeekdaySchedule:
+    ranges: tuple[tuple[int, int], ...]  # rangos abiertos fusionados, en minutos
+    starts: tuple[int, ...]              # inicios de slot de todas las reglas, ordenados
+    open_bits: int
+
+
+EMPTY_WEEKDAY = WeekdaySchedule(ranges=(), starts=(), open_bits=0)
+
+
+@dataclass(frozen=True)
+class CompiledSchedule:
+    clinic_id: int
+    version: int
+    # provider_id -> day_of_week -> WeekdaySchedule
+    providers: dict = field(default_factory=dict)
+    # (provider_id | None, fecha) -> bits bloqueados ese día
+    exceptions: dict = field(default_factory=dict)
+
+    def provider_ids(self) -> tuple[int, ...]:
+        return tuple(sorted(self.providers))
+
+    def day(self, provider_id: int, day: date) -> tuple[tuple[int, ...], int]:
+        """(inicios de slot, bits abiertos) de un doctor para una fecha, ya sin excepciones."""
+        week = self.providers.get(provider_id)
+        if not week:
+            return (), 0
+        sched = week.get(day.weekday(), EMPTY_WEEKDAY)
+        blocked = self.exceptions.get((None, day), 0) | self.exceptions.get((provider_id, day), 0)
+        if not blocked:
+            return sched.starts, sched.open_bits
+        return sched.starts, sched.open_bits & ~blocked
+
+
+def compile_schedule(clinic_id: int, rules, exceptions, version: int = 0) -> CompiledSchedule:
+    ranges = defaultdict(lambda: defaultdict(list))
+    starts = defaultdict(lambda: defaultdict(set))
+
+    for rule in rules:
+        r0 = _parse_hhmm(rule.start_hhmm)
+        r1 = _parse_hhmm(rule.end_hhmm)
+        step = max(1, int(rule.slot_minutes or 30))
+        ranges[rule.provider_id][rule.day_of_week].append((r0, r1))
+        starts[rule.provider_id][rule.day_of_week].update(range(r0, r1, step))
+
+    providers = {}
+    for pid, by_dow in ranges.items():
+        week = {}
+        for dow, rs in by_dow.items():
+            merged = _merge_ranges(rs)
+            week[dow] = WeekdaySchedule(
+                ranges=merged,
+                starts=tuple(sorted(starts[pid][dow])),
+                # rangos ya fusionados: disjuntos, sumar = OR
+                open_bits=sum(range_mask(r0, r1) for r0, r1 in merged),
+            )
+        providers[pid] = week
+
+    blocked = defaultdict(int)
+    for exc in exceptions:
+        if exc.start_hhmm and exc.end_hhmm:
+            bits = range_mask(_parse_hhmm(exc.start_hhmm), _parse_hhmm(exc.end_hhmm))
+        else:
+            bits = range_mask(0, MINUTES_PER_DAY)
+        blocked[(exc.provider_id, exc.date)] |= bits
+
+    return CompiledSchedule(
+        clinic_id=clinic_id,
+        version=version,
+        providers=providers,
+        exceptions=dict(blocked),
+    )
+
+
+_lock = threading.Lock()
+_compiled: dict[int, tuple[CompiledSchedule, float]] = {}
+_versions = defaultdict(int)
+
+
+def get_schedule(db: Session, clinic_id: int) -> CompiledSchedule:
+    """Horario compilado de la clínica (2 queries solo cuando no está en cache)."""
+    now = _time.monotonic()
+    with _lock:
+        cached = _compiled.get(clinic_id)
+        if cached and now - cached[1] < RULES_CACHE_TTL_SECONDS:
+            return cached[0]
+        version = _versions[clinic_id]
+
+    rules = db.query(AvailabilityRule).filter(AvailabilityRule.clinic_id == clinic_id).all()
+    exceptions = (
+        db.query(AvailabilityException)
+        .filter(
+            AvailabilityException.clinic_id == clinic_id,
+            AvailabilityException.date >= date.today() - timedelta(days=1),
+        )
+        .all()
+    )
+    schedule = compile_schedule(clinic_id, rules, exceptions, version=version)
+
+    with _lock:
+        if _versions[clinic_id] == version:
+            _compiled[clinic_id] = (schedule, now)
+
+    return schedule
+
+
+def invalidate(clinic_id: int | None = None) -> None:
+    with _lock:
+        if clinic_id is None:
+            for cid in list(_compiled):
+                _versions[cid] += 1
+            _compiled.clear()
+        else:
+            _versions[clinic_id] += 1
+            _compiled.pop(clinic_id, None)
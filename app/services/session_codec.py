@@ -0,0 +1,366 @@
+"""
+Codec compacto para VoiceSession.data_json.
+
+El JSON original guardaba las listas de opciones completas (etiquetas de
+especialidades y doctores, fechas ISO) y se re-serializaba entero en cada
+turno. El formato binario guarda solo lo que no se puede reconstruir:
+
+    - opciones de especialidad / doctor: solo los ids; las etiquetas salen
+      del ClinicConfig al decodificar (mismo orden que el menú mostrado)
+    - horarios: minutos desde epoch (inicio), duración y doctores libres
+    - fecha: días desde epoch
+    - claves desconocidas: se guardan en un bloque JSON aparte
+
+Formato (versión 1), guardado en la misma columna de texto:
+
+    "~" + base64( u8 versión | campo* )     campo = u8 tag + valor
+    texto   u16 largo + utf-8               entero  u32
+    ids     u8 cantidad + u32 * n           horario u32 inicio, u16 duración,
+                                                    u8 (n+1 | 0 sin lista) + u32 * n
+
+Las filas viejas (JSON, empiezan con "{") se siguen leyendo igual. Si algo
+no entra en el esquema compacto (p. ej. un horario con segundos) se guarda
+en JSON, así que encode() nunca pierde datos.
+
+Velocidad: leer el binario en Python es algo más lento que json.loads, así
+que encode() deja el resultado en un cache (DECODE_CACHE_SIZE entradas) y el
+decode() del turno siguiente, en el mismo proceso, es una copia del dict. El
+resto (otro worker, reinicio) paga el decode completo. Los valores anidados
+de lo que devuelve decode() se comparten con el cache: se reemplazan, no se
+modifican en el lugar (así los usa conversation.py).
+
+Auditoría: las sesiones que llegan a END se guardan en JSON plano (ver
+crud.update_voice_session). Para leer a mano una fila compacta:
+`session_codec.decode(row.data_json, clinic_config.get_config(...))`; sin
+config los menús salen con etiquetas genéricas ("Doctor 3").
+"""
+import binascii
+import json
+import struct
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+PREFIX = "~"
+VERSION = 1
+DECODE_CACHE_SIZE = 1024
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_DATE = _EPOCH.date()
+
+# tags
+T_EXTRA = 0            # JSON con las claves que no tienen tag
+T_FULL_NAME = 1
+T_PHONE = 2
+T_SPECIALTY = 3
+T_TYPE_ID = 4
+T_DATE = 5
+T_DOCTOR = 6
+T_DOCTOR_NAME = 7
+T_SPECIALTY_OPTIONS = 8
+T_DOCTOR_OPTIONS = 9
+T_SLOT_OPTIONS = 10
+T_CHOSEN_SLOT = 11
+
+_STR_FIELDS = {"full_name": T_FULL_NAME, "phone": T_PHONE, "specialty": T_SPECIALTY, "doctor_name": T_DOCTOR_NAME}
+_INT_FIELDS = {"type_id": T_TYPE_ID, "doctor": T_DOCTOR}
+_STR_TAGS = {tag: key for key, tag in _STR_FIELDS.items()}
+_INT_TAGS = {tag: key for key, tag in _INT_FIELDS.items()}
+
+_TAG_U32 = struct.Struct("<BI")
+_TAG_U16 = struct.Struct("<BH")
+_TAG_U8 = struct.Struct("<BB")
+_U32 = struct.Struct("<I")
+_U16 = struct.Struct("<H")
+_SLOT = struct.Struct("<IHB")
+
+
+class _Unsupported(Exception):
+    """El valor no entra en el formato compacto: se guarda en JSON."""
+
+
+# Los mismos horarios y fechas se repiten turno a turno y entre sesiones.
+@lru_cache(maxsize=4096)
+def _minutes(iso: str) -> int:
+    dt = datetime.fromisoformat(iso)
+    if dt.tzinfo is not None or dt.second or dt.microsecond or dt < _EPOCH or dt.isoformat() != iso:
+        raise _Unsupported(iso)
+    return (dt - _EPOCH) // timedelta(minutes=1)
+
+
+@lru_cache(maxsize=4096)
+def _iso(minutes: int) -> str:
+    return (_EPOCH + timedelta(minutes=minutes)).isoformat()
+
+
+@lru_cache(maxsize=1024)
+def _days(iso: str) -> int:
+    d = date.fromisoformat(iso)
+    if d < _EPOCH_DATE or d.isoformat() != iso:
+        raise _Unsupported(iso)
+    return (d - _EPOCH_DATE).days
+
+
+@lru_cache(maxsize=1024)
+def _date_iso(days: int) -> str:
+    return (_EPOCH_DATE + timedelta(days=days)).isoformat()
+
+
+@lru_cache(maxsize=256)
+def _ids_format(n: int) -> str:
+    return f"<{n}I"
+
+
+def _pack_ids(ids) -> bytes:
+    return struct.pack(f"<{len(ids)}I", *ids)
+
+
+def _put_slot(out: bytearray, slot: dict) -> None:
+    if len(slot) > 3 or set(slot) - {"start", "end", "provider_ids"}:
+        raise _Unsupported(slot)
+    start = _minutes(slot["start"])
+    duration = _minutes(slot["end"]) - start
+    provider_ids = slot.get("provider_ids")
+    if provider_ids is None:
+        out += _SLOT.pack(start, duration, 0)
+    else:
+        # 0 = sin lista, n+1 = lista con n ids
+        out += _SLOT.pack(start, duration, len(provider_ids) + 1)
+        out += _pack_ids(provider_ids)
+
+
+def _get_slot(buf: bytes, pos: int) -> tuple[dict, int]:
+    start, duration, count = _SLOT.unpack_from(buf, pos)
+    pos += _SLOT.size
+    slot = {"start": _iso(start), "end": _iso(start + duration)}
+    if count:
+        n = count - 1
+        slot["provider_ids"] = list(struct.unpack_from(_ids_format(n), buf, pos))
+        pos += 4 * n
+    return slot, pos
+
+
+def _option_ids(options, labels: dict | None) -> list[int]:
+    """Ids de un menú, solo si sus etiquetas se pueden reconstruir tal cual."""
+    if labels is None:
+        raise _Unsupported(options)
+    ids = []
+    for i, opt in enumerate(options, start=1):
+        if len(opt) != 3 or opt["index"] != i or labels.get(opt["id"]) != opt["label"]:
+            raise _Unsupported(opt)
+        ids.append(opt["id"])
+    return ids
+
+
+# id(config) -> (config, etiquetas de especialidad, etiquetas de doctor)
+_labels_cache: dict = {}
+
+
+def _menu_labels(config) -> tuple[dict | None, dict | None]:
+    """(id -> etiqueta de especialidad, id -> etiqueta de doctor) según el config."""
+    if config is None:
+        return None, None
+    cached = _labels_cache.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1], cached[2]
+
+    from app.services.clinic_config import provider_label
+
+    specialties = {id_: label for _, id_, label in config.specialty_options}
+    providers = {p.id: provider_label(p, i) for i, p in enumerate(config.providers, start=1)}
+    if len(_labels_cache) > 256:
+        _labels_cache.clear()
+    _labels_cache[id(config)] = (config, specialties, providers)
+    return specialties, providers
+
+
+def _rebuild_options(ids, labels: dict | None, fallback: str) -> list[dict]:
+    labels = labels or {}
+    return [
+        {"index": i, "id": pid, "label": labels.get(pid) or f"{fallback} {pid}"}
+        for i, pid in enumerate(ids, start=1)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+
+_decoded_lock = threading.Lock()
+# texto compacto -> (config, dict decodificado)
+_decoded: "OrderedDict[str, tuple[object, dict]]" = OrderedDict()
+
+
+def _remember(raw: str, config, data: dict) -> None:
+    with _decoded_lock:
+        _decoded[raw] = (config, data)
+        _decoded.move_to_end(raw)
+        while len(_decoded) > DECODE_CACHE_SIZE:
+            _decoded.popitem(last=False)
+
+
+def _recall(raw: str, config) -> dict | None:
+    with _decoded_lock:
+        item = _decoded.get(raw)
+        if item is None or item[0] is not config:
+            return None
+        _decoded.move_to_end(raw)
+        return dict(item[1])
+
+
+def encode(data: dict, config=None) -> str:
+    """
+    Serializa los datos de la sesión. `config` (ClinicConfig) permite guardar
+    los menús como ids; sin él se guardan con etiquetas, en el bloque JSON.
+    """
+    try:
+        raw = PREFIX + binascii.b2a_base64(_encode_binary(data, config), newline=False).decode("ascii")
+    except (_Unsupported, struct.error, ValueError, TypeError, KeyError, AttributeError):
+        return json.dumps(data, ensure_ascii=False)
+    # las etiquetas de los menús ya coinciden con el config (_option_ids)
+    _remember(raw, config, dict(data))
+    return raw
+
+
+def _encode_binary(data: dict, config) -> bytes:
+    specialty_labels, provider_labels = _menu_labels(config)
+    out = bytearray((VERSION,))
+    extra = None
+
+    for key, value in data.items():
+        tag = _STR_FIELDS.get(key)
+        if tag is not None and value.__class__ is str:
+            raw = value.encode("utf-8")
+            out += _TAG_U16.pack(tag, len(raw))
+            out += raw
+            continue
+        tag = _INT_FIELDS.get(key)
+        if tag is not None and value.__class__ is int and value >= 0:
+            out += _TAG_U32.pack(tag, value)
+            continue
+
+        try:
+            if key == "date":
+                out += _TAG_U32.pack(T_DATE, _days(value))
+            elif key == "slot_options":
+                out += _TAG_U8.pack(T_SLOT_OPTIONS, len(value))
+                for slot in value:
+                    _put_slot(out, slot)
+            elif key == "chosen_slot":
+                out.append(T_CHOSEN_SLOT)
+                _put_slot(out, value)
+            elif key == "specialty_options":
+                ids = _option_ids(value, specialty_labels)
+                out += _TAG_U8.pack(T_SPECIALTY_OPTIONS, len(ids)) + _pack_ids(ids)
+            elif key == "doctor_options":
+                ids = _option_ids(value, provider_labels)
+                out += _TAG_U8.pack(T_DOCTOR_OPTIONS, len(ids)) + _pack_ids(ids)
+            else:
+                raise _Unsupported(key)
+        except (_Unsupported, struct.error, ValueError, TypeError, KeyError, AttributeError):
+            # la clave va tal cual al bloque JSON; un campo a medio escribir no
+            # puede quedar en el buffer, así que el resto vuelve a JSON completo
+            if key in ("slot_options", "chosen_slot"):
+                raise _Unsupported(key)
+            extra = extra or {}
+            extra[key] = value
+
+    if extra:
+        raw = json.dumps(extra, ensure_ascii=False).encode("utf-8")
+        out += _TAG_U16.pack(T_EXTRA, len(raw))
+        out += raw
+    return bytes(out)
+
+
+def decode(raw: str | None, config=None) -> dict:
+    """Lee data_json en cualquiera de los dos formatos (JSON viejo o compacto)."""
+    if not raw:
+        return {}
+    if raw[0] != PREFIX:
+        return json.loads(raw)
+
+    data = _recall(raw, config)
+    if data is not None:
+        return data
+    data = _decode_binary(raw, config)
+    _remember(raw, config, data)
+    return dict(data)
+
+
+def _decode_binary(raw: str, config) -> dict:
+    buf = binascii.a2b_base64(raw[1:])
+    if not buf or buf[0] != VERSION:
+        raise ValueError(f"Versión de sesión desconocida: {buf[:1]!r}")
+
+    # todo en variables locales: este bucle corre en cada turno
+    u16 = _U16.unpack_from
+    u32 = _U32.unpack_from
+    slot_head = _SLOT.unpack_from
+    slot_size = _SLOT.size
+    unpack_ids = struct.unpack_from
+    iso = _iso
+    str_tags = _STR_TAGS
+    int_tags = _INT_TAGS
+
+    data = {}
+    pos = 1
+    end = len(buf)
+    while pos < end:
+        tag = buf[pos]
+        pos += 1
+        key = str_tags.get(tag)
+        if key is not None:
+            n = buf[pos] | buf[pos + 1] << 8
+            pos += 2
+            data[key] = buf[pos:pos + n].decode("utf-8")
+            pos += n
+            continue
+        key = int_tags.get(tag)
+        if key is not None:
+            (data[key],) = u32(buf, pos)
+            pos += 4
+            continue
+
+        if tag == T_SLOT_OPTIONS or tag == T_CHOSEN_SLOT:
+            if tag == T_SLOT_OPTIONS:
+                count = buf[pos]
+                pos += 1
+            else:
+                count = 1
+            slots = []
+            for _ in range(count):
+                start, duration, n = slot_head(buf, pos)
+                pos += slot_size
+                slot = {"start": iso(start), "end": iso(start + duration)}
+                if n:
+                    n -= 1
+                    slot["provider_ids"] = list(unpack_ids(_ids_format(n), buf, pos))
+                    pos += 4 * n
+                slots.append(slot)
+            if tag == T_SLOT_OPTIONS:
+                data["slot_options"] = slots
+            else:
+                data["chosen_slot"] = slots[0]
+        elif tag == T_DATE:
+            (days,) = u32(buf, pos)
+            pos += 4
+            data["date"] = _date_iso(days)
+        elif tag == T_SPECIALTY_OPTIONS or tag == T_DOCTOR_OPTIONS:
+            count = buf[pos]
+            pos += 1
+            ids = unpack_ids(_ids_format(count), buf, pos)
+            pos += 4 * count
+            specialty_labels, provider_labels = _menu_labels(config)
+            if tag == T_SPECIALTY_OPTIONS:
+                data["specialty_options"] = _rebuild_options(ids, specialty_labels, "Especialidad")
+            else:
+                data["doctor_options"] = _rebuild_options(ids, provider_labels, "Doctor")
+        elif tag == T_EXTRA:
+            (n,) = u16(buf, pos)
+            pos += 2
+            data.update(json.loads(buf[pos:pos + n]))
+            pos += n
+        else:
+            raise ValueError(f"Campo de sesión desconocido: {tag}")
+    return data
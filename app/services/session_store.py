@@ -0,0 +1,314 @@
+"""
+Store de sesiones de conversación (write-behind).
+
+Mientras una llamada o chat está activo, el estado de la sesión (estado +
+data_json) vive en un store rápido y no en SQL: cada turno lee y escribe ahí
+y la base no recibe ningún UPDATE. La fila de voice_sessions se crea al
+iniciar (da el id y queda para auditoría) y se actualiza una sola vez, en
+segundo plano, cuando la sesión termina (END) o vence por inactividad.
+
+Backends:
+    MemorySessionStore   dict en memoria del proceso con TTL. Con varios
+                         workers cada uno ve solo sus sesiones: usar Redis.
+    RedisSessionStore    cualquier cliente del protocolo Redis (redis-py,
+                         fakeredis, ...). Los vencimientos van en un sorted
+                         set que un hilo barre cada VOICE_SESSION_SWEEP_SECONDS
+                         para guardar en SQL las sesiones abandonadas.
+
+Si el store no tiene la sesión (reinicio, TTL vencido) se lee de SQL y se
+vuelve a cargar, así que perder el store nunca corta una conversación
+terminada; solo se pierde el avance no guardado de las activas.
+
+Variables de entorno:
+    VOICE_SESSION_STORE        "memory", "sql" (sin store, escribe cada turno
+                               como antes) o una URL redis://... Por defecto
+                               "memory" con un worker y "sql" con varios
+                               (WEB_CONCURRENCY > 1).
+    VOICE_SESSION_TTL_SECONDS  inactividad tras la que se descarta (default 3600)
+    VOICE_SESSION_SWEEP_SECONDS  cada cuánto se buscan sesiones vencidas en
+                               Redis (default 60)
+"""
+import json
+import os
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from typing import Protocol
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# el store en memoria no se comparte entre workers: con varios, SQL o Redis
+VOICE_SESSION_STORE = os.getenv("VOICE_SESSION_STORE") or ("memory" if WEB_CONCURRENCY <= 1 else "sql")
+VOICE_SESSION_TTL_SECONDS = float(os.getenv("VOICE_SESSION_TTL_SECONDS", "3600"))
+VOICE_SESSION_SWEEP_SECONDS = float(os.getenv("VOICE_SESSION_SWEEP_SECONDS", "60"))
+
+
+@dataclass
+class VoiceSessionState:
+    """Lo mismo que una fila de voice_sessions, sin ORM."""
+    id: int
+    clinic_id: int
+    state: str
+    data_json: str
+    updated_at: float = 0.0  # epoch
+
+    @classmethod
+    def from_row(cls, row) -> "VoiceSessionState":
+        # updated_at se guarda en UTC sin zona
+        updated = row.updated_at.replace(tzinfo=timezone.utc).timestamp() if row.updated_at else _time.time()
+        return cls(id=row.id, clinic_id=row.clinic_id, state=row.state, data_json=row.data_json or "{}", updated_at=updated)
+
+
+class SessionStore(Protocol):
+    def get(self, session_id: int) -> VoiceSessionState | None: ...
+
+    def put(self, sess: VoiceSessionState) -> None: ...
+
+    def delete(self, session_id: int) -> None: ...
+
+    def drain(self) -> list[VoiceSessionState]:
+        """Sesiones vivas que se perderían al cerrar el proceso."""
+        ...
+
+
+class MemorySessionStore:
+    def __init__(self, ttl: float = VOICE_SESSION_TTL_SECONDS, on_expire=None):
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self._lock = threading.Lock()
+        # session_id -> (VoiceSessionState, expires_at)
+        self._items: dict[int, tuple[VoiceSessionState, float]] = {}
+        self._next_sweep = 0.0
+
+    def _sweep(self, now: float) -> list[VoiceSessionState]:
+        if now < self._next_sweep:
+            return []
+        self._next_sweep = now + min(60.0, self.ttl)
+        expired = [sid for sid, (_, exp) in self._items.items() if exp <= now]
+        return [self._items.pop(sid)[0] for sid in expired]
+
+    def get(self, session_id: int) -> VoiceSessionState | None:
+        now = _time.monotonic()
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None or item[1] <= now:
+                return None
+            # copia: dos requests de la misma sesión no comparten el objeto
+            return replace(item[0])
+
+    def put(self, sess: VoiceSessionState) -> None:
+        now = _time.monotonic()
+        with self._lock:
+            self._items[sess.id] = (replace(sess), now + self.ttl)
+            expired = self._sweep(now)
+        if expired and self.on_expire:
+            self.on_expire(expired)
+
+    def delete(self, session_id: int) -> None:
+        with self._lock:
+            self._items.pop(session_id, None)
+
+    def drain(self) -> list[VoiceSessionState]:
+        with self._lock:
+            items = [sess for sess, _ in self._items.values()]
+            self._items.clear()
+        return items
+
+
+class RedisSessionStore:
+    """
+    Sesiones como JSON en `<prefix><id>`; sirve con varios workers.
+
+    El vencimiento de cada sesión va además en el sorted set `<prefix>deadlines`
+    (score = epoch). Un hilo por proceso lo barre: toma las vencidas con ZREM
+    (solo un worker gana cada una), las lee y borra, y se las pasa a
+    `on_expire` para guardarlas en SQL. La clave de datos dura un margen más
+    que el TTL para que el barrido siempre la encuentre.
+    """
+
+    def __init__(
+        self,
+        client,
+        ttl: float = VOICE_SESSION_TTL_SECONDS,
+        prefix: str = "voice_session:",
+        on_expire=None,
+        sweep_interval: float = VOICE_SESSION_SWEEP_SECONDS,
+    ):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.on_expire = on_expire
+        self.sweep_interval = max(1.0, sweep_interval)
+        self._deadlines = f"{prefix}deadlines"
+        self._key_ttl = self.ttl + int(self.sweep_interval * 2) + 60
+        self._sweeper: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSessionStore":
+        import redis  # dependencia opcional: pip install redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _key(self, session_id: int) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def get(self, session_id: int) -> VoiceSessionState | None:
+        raw = self.client.get(self._key(session_id))
+        if raw is None:
+            return None
+        try:
+            return VoiceSessionState(**json.loads(raw))
+        except Exception:
+            return None
+
+    def put(self, sess: VoiceSessionState) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(self._key(sess.id), json.dumps(asdict(sess), ensure_ascii=False), ex=self._key_ttl)
+        pipe.zadd(self._deadlines, {str(sess.id): _time.time() + self.ttl})
+        pipe.execute()
+        self._ensure_sweeper()
+
+    def delete(self, session_id: int) -> None:
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.zrem(self._deadlines, str(session_id))
+        pipe.execute()
+
+    def sweep(self, now: float | None = None) -> list[VoiceSessionState]:
+        """Saca de Redis las sesiones vencidas y las devuelve."""
+        now = _time.time() if now is None else now
+        expired = []
+        for member in self.client.zrangebyscore(self._deadlines, "-inf", now):
+            if not self.client.zrem(self._deadlines, member):
+                continue  # otro worker la tomó
+            session_id = int(member)
+            # GET + DEL en una transacción: un put que llegue después la recrea
+            pipe = self.client.pipeline()
+            pipe.get(self._key(session_id))
+            pipe.delete(self._key(session_id))
+            raw, _ = pipe.execute()
+            if raw is None:
+                continue
+            try:
+                expired.append(VoiceSessionState(**json.loads(raw)))
+            except Exception:
+                continue
+        return expired
+
+    def _ensure_sweeper(self) -> None:
+        if self.on_expire is None or self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None and not self._stop.is_set():
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="voice-session-sweep", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_forever(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                expired = self.sweep()
+                if expired:
+                    self.on_expire(expired)
+            except Exception as e:
+                print(f"⚠️ No se pudieron barrer las sesiones de voz vencidas: {e}")
+
+    def drain(self) -> list[VoiceSessionState]:
+        # las sesiones vivas siguen en Redis para el resto de los workers;
+        # solo se devuelven las ya vencidas que este proceso alcance a barrer
+        self._stop.set()
+        try:
+            return self.sweep()
+        except Exception as e:
+            print(f"⚠️ No se pudieron barrer las sesiones de voz vencidas: {e}")
+            return []
+
+
+# ---------------------------------------------------------------------------
+# Volcado a SQL
+# ---------------------------------------------------------------------------
+
+_flush_lock = threading.Lock()
+_flush_executor: ThreadPoolExecutor | None = None
+
+
+def write_sessions(sessions: list[VoiceSessionState]) -> None:
+    """UPDATE de las filas de voice_sessions (corre en el hilo de volcado)."""
+    from app.db import SessionLocal
+    from app.models import VoiceSession
+
+    db = SessionLocal()
+    try:
+        for sess in sessions:
+            db.query(VoiceSession).filter(VoiceSession.id == sess.id).update(
+                {
+                    VoiceSession.state: sess.state,
+                    VoiceSession.data_json: sess.data_json,
+                    VoiceSession.updated_at: datetime.fromtimestamp(
+                        sess.updated_at or _time.time(), timezone.utc
+                    ).replace(tzinfo=None),
+                },
+                synchronize_session=False,
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ No se pudieron guardar {len(sessions)} sesiones de voz: {e}")
+    finally:
+        db.close()
+
+
+def schedule_flush(sessions: list[VoiceSessionState]) -> None:
+    """Encola el guardado en SQL sin bloquear el turno."""
+    global _flush_executor
+    if not sessions:
+        return
+    with _flush_lock:
+        if _flush_executor is None:
+            _flush_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voice-session-flush")
+        _flush_executor.submit(write_sessions, [replace(s) for s in sessions])
+
+
+def _flush_expired(sessions: list[VoiceSessionState]) -> None:
+    # las terminadas ya se guardaron al llegar a END
+    schedule_flush([s for s in sessions if s.state != "END"])
+
+
+# ---------------------------------------------------------------------------
+# Registro
+# ---------------------------------------------------------------------------
+
+def _default_store() -> SessionStore | None:
+    if VOICE_SESSION_STORE == "sql":
+        return None
+    if VOICE_SESSION_STORE.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore.from_url(VOICE_SESSION_STORE, on_expire=_flush_expired)
+    return MemorySessionStore(on_expire=_flush_expired)
+
+
+_store: SessionStore | None = _default_store()
+
+
+def get_session_store() -> SessionStore | None:
+    """Store activo, o None si las sesiones van directo a SQL."""
+    return _store
+
+
+def set_session_store(store: SessionStore | None) -> None:
+    global _store
+    _store = store
+
+
+def close_session_store() -> None:
+    """Guarda las sesiones vivas y espera a que termine el volcado pendiente."""
+    global _flush_executor
+    if _store is not None:
+        pending = _store.drain()
+        if pending:
+            schedule_flush(pending)
+    with _flush_lock:
+        executor, _flush_executor = _flush_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
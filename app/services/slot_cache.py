@@ -0,0 +1,225 @@
+"""
+Cache en memoria de disponibilidad por (clínica, doctor, día).
+
+Cada día se representa con dos bitmaps de 1440 bits (1 bit = 1 minuto),
+guardados como enteros de Python: `open_bits` (minutos abiertos según el
+horario compilado en rule_cache, ya sin excepciones) y `busy_bits` (minutos
+ocupados por citas activas).
+Revisar si un slot está libre es un AND con una máscara, sin SQL ni bucles.
+
+Las citas nuevas se marcan de forma incremental; las que se mueven o se
+cancelan descartan solo los días afectados, que se reconstruyen en la
+siguiente búsqueda. Con varios workers cada proceso tiene su propia copia,
+por eso las entradas expiran tras SLOT_CACHE_TTL_SECONDS.
+"""
+import os
+import threading
+import time as _time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.models import Appointment
+from app.services import rule_cache
+from app.services.rule_cache import MINUTES_PER_DAY, range_mask
+
+SLOT_CACHE_TTL_SECONDS = float(os.getenv("SLOT_CACHE_TTL_SECONDS", "60"))
+SLOT_CACHE_MAX_DAYS = int(os.getenv("SLOT_CACHE_MAX_DAYS", "20000"))
+
+# El router de citas marca "canceled"; el modelo documenta "cancelled".
+# Ninguno de los dos ocupa agenda.
+CANCELLED_STATUSES = ("cancelled", "canceled")
+
+
+@dataclass
+class DayAvailability:
+    starts: tuple[int, ...]  # minutos de inicio de slot según las reglas, ordenados
+    open_bits: int
+    busy_bits: int
+    loaded_at: float
+
+    def free_starts(self, duration_min: int, from_min: int = 0, extra_busy: int = 0):
+        """
+        Minutos de inicio libres para una cita de `duration_min` minutos.
+        `extra_busy` suma ocupación que no vive en el cache (p. ej. holds).
+        """
+        span = (1 << duration_min) - 1
+        open_bits = self.open_bits
+        busy_bits = self.busy_bits | extra_busy
+        for s in self.starts:
+            if s < from_min:
+                continue
+            if s + duration_min > MINUTES_PER_DAY:
+                break
+            mask = span << s
+            if open_bits & mask == mask and not busy_bits & mask:
+                yield s
+
+
+_lock = threading.Lock()
+_days: "OrderedDict[tuple[int, int, date], DayAvailability]" = OrderedDict()
+# sube con cada cambio; si cambió mientras cargábamos, no guardamos lo cargado
+_generation: dict[int, int] = defaultdict(int)
+
+
+def _fresh(loaded_at: float, now: float) -> bool:
+    return now - loaded_at < SLOT_CACHE_TTL_SECONDS
+
+
+def minute_ranges(start: datetime, end: datetime):
+    """Parte [start, end) por día: [(día, min_ini, min_fin), ...] redondeando hacia afuera."""
+    out = []
+    day = start.date()
+    while datetime.combine(day, time(0, 0)) < end:
+        day_start = datetime.combine(day, time(0, 0))
+        s = max(0, int((start - day_start).total_seconds() // 60))
+        e_secs = (end - day_start).total_seconds()
+        e = min(MINUTES_PER_DAY, -int(-e_secs // 60))
+        if e > s:
+            out.append((day, s, e))
+        day += timedelta(days=1)
+    return out
+
+
+def _load(db: Session, clinic_id: int, provider_ids: tuple[int, ...], days: list[date]):
+    """
+    Construye los días pedidos a partir del horario compilado (sin query si
+    está en cache) y 1 query de citas.
+    """
+    schedule = rule_cache.get_schedule(db, clinic_id)
+    with_rules = [pid for pid in provider_ids if pid in schedule.providers]
+
+    busy = defaultdict(int)
+    if with_rules and days:
+        window_start = datetime.combine(min(days), time(0, 0))
+        window_end = datetime.combine(max(days) + timedelta(days=1), time(0, 0))
+        rows = db.query(
+            Appointment.provider_id, Appointment.start_time, Appointment.end_time
+        ).filter(
+            Appointment.clinic_id == clinic_id,
+            Appointment.provider_id.in_(with_rules),
+            Appointment.start_time < window_end,
+            Appointment.end_time > window_start,
+            Appointment.status.notin_(CANCELLED_STATUSES),
+        ).all()
+        for pid, b0, b1 in rows:
+            for day, s, e in minute_ranges(b0, b1):
+                busy[(pid, day)] |= range_mask(s, e)
+
+    now = _time.monotonic()
+    result = {}
+    for pid in provider_ids:
+        per_day = {}
+        for day in days:
+            starts, open_bits = schedule.day(pid, day)
+            per_day[day] = DayAvailability(
+                starts=starts,
+                open_bits=open_bits,
+                busy_bits=busy.get((pid, day), 0),
+                loaded_at=now,
+            )
+        result[pid] = per_day
+    return result
+
+
+def get_days(db: Session, clinic_id: int, provider_ids, days: list[date]) -> dict[int, dict[date, DayAvailability]]:
+    """
+    Devuelve {provider_id: {día: DayAvailability}} para los días pedidos.
+    Lo que ya está en cache no toca la base; lo que falta se carga en un solo lote.
+    """
+    if provider_ids is None:
+        ids = rule_cache.get_schedule(db, clinic_id).provider_ids()
+    else:
+        ids = tuple(provider_ids)
+
+    now = _time.monotonic()
+
+    with _lock:
+        hits = {}
+        missing = False
+        for pid in ids:
+            per_day = {}
+            for day in days:
+                entry = _days.get((clinic_id, pid, day))
+                if entry is None or not _fresh(entry.loaded_at, now):
+                    missing = True
+                    break
+                _days.move_to_end((clinic_id, pid, day))
+                per_day[day] = entry
+            if missing:
+                break
+            hits[pid] = per_day
+
+        generation = _generation[clinic_id]
+
+    if not missing:
+        return hits
+
+    result = _load(db, clinic_id, ids, days)
+
+    with _lock:
+        if _generation[clinic_id] != generation:
+            return result
+        for pid, per_day in result.items():
+            for day, entry in per_day.items():
+                _days[(clinic_id, pid, day)] = entry
+                _days.move_to_end((clinic_id, pid, day))
+        while len(_days) > SLOT_CACHE_MAX_DAYS:
+            _days.popitem(last=False)
+
+    return result
+
+
+def mark_busy(clinic_id: int, provider_id: int, start: datetime, end: datetime) -> None:
+    """Marca una cita nueva como ocupada en los días que ya están en cache."""
+    with _lock:
+        _generation[clinic_id] += 1
+        for day, s, e in minute_ranges(start, end):
+            entry = _days.get((clinic_id, provider_id, day))
+            if entry is not None:
+                entry.busy_bits |= range_mask(s, e)
+
+
+def invalidate(clinic_id: int, provider_id: int, start: datetime, end: datetime) -> None:
+    """Descarta los días que toca una cita (no basta con apagar bits si hay citas solapadas)."""
+    with _lock:
+        _generation[clinic_id] += 1
+        for day, _, _ in minute_ranges(start, end):
+            _days.pop((clinic_id, provider_id, day), None)
+
+
+def sync_appointment(appt: Appointment, previous: tuple[int, datetime, datetime] | None = None) -> None:
+    """
+    Refleja en el cache el estado actual de una cita ya guardada.
+    `previous` es (provider_id, start_time, end_time) antes del cambio.
+    """
+    active = (appt.status or "") not in CANCELLED_STATUSES
+    current = (appt.provider_id, appt.start_time, appt.end_time)
+
+    if previous is not None and (previous != current or not active):
+        invalidate(appt.clinic_id, *previous)
+
+    if active and appt.start_time and appt.end_time:
+        mark_busy(appt.clinic_id, *current)
+    elif appt.start_time and appt.end_time:
+        invalidate(appt.clinic_id, *current)
+
+
+def invalidate_rules(clinic_id: int, provider_id: int | None = None) -> None:
+    """
+    Llamar cuando cambian las reglas o excepciones de una clínica o doctor:
+    descarta el horario compilado y los días derivados de él.
+    """
+    rule_cache.invalidate(clinic_id)
+    with _lock:
+        _generation[clinic_id] += 1
+        for key in [k for k in _days if k[0] == clinic_id and (provider_id is None or k[1] == provider_id)]:
+            del _days[key]
+
+
+def clear() -> None:
+    with _lock:
+        _days.clear()
+        _generation.clear()
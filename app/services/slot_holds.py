@@ -0,0 +1,112 @@
+"""
+Reservas temporales ("holds") de horarios mientras el paciente decide.
+
+Entre que el asistente ofrece horarios (INFO_GENERAL) y el paciente confirma
+(CONFIRM) puede pasar más de un minuto en una llamada. Durante ese tiempo los
+horarios ofrecidos quedan apartados para esa sesión y no se ofrecen a otras.
+
+Cada sesión (owner) tiene a lo sumo un grupo de holds; volver a llamar a
+`hold()` lo reemplaza. Los holds vencen tras SLOT_HOLD_TTL_SECONDS (sesiones
+abandonadas) y se liberan al terminar la sesión. El store vive en memoria del
+proceso: con varios workers cada uno ve solo sus propios holds.
+"""
+import heapq
+import os
+import threading
+import time as _time
+from collections import defaultdict
+from datetime import datetime
+
+from app.services.slot_cache import minute_ranges, range_mask
+
+SLOT_HOLD_TTL_SECONDS = float(os.getenv("SLOT_HOLD_TTL_SECONDS", "180"))
+
+_lock = threading.Lock()
+# owner -> (expires_at, clinic_id, [(provider_id, start, end), ...])
+_by_owner: dict = {}
+# clinic_id -> {owner, ...}
+_by_clinic = defaultdict(set)
+# (expires_at, owner); entradas viejas se descartan al sacarlas
+_expiry_heap: list = []
+
+
+def _drop(owner) -> None:
+    entry = _by_owner.pop(owner, None)
+    if entry is not None:
+        owners = _by_clinic.get(entry[1])
+        if owners is not None:
+            owners.discard(owner)
+            if not owners:
+                del _by_clinic[entry[1]]
+
+
+def _expire(now: float) -> None:
+    """Vence en bloque todo lo que pasó su TTL."""
+    while _expiry_heap and _expiry_heap[0][0] <= now:
+        expires_at, owner = heapq.heappop(_expiry_heap)
+        entry = _by_owner.get(owner)
+        if entry is not None and entry[0] == expires_at:
+            _drop(owner)
+
+
+def hold(owner, clinic_id: int, slots: list[tuple[int, datetime, datetime]], ttl: float | None = None) -> None:
+    """Aparta `slots` [(provider_id, inicio, fin), ...] para `owner`, reemplazando sus holds previos."""
+    now = _time.monotonic()
+    expires_at = now + (SLOT_HOLD_TTL_SECONDS if ttl is None else ttl)
+
+    with _lock:
+        _expire(now)
+        _drop(owner)
+        if not slots:
+            return
+        _by_owner[owner] = (expires_at, clinic_id, list(slots))
+        _by_clinic[clinic_id].add(owner)
+        heapq.heappush(_expiry_heap, (expires_at, owner))
+
+
+def release(owner) -> None:
+    with _lock:
+        _drop(owner)
+
+
+def busy_masks(clinic_id: int, exclude_owner=None) -> dict[tuple[int, object], int]:
+    """
+    Ocupación por holds de otras sesiones como bitmaps por minuto:
+    {(provider_id, día): bits}, listo para sumar a los del slot_cache.
+    """
+    now = _time.monotonic()
+    masks = defaultdict(int)
+
+    with _lock:
+        _expire(now)
+        for owner in _by_clinic.get(clinic_id, ()):
+            if owner == exclude_owner:
+                continue
+            for provider_id, start, end in _by_owner[owner][2]:
+                for day, s, e in minute_ranges(start, end):
+                    masks[(provider_id, day)] |= range_mask(s, e)
+
+    return masks
+
+
+def is_held(clinic_id: int, provider_id: int, start: datetime, end: datetime, exclude_owner=None) -> bool:
+    """True si otra sesión tiene apartado un horario que se solapa con [start, end)."""
+    now = _time.monotonic()
+
+    with _lock:
+        _expire(now)
+        for owner in _by_clinic.get(clinic_id, ()):
+            if owner == exclude_owner:
+                continue
+            for pid, h0, h1 in _by_owner[owner][2]:
+                if pid == provider_id and h0 < end and h1 > start:
+                    return True
+
+    return False
+
+
+def clear() -> None:
+    with _lock:
+        _by_owner.clear()
+        _by_clinic.clear()
+        _expiry_heap.clear()
@@ -0,0 +1,214 @@
+"""
+Backends de voz (speech-to-text y text-to-speech).
+
+Los routers no construyen clientes: piden el backend con `get_stt()` /
+`get_tts()`. Por defecto es `OpenAISpeech`, que usa un solo AsyncOpenAI por
+proceso, creado la primera vez que se necesita, con pool de conexiones
+keep-alive: los turnos de una conversación reutilizan las conexiones TLS en
+vez de abrir unas nuevas cada vez.
+
+Para pruebas y benchmarks se inyecta otro backend con
+`set_speech_backends(FakeSpeech(...))`; no hace falta API key.
+
+Variables de entorno:
+    OPENAI_MAX_CONNECTIONS       conexiones simultáneas (default 20)
+    OPENAI_MAX_KEEPALIVE         conexiones ociosas que se conservan (default 10)
+    OPENAI_KEEPALIVE_EXPIRY      segundos que vive una conexión ociosa (default 30)
+    OPENAI_TIMEOUT_SECONDS       timeout total de cada request (default 30)
+    OPENAI_CONNECT_TIMEOUT       timeout de conexión (default 5)
+    OPENAI_MAX_RETRIES           reintentos del SDK (default 2)
+    STT_BACKEND                  "openai" (default) o "local" (faster-whisper en CPU,
+                                 ver app/services/local_stt.py)
+    STT_MODEL / TTS_MODEL / TTS_VOICE
+    TTS_STREAM_CHUNK_BYTES       tamaño de chunk al hacer streaming de audio (default 4096)
+"""
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, BinaryIO, Protocol
+
+import openai
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+STT_BACKEND = os.getenv("STT_BACKEND", "openai")
+STT_MODEL = os.getenv("STT_MODEL", "whisper-1")
+TTS_MODEL = os.getenv("TTS_MODEL", "gpt-4o-mini-tts")
+TTS_VOICE = os.getenv("TTS_VOICE", "alloy")
+TTS_STREAM_CHUNK_BYTES = int(os.getenv("TTS_STREAM_CHUNK_BYTES", "4096"))
+
+
+class SpeechToText(Protocol):
+    async def transcribe(self, audio: BinaryIO | bytes, filename: str, language: str = "es") -> str:
+        ...
+
+    async def aclose(self) -> None:
+        ...
+
+
+class TextToSpeech(Protocol):
+    async def synthesize(self, text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> bytes:
+        ...
+
+    def stream(self, text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> AsyncIterator[bytes]:
+        """Chunks de audio a medida que el backend los genera."""
+        ...
+
+    async def aclose(self) -> None:
+        ...
+
+
+def _as_upload(audio: BinaryIO | bytes, filename: str):
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return (filename, bytes(audio))
+    # el SDK deduce el formato por la extensión del nombre
+    return (filename, audio)
+
+
+class OpenAISpeech:
+    """STT + TTS sobre un AsyncOpenAI compartido con pool keep-alive."""
+
+    def __init__(self):
+        self._client: openai.AsyncOpenAI | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    @staticmethod
+    def _build_client() -> openai.AsyncOpenAI:
+        # misma clase de Limits que usa el SDK instalado
+        limits_cls = type(openai.DEFAULT_CONNECTION_LIMITS)
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=limits_cls(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=openai.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+        return openai.AsyncOpenAI(http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+
+    async def transcribe(self, audio: BinaryIO | bytes, filename: str, language: str = "es") -> str:
+        transcript = await self.client.audio.transcriptions.create(
+            model=STT_MODEL,
+            file=_as_upload(audio, filename),
+            language=language,
+        )
+        return transcript.text
+
+    async def synthesize(self, text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> bytes:
+        audio = await self.client.audio.speech.create(
+            model=model,
+            voice=voice,
+            input=text,
+        )
+        return audio.content
+
+    async def stream(self, text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> AsyncIterator[bytes]:
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=model,
+            voice=voice,
+            input=text,
+        ) as response:
+            async for chunk in response.iter_bytes(TTS_STREAM_CHUNK_BYTES):
+                yield chunk
+
+    async def aclose(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            await client.close()
+
+
+class FakeSpeech:
+    """Backend local para pruebas y benchmarks: texto y audio fijos, latencia simulada."""
+
+    def __init__(self, transcript: str = "", audio: bytes = b"\x00" * 1024, latency: float = 0.0):
+        self.transcript = transcript
+        self.audio = audio
+        self.latency = latency
+        self.calls = {"transcribe": 0, "synthesize": 0}
+
+    async def transcribe(self, audio: BinaryIO | bytes, filename: str, language: str = "es") -> str:
+        self.calls["transcribe"] += 1
+        if not isinstance(audio, (bytes, bytearray, memoryview)):
+            audio.read()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.transcript
+
+    async def synthesize(self, text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> bytes:
+        self.calls["synthesize"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.audio
+
+    async def stream(self, text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> AsyncIterator[bytes]:
+        self.calls["synthesize"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for i in range(0, len(self.audio), TTS_STREAM_CHUNK_BYTES):
+            yield self.audio[i:i + TTS_STREAM_CHUNK_BYTES]
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _default_stt() -> SpeechToText:
+    if STT_BACKEND == "local":
+        from app.services.local_stt import LocalBatchedSTT
+
+        return LocalBatchedSTT()
+    return _default
+
+
+_default = OpenAISpeech()
+_stt: SpeechToText = _default_stt()
+_tts: TextToSpeech = _default
+
+
+def get_stt() -> SpeechToText:
+    return _stt
+
+
+def get_tts() -> TextToSpeech:
+    return _tts
+
+
+def set_speech_backends(stt: SpeechToText | None = None, tts: TextToSpeech | None = None) -> None:
+    """
+    Reemplaza los backends activos. Si se pasa un objeto que implementa ambos
+    (como FakeSpeech) basta con `set_speech_backends(fake)`; sin argumentos
+    vuelve a los backends por defecto.
+    """
+    global _stt, _tts
+    if stt is None and tts is None:
+        _stt, _tts = _default_stt(), _default
+        return
+    if stt is not None:
+        _stt = stt
+    if tts is not None:
+        _tts = tts
+    elif hasattr(stt, "synthesize"):
+        _tts = stt
+
+
+async def close_speech_backends() -> None:
+    """Cierra los pools HTTP (hook de shutdown de la app)."""
+    closed = set()
+    for backend in (_stt, _tts, _default):
+        if id(backend) in closed:
+            continue
+        closed.add(id(backend))
+        await backend.aclose()
@@ -0,0 +1,248 @@
+"""
+Cache de audio TTS direccionado por contenido.
+
+La clave es sha256(modelo, voz, texto): el mismo prompt con la misma voz
+produce siempre el mismo MP3, así que no hace falta invalidar nada.
+
+Dos niveles:
+- memoria: LRU acotado por bytes (TTS_CACHE_MEMORY_BYTES), por proceso.
+- disco: un archivo por clave en TTS_CACHE_DIR, compartido entre workers,
+  acotado por TTS_CACHE_DISK_BYTES; al pasarse se borran los archivos usados
+  hace más tiempo (el mtime se actualiza en cada hit). El tamaño se lleva
+  sumando lo que escribe este proceso: el directorio solo se recorre al
+  pasarse del límite y cada TTS_CACHE_DISK_RESCAN_SECONDS (lo que escriben
+  los otros workers se ve en ese recorrido).
+  TTS_CACHE_DIR vacío desactiva el nivel de disco.
+
+Un hit no llama al backend de voz ni escribe archivos temporales.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time as _time
+from collections import OrderedDict
+from typing import AsyncIterator
+
+from app.services.speech import TTS_MODEL, TTS_VOICE, get_tts
+
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cataratas_tts_cache"))
+# prompts más largos que esto casi nunca se repiten (llevan nombres, horarios...)
+TTS_CACHE_MAX_TEXT = int(os.getenv("TTS_CACHE_MAX_TEXT", "600"))
+TTS_CACHE_DISK_RESCAN_SECONDS = float(os.getenv("TTS_CACHE_DISK_RESCAN_SECONDS", "600"))
+
+_lock = threading.Lock()
+_memory: "OrderedDict[str, bytes]" = OrderedDict()
+_memory_bytes = 0
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+# bytes en disco según el último recorrido + lo escrito desde entonces (None = sin recorrer)
+_disk_bytes: int | None = None
+_disk_scanned_at = 0.0
+_evict_lock = threading.Lock()
+
+
+def cache_key(text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> str:
+    raw = f"{model}\x00{voice}\x00{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(TTS_CACHE_DIR, key[:2], f"{key}.mp3")
+
+
+def _memory_get(key: str) -> bytes | None:
+    with _lock:
+        audio = _memory.get(key)
+        if audio is not None:
+            _memory.move_to_end(key)
+        return audio
+
+
+def _memory_put(key: str, audio: bytes) -> None:
+    global _memory_bytes
+    if len(audio) > TTS_CACHE_MEMORY_BYTES:
+        return
+    with _lock:
+        old = _memory.pop(key, None)
+        if old is not None:
+            _memory_bytes -= len(old)
+        _memory[key] = audio
+        _memory_bytes += len(audio)
+        while _memory_bytes > TTS_CACHE_MEMORY_BYTES:
+            _, evicted = _memory.popitem(last=False)
+            _memory_bytes -= len(evicted)
+
+
+def _disk_get(key: str) -> bytes | None:
+    if not TTS_CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            audio = f.read()
+        os.utime(path)
+        return audio
+    except OSError:
+        return None
+
+
+def _disk_put(key: str, audio: bytes) -> None:
+    if not TTS_CACHE_DIR or len(audio) > TTS_CACHE_DISK_BYTES:
+        return
+    path = _disk_path(key)
+    try:
+        previous = os.path.getsize(path)
+    except OSError:
+        previous = 0
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # escritura atómica: otro worker nunca ve un MP3 a medias
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ TTS cache: no se pudo escribir {path}: {e}")
+        return
+    _account_disk(len(audio) - previous)
+
+
+def _account_disk(delta: int) -> None:
+    global _disk_bytes
+    with _lock:
+        stale = _disk_bytes is None or _time.monotonic() - _disk_scanned_at >= TTS_CACHE_DISK_RESCAN_SECONDS
+        if not stale:
+            _disk_bytes += delta
+        over = stale or _disk_bytes > TTS_CACHE_DISK_BYTES
+    if over:
+        _evict_disk()
+
+
+def _evict_disk() -> None:
+    global _disk_bytes, _disk_scanned_at
+    # un solo recorrido a la vez; si ya hay uno en curso, ese se encarga
+    if not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        entries = []
+        total = 0
+        for root, _, files in os.walk(TTS_CACHE_DIR):
+            for name in files:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total > TTS_CACHE_DISK_BYTES:
+            # se baja al 90% para no volver a recorrer en la escritura siguiente
+            target = TTS_CACHE_DISK_BYTES * 0.9
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+
+        with _lock:
+            _disk_bytes = total
+            _disk_scanned_at = _time.monotonic()
+    finally:
+        _evict_lock.release()
+
+
+async def synthesize_cached(text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> bytes:
+    """Como get_tts().synthesize pero pasando primero por memoria y disco."""
+    if len(text) > TTS_CACHE_MAX_TEXT:
+        return await get_tts().synthesize(text, model=model, voice=voice)
+
+    audio = await lookup(text, model=model, voice=voice)
+    if audio is not None:
+        return audio
+    return await synthesize_and_store(text, model=model, voice=voice)
+
+
+async def synthesize_and_store(text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> bytes:
+    """Sintetiza sin mirar el cache (llamar tras un `lookup` fallido) y guarda el resultado."""
+    audio = await get_tts().synthesize(text, model=model, voice=voice)
+    if len(text) <= TTS_CACHE_MAX_TEXT:
+        await _store_miss(cache_key(text, model, voice), audio)
+    return audio
+
+
+async def _store_miss(key: str, audio: bytes) -> None:
+    with _lock:
+        _stats["misses"] += 1
+    _memory_put(key, audio)
+    await asyncio.to_thread(_disk_put, key, audio)
+
+
+async def lookup(text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> bytes | None:
+    """Audio ya cacheado (memoria o disco) o None, sin llamar al backend."""
+    if len(text) > TTS_CACHE_MAX_TEXT:
+        return None
+
+    key = cache_key(text, model, voice)
+    audio = _memory_get(key)
+    if audio is not None:
+        with _lock:
+            _stats["memory_hits"] += 1
+        return audio
+
+    audio = await asyncio.to_thread(_disk_get, key)
+    if audio is not None:
+        _memory_put(key, audio)
+        with _lock:
+            _stats["disk_hits"] += 1
+    return audio
+
+
+async def stream_and_store(text: str, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> AsyncIterator[bytes]:
+    """
+    Streaming desde el backend (llamar tras un `lookup` fallido). Reenvía cada
+    chunk apenas llega y, si el stream termina completo, guarda el audio en cache.
+    """
+    cacheable = len(text) <= TTS_CACHE_MAX_TEXT
+    parts = []
+    async for chunk in get_tts().stream(text, model=model, voice=voice):
+        if cacheable:
+            parts.append(chunk)
+        yield chunk
+    if cacheable:
+        await _store_miss(cache_key(text, model, voice), b"".join(parts))
+
+
+async def prewarm(texts, model: str = TTS_MODEL, voice: str = TTS_VOICE) -> int:
+    """Sintetiza (si no están ya) los textos dados. Devuelve cuántos quedaron en cache."""
+    warmed = 0
+    for text in dict.fromkeys(t for t in texts if t):
+        try:
+            await synthesize_cached(text, model=model, voice=voice)
+            warmed += 1
+        except Exception as e:
+            # sin backend disponible no tiene sentido seguir intentando
+            print(f"⚠️ TTS prewarm detenido en {text[:40]!r}: {e}")
+            break
+    return warmed
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "memory_entries": len(_memory), "memory_bytes": _memory_bytes}
+
+
+def clear_memory() -> None:
+    global _memory_bytes
+    with _lock:
+        _memory.clear()
+        _memory_bytes = 0
@@ -0,0 +1,177 @@
+"""
+Clientes de Twilio reutilizables, uno por cuenta.
+
+Crear `Client(account_sid, auth_token)` en cada llamada abre una sesión HTTP
+nueva (conexión TCP + TLS con api.twilio.com) y vuelve a leer credenciales.
+Acá cada cuenta tiene un único Client, compartido entre requests e hilos,
+cuya sesión de requests mantiene el pool de conexiones abiertas.
+
+Credenciales:
+    - por clínica, en la tabla clinic_twilio_accounts (subcuentas). Se leen
+      todas juntas una vez y se recargan cada TWILIO_ACCOUNTS_TTL_SECONDS o
+      con `invalidate()`.
+    - si la clínica no tiene fila, la cuenta global: TWILIO_ACCOUNT_SID,
+      TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER (leídas una vez al importar).
+    - si tiene fila pero con active=False no llama con ninguna: nunca cae a
+      la global (saldría con otro caller ID y se facturaría a otra cuenta).
+
+Variables de entorno:
+    TWILIO_HTTP_TIMEOUT_SECONDS  timeout de cada request a la API (default 10)
+    TWILIO_HTTP_POOL_SIZE        conexiones abiertas por cuenta (default 16)
+    TWILIO_HTTP_MAX_RETRIES      reintentos solo de errores de conexión, que
+                                 no llegaron a Twilio (default 1)
+    TWILIO_API_BASE_URL          apunta los clientes a otro servidor (un Twilio
+                                 falso local: benchmarks/bench_campaigns.py)
+"""
+import os
+import threading
+import time as _time
+from dataclasses import dataclass, field
+
+from app.config import settings
+
+TWILIO_HTTP_TIMEOUT_SECONDS = float(os.getenv("TWILIO_HTTP_TIMEOUT_SECONDS", "10"))
+TWILIO_HTTP_POOL_SIZE = int(os.getenv("TWILIO_HTTP_POOL_SIZE", "16"))
+TWILIO_HTTP_MAX_RETRIES = int(os.getenv("TWILIO_HTTP_MAX_RETRIES", "1"))
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL", "").strip()
+TWILIO_ACCOUNTS_TTL_SECONDS = float(os.getenv("TWILIO_ACCOUNTS_TTL_SECONDS", "300"))
+
+
+class TwilioNotConfigured(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class TwilioAccount:
+    account_sid: str
+    auth_token: str = field(repr=False)
+    phone_number: str | None = None
+
+
+def _env_account() -> TwilioAccount | None:
+    account_sid = getattr(settings, "TWILIO_ACCOUNT_SID", None) or os.getenv("TWILIO_ACCOUNT_SID")
+    auth_token = getattr(settings, "TWILIO_AUTH_TOKEN", None) or os.getenv("TWILIO_AUTH_TOKEN")
+    phone_number = getattr(settings, "TWILIO_PHONE_NUMBER", None) or os.getenv("TWILIO_PHONE_NUMBER")
+    if not account_sid or not auth_token:
+        return None
+    return TwilioAccount(account_sid, auth_token, phone_number)
+
+
+DEFAULT_ACCOUNT = _env_account()
+
+_lock = threading.Lock()
+# (account_sid, auth_token) -> Client
+_clients: dict[tuple[str, str], object] = {}
+# clinic_id -> TwilioAccount (None: fila desactivada), cargado de una vez
+_clinic_accounts: dict[int, TwilioAccount | None] = {}
+_clinic_accounts_loaded_at: float | None = None
+
+
+# =========================
+# Clientes
+# =========================
+def _build_client(account: TwilioAccount):
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    http_client = TwilioHttpClient(pool_connections=True, timeout=TWILIO_HTTP_TIMEOUT_SECONDS)
+    # con int, requests reintenta solo la conexión (read=False): seguro para POST
+    adapter = HTTPAdapter(pool_maxsize=TWILIO_HTTP_POOL_SIZE, max_retries=TWILIO_HTTP_MAX_RETRIES)
+    http_client.session.mount("https://", adapter)
+    http_client.session.mount("http://", adapter)
+
+    client = Client(account.account_sid, account.auth_token, http_client=http_client)
+    if TWILIO_API_BASE_URL:
+        client.api.base_url = TWILIO_API_BASE_URL.rstrip("/")
+    return client
+
+
+def get_client(account: TwilioAccount):
+    """Client de la cuenta; se crea la primera vez y después se reutiliza."""
+    key = (account.account_sid, account.auth_token)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # token rotado: el cliente viejo de la misma cuenta ya no sirve
+            for old in [k for k in _clients if k[0] == account.account_sid]:
+                _close(_clients.pop(old))
+            client = _clients[key] = _build_client(account)
+        return client
+
+
+def _close(client) -> None:
+    session = getattr(getattr(client, "http_client", None), "session", None)
+    if session is not None:
+        session.close()
+
+
+def close_all() -> None:
+    """Cierra las conexiones abiertas (shutdown)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        _close(client)
+
+
+# =========================
+# Credenciales por clínica
+# =========================
+def _load_clinic_accounts() -> dict[int, TwilioAccount | None]:
+    from app.db import SessionLocal
+    from app.models import ClinicTwilioAccount
+
+    db = SessionLocal()
+    try:
+        rows = db.query(ClinicTwilioAccount).all()
+        return {
+            r.clinic_id: TwilioAccount(r.account_sid, r.auth_token, r.phone_number) if r.active else None
+            for r in rows
+        }
+    finally:
+        db.close()
+
+
+def account_for_clinic(clinic_id: int | None) -> TwilioAccount | None:
+    """
+    Cuenta propia de la clínica o, si no tiene fila, la global (None si no hay
+    ninguna). TwilioNotConfigured si la cuenta de la clínica está desactivada.
+    """
+    global _clinic_accounts, _clinic_accounts_loaded_at
+    now = _time.monotonic()
+    loaded_at = _clinic_accounts_loaded_at
+    if loaded_at is None or now - loaded_at >= TWILIO_ACCOUNTS_TTL_SECONDS:
+        try:
+            accounts = _load_clinic_accounts()
+        except Exception as e:
+            print(f"⚠️ No se pudieron cargar las cuentas de Twilio por clínica: {e}")
+            accounts = _clinic_accounts
+        with _lock:
+            _clinic_accounts, _clinic_accounts_loaded_at = accounts, now
+    if clinic_id in _clinic_accounts:
+        account = _clinic_accounts[clinic_id]
+        if account is None:
+            raise TwilioNotConfigured(f"La cuenta de Twilio de la clínica {clinic_id} está desactivada.")
+        return account
+    return DEFAULT_ACCOUNT
+
+
+def client_for_clinic(clinic_id: int | None) -> tuple[object, str]:
+    """(Client, número de origen) con los que llama la clínica."""
+    account = account_for_clinic(clinic_id)
+    if account is None or not account.phone_number:
+        raise TwilioNotConfigured(
+            "Faltan variables de Twilio (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER)."
+        )
+    return get_client(account), account.phone_number
+
+
+def invalidate() -> None:
+    """Relee clinic_twilio_accounts en el próximo uso (tras cambiar credenciales)."""
+    global _clinic_accounts_loaded_at
+    with _lock:
+        _clinic_accounts_loaded_at = None
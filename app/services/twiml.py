@@ -0,0 +1,191 @@
+"""
+TwiML de los webhooks de voz, armado como texto.
+
+Antes cada respuesta de /twilio/process armaba un árbol VoiceResponse,
+pasaba cada línea por las regex de clean_tts y serializaba el XML. Casi todo
+eso se repite entre llamadas: el saludo, los "no te escuché", las URLs de
+redirect de cada clínica y los prompts fijos del flujo. Acá esos fragmentos
+se arman una vez (lru_cache por clínica y por prompt) y la respuesta es una
+concatenación de strings. Lo único que cambia por request (sid de la sesión,
+prompts con datos del paciente) se inserta escapado con xml.sax.saxutils.
+
+La salida es la misma que genera twilio.twiml (mismo orden de atributos y
+mismo escape); benchmarks/bench_twiml.py compara ambos caminos.
+"""
+import re
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+VOICE = "Polly.Conchita"
+LANGUAGE = "es-ES"
+PAUSE_SECONDS = 0.9
+
+# los caches se llenan con prompts con nombres/horarios: acotados
+FRAGMENT_CACHE_SIZE = 4096
+CLINIC_CACHE_SIZE = 256
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+HANGUP = "<Hangup />"
+
+# mismo escape que ElementTree en atributos
+_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"}
+
+
+def attr(value) -> str:
+    return escape(str(value), _ATTR_ENTITIES)
+
+
+# =========================
+# Limpieza de texto para TTS
+# =========================
+_EMOJI_RE = re.compile(
+    "["
+    "\U0001F300-\U0001F5FF"
+    "\U0001F600-\U0001F64F"
+    "\U0001F680-\U0001F6FF"
+    "\U0001F700-\U0001F77F"
+    "\U0001F780-\U0001F7FF"
+    "\U0001F800-\U0001F8FF"
+    "\U0001F900-\U0001F9FF"
+    "\U0001FA00-\U0001FAFF"
+    "\u2600-\u26FF"
+    "\u2700-\u27BF"
+    "]+",
+    flags=re.UNICODE
+)
+
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_SPACES_RE = re.compile(r"\s+")
+_SLOT_OPTION_RE = re.compile(r"\b([1-5])\)\s*([0-2]?\d:\d{2})\b")
+
+MONTHS_ES = {
+    1: "enero", 2: "febrero", 3: "marzo", 4: "abril", 5: "mayo", 6: "junio",
+    7: "julio", 8: "agosto", 9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre",
+}
+
+
+def _iso_to_es(m: re.Match) -> str:
+    y = int(m.group(1)); mo = int(m.group(2)); d = int(m.group(3))
+    month = MONTHS_ES.get(mo, "")
+    if not month:
+        return m.group(0)
+    # comas ayudan a pausas en TTS
+    return f"{d} de {month} de {y}"
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def clean_tts(text: str) -> str:
+    if not text:
+        return ""
+    t = text
+    t = t.replace("✅", "").replace("❌", "").replace("👉", "").replace("📅", "")
+    # Mejora pronunciación de fechas: 2026-02-24 -> 24 de febrero de 2026
+    t = ISO_DATE_RE.sub(_iso_to_es, t)
+    t = _EMOJI_RE.sub("", t)
+    t = _SPACES_RE.sub(" ", t).strip()
+    return t
+
+
+# =========================
+# Verbos
+# =========================
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def say(text: str) -> str:
+    return f'<Say language="{LANGUAGE}" voice="{VOICE}">{escape(text)}</Say>'
+
+
+def pause(length: float = 1) -> str:
+    return f'<Pause length="{length}" />'
+
+
+def redirect(url: str) -> str:
+    return f'<Redirect method="POST">{escape(url)}</Redirect>'
+
+
+def document(*parts: str) -> str:
+    return f"{HEADER}<Response>{''.join(parts)}</Response>"
+
+
+@lru_cache(maxsize=CLINIC_CACHE_SIZE)
+def _gather_parts(clinic_slug: str) -> tuple[str, str]:
+    # el sid va en medio del atributo action
+    head = f'<Gather action="{attr(f"/twilio/process?clinic={clinic_slug}&sid=")}'
+    tail = f'" input="speech dtmf" language="{LANGUAGE}" method="POST" speechTimeout="auto" timeout="8"'
+    return head, tail
+
+
+def gather(clinic_slug: str, sid: int, body: str = "") -> str:
+    """<Gather> de voz + teclado que manda lo escuchado a /twilio/process."""
+    head, tail = _gather_parts(clinic_slug)
+    if not body:
+        return f"{head}{sid}{tail} />"
+    return f"{head}{sid}{tail}>{body}</Gather>"
+
+
+# =========================
+# Fragmentos fijos por clínica
+# =========================
+@lru_cache(maxsize=CLINIC_CACHE_SIZE)
+def restart_url(clinic_slug: str) -> str:
+    return f"/twilio/voice?clinic={clinic_slug}"
+
+
+@lru_cache(maxsize=CLINIC_CACHE_SIZE * 4)
+def fallback(clinic_slug: str, text: str) -> str:
+    """Lo que suena después del <Gather> si no hubo respuesta: aviso + volver a empezar."""
+    return say(text) + redirect(restart_url(clinic_slug))
+
+
+@lru_cache(maxsize=CLINIC_CACHE_SIZE)
+def lost_session(clinic_slug: str) -> str:
+    return document(fallback(clinic_slug, "Se perdió la sesión. Volvamos a empezar."))
+
+
+_ONE_MOMENT = say("Un momento, por favor.") + pause(1)
+
+
+def one_moment(redirect_url: str) -> str:
+    return document(_ONE_MOMENT, redirect(redirect_url))
+
+
+# =========================
+# Prompts del flujo
+# =========================
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def say_lines(text: str, pause_seconds: float = PAUSE_SECONDS) -> str:
+    """Dice el texto por *líneas* con pausas, sin perder saltos de línea.
+    Nota: NO aplicamos clean_tts() al texto completo antes de split porque clean_tts colapsa \n.
+    """
+    raw = (text or "").strip()
+    if not raw:
+        return ""
+
+    # 1) divide por líneas originales (\n)
+    lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
+    parts = []
+    for i, ln in enumerate(lines):
+        ln_clean = clean_tts(ln)  # limpia cada línea (emoji/fechas/espacios)
+        if ln_clean:
+            parts.append(say(ln_clean))
+        if i != len(lines) - 1:
+            parts.append(pause(pause_seconds))
+    return "".join(parts)
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def say_slots(prompt: str) -> str:
+    """Horarios ofrecidos, uno por opción con pausa, y cómo elegir."""
+    p = clean_tts(prompt)
+    parts = [say("Estos son los horarios disponibles.")]
+
+    matches = _SLOT_OPTION_RE.findall(p)
+    if matches:
+        for n, hhmm in matches:
+            parts.append(say(f"Opción {n}: {hhmm}."))
+            parts.append(pause(PAUSE_SECONDS))
+    else:
+        parts.append(say(p))
+
+    parts.append(say("Por favor, marca el número de tu opción en el teclado."))
+    return "".join(parts)
+
@@ -0,0 +1,100 @@
+"""
+Sesiones de WhatsApp: número del usuario -> modo (MENU/BOOKING) y sesión de voz.
+
+Se guardan en la tabla whatsapp_sessions para que cualquier worker pueda
+atender el siguiente mensaje del mismo usuario. Cada fila vence tras
+WHATSAPP_SESSION_TTL_SECONDS sin mensajes (se trata como sesión nueva) y las
+vencidas se borran de a poco al guardar.
+
+Cada mensaje lee la fila directo, sin cache en memoria: el webhook lee,
+cambia y vuelve a guardar la sesión, y una copia vieja de este worker
+pisaría lo que otro worker acaba de guardar (p. ej. volver a MENU en medio
+de una reserva). Es una lectura por clave primaria por mensaje.
+"""
+import os
+import threading
+import time as _time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app.db import SessionLocal
+from app.models import WhatsAppSession
+
+WHATSAPP_SESSION_TTL_SECONDS = float(os.getenv("WHATSAPP_SESSION_TTL_SECONDS", str(24 * 3600)))
+# cada cuánto se borran las filas vencidas
+PURGE_INTERVAL_SECONDS = 600
+
+FIELDS = ("mode", "voice_session_id", "clinic_slug", "to_number")
+
+_lock = threading.Lock()
+_next_purge = 0.0
+
+
+def new_session() -> dict:
+    return {
+        "mode": "MENU",
+        "voice_session_id": None,
+        "clinic_slug": None,
+        "to_number": None,
+    }
+
+
+def get(user_id: str) -> dict | None:
+    """Sesión vigente del usuario, o None si no tiene o venció."""
+    db = SessionLocal()
+    try:
+        row = db.get(WhatsAppSession, user_id)
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return {field: getattr(row, field) for field in FIELDS}
+    finally:
+        db.close()
+
+
+def save(user_id: str, session: dict) -> None:
+    """Guarda la sesión (upsert) y renueva su vencimiento."""
+    values = {field: session.get(field) for field in FIELDS}
+    values["mode"] = values["mode"] or "MENU"
+    expires_at = datetime.utcnow() + timedelta(seconds=WHATSAPP_SESSION_TTL_SECONDS)
+
+    db = SessionLocal()
+    try:
+        updated = (
+            db.query(WhatsAppSession)
+            .filter(WhatsAppSession.user_id == user_id)
+            .update({**values, "expires_at": expires_at}, synchronize_session=False)
+        )
+        if not updated:
+            db.add(WhatsAppSession(user_id=user_id, expires_at=expires_at, **values))
+            try:
+                db.commit()
+            except IntegrityError:
+                # otro worker la creó entre medio: gana el último mensaje
+                db.rollback()
+                db.query(WhatsAppSession).filter(WhatsAppSession.user_id == user_id).update(
+                    {**values, "expires_at": expires_at}, synchronize_session=False
+                )
+                db.commit()
+        else:
+            db.commit()
+        _purge_expired(db)
+    finally:
+        db.close()
+
+
+def _purge_expired(db) -> None:
+    global _next_purge
+    now = _time.monotonic()
+    with _lock:
+        if now < _next_purge:
+            return
+        _next_purge = now + PURGE_INTERVAL_SECONDS
+    try:
+        db.query(WhatsAppSession).filter(WhatsAppSession.expires_at <= datetime.utcnow()).delete(
+            synchronize_session=False
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ No se pudieron borrar sesiones de WhatsApp vencidas: {e}")
@@ -1,5 +1,11 @@
 # app/tenancy.py
 import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
 from fastapi import HTTPException, Request
 from sqlalchemy.orm import Session
 
@@ -7,8 +13,83 @@ from app.models import Clinic
 
 DEFAULT_CLINIC_SLUG = os.getenv("DEFAULT_CLINIC_SLUG", "demo")
 BASE_DOMAIN = os.getenv("BASE_DOMAIN", "")  # ej: "tudominio.com" (opcional)
+# Con varios workers cada uno tiene su copia: un cambio hecho en otro proceso
+# se ve como mucho tras este TTL.
+CLINIC_CACHE_TTL_SECONDS = float(os.getenv("CLINIC_CACHE_TTL_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class ClinicSnapshot:
+    """
+    Copia inmutable de una fila de `clinics`. No está atada a ninguna sesión
+    de SQLAlchemy, así que se puede compartir entre requests e hilos.
+    """
+    id: int
+    name: str
+    slug: str | None
+    phone: str | None
+    address: str | None
+    logo_url: str | None
+    welcome_message: str | None
+    active: bool
+    created_at: datetime | None
+
+    @classmethod
+    def from_model(cls, clinic: Clinic) -> "ClinicSnapshot":
+        return cls(
+            id=clinic.id,
+            name=clinic.name,
+            slug=clinic.slug,
+            phone=clinic.phone,
+            address=clinic.address,
+            logo_url=clinic.logo_url,
+            welcome_message=clinic.welcome_message,
+            active=bool(clinic.active),
+            created_at=clinic.created_at,
+        )
+
+
+_lock = threading.Lock()
+_by_slug: dict[str, tuple[ClinicSnapshot, float]] = {}
+_by_id: dict[int, tuple[ClinicSnapshot, float]] = {}
+
+
+def _remember(snapshot: ClinicSnapshot) -> None:
+    now = time.monotonic()
+    with _lock:
+        if snapshot.slug:
+            _by_slug[snapshot.slug.lower()] = (snapshot, now)
+        _by_id[snapshot.id] = (snapshot, now)
+
 
+def _cached(table: dict, key) -> ClinicSnapshot | None:
+    with _lock:
+        hit = table.get(key)
+    if hit and time.monotonic() - hit[1] < CLINIC_CACHE_TTL_SECONDS:
+        return hit[0]
+    return None
 
+
+def invalidate_clinic(clinic_id: int | None = None, slug: str | None = None) -> None:
+    """
+    Llamar al crear/editar/desactivar una clínica. Sin argumentos vacía todo.
+    """
+    with _lock:
+        if clinic_id is None and slug is None:
+            _by_slug.clear()
+            _by_id.clear()
+            return
+
+        for snap, _ in list(_by_id.values()) + list(_by_slug.values()):
+            if snap.id == clinic_id or (slug and snap.slug and snap.slug.lower() == slug.lower()):
+                _by_id.pop(snap.id, None)
+                if snap.slug:
+                    _by_slug.pop(snap.slug.lower(), None)
+        if slug:
+            _by_slug.pop(slug.lower(), None)
+
+
+@lru_cache(maxsize=1024)
 def _slug_from_host(host: str) -> str | None:
     """
     Extrae slug del host:
@@ -57,9 +138,13 @@ def get_clinic_slug(
     return DEFAULT_CLINIC_SLUG.strip().lower()
 
 
-def require_clinic(db: Session, slug: str) -> Clinic:
+def require_clinic(db: Session, slug: str) -> ClinicSnapshot:
     normalized_slug = (slug or "").strip().lower()
 
+    cached = _cached(_by_slug, normalized_slug)
+    if cached is not None:
+        return cached
+
     clinic = (
         db.query(Clinic)
         .filter(
@@ -73,4 +158,23 @@ def require_clinic(db: Session, slug: str) -> Clinic:
             status_code=404,
             detail=f"Clinic '{normalized_slug}' not found or inactive"
         )
-    return clinic
\ No newline at end of file
+
+    snapshot = ClinicSnapshot.from_model(clinic)
+    _remember(snapshot)
+    return snapshot
+
+
+def get_clinic(db: Session, clinic_id: int) -> ClinicSnapshot | None:
+    """Clínica por id (activa o no), desde el cache si está fresca."""
+    cached = _cached(_by_id, clinic_id)
+    if cached is not None:
+        return cached
+
+    clinic = db.query(Clinic).filter(Clinic.id == clinic_id).first()
+    if not clinic:
+        return None
+
+    snapshot = ClinicSnapshot.from_model(clinic)
+    if snapshot.active:
+        _remember(snapshot)
+    return snapshot
\ No newline at end of file
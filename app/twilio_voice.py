@@ -1,18 +1,19 @@
 from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import Response
 from pydantic import BaseModel
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from twilio.rest import Client
-from sqlalchemy import asc
 
-from app.db import SessionLocal
+from app.db import SessionLocal, db_overloaded, run_db
 from app.tenancy import require_clinic
-from app import models, crud
-from app.config import settings
-from app.routers.voice import handle_message
+from app import crud
+from app.services.conversation import handle_message
+from app.services import channel_routing, metrics, twilio_clients, twiml
+from app.services.clinic_config import get_clinic_config
 
+import asyncio
 import os
 import re
+import time
+from urllib.parse import urlencode
 
 
 def normalize_speech(text: str) -> str:
@@ -24,103 +25,19 @@ def normalize_speech(text: str) -> str:
     return t
 
 
-_EMOJI_RE = re.compile(
-    "["
-    "\U0001F300-\U0001F5FF"
-    "\U0001F600-\U0001F64F"
-    "\U0001F680-\U0001F6FF"
-    "\U0001F700-\U0001F77F"
-    "\U0001F780-\U0001F7FF"
-    "\U0001F800-\U0001F8FF"
-    "\U0001F900-\U0001F9FF"
-    "\U0001FA00-\U0001FAFF"
-    "\u2600-\u26FF"
-    "\u2700-\u27BF"
-    "]+",
-    flags=re.UNICODE
-)
-
-
-def say_lines(vr: VoiceResponse, text: str, *, voice: str, language: str, pause_seconds: float = 0.9) -> None:
-    """Dice el texto por *líneas* con pausas, sin perder saltos de línea.
-    Nota: NO aplicamos clean_tts() al texto completo antes de split porque clean_tts colapsa \n.
-    """
-    raw = (text or "").strip()
-    if not raw:
-        return
-
-    # 1) divide por líneas originales (\n)
-    lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
-    if not lines:
-        return
-
-    for i, ln in enumerate(lines):
-        ln_clean = clean_tts(ln)  # limpia cada línea (emoji/fechas/espacios)
-        if ln_clean:
-            vr.say(ln_clean, voice=voice, language=language)
-        if i != len(lines) - 1:
-            vr.pause(length=pause_seconds)
-
-
-def clean_tts(text: str) -> str:
-    if not text:
-        return ""
-    t = text
-    t = t.replace("✅", "").replace("❌", "").replace("👉", "").replace("📅", "")
-    # Mejora pronunciación de fechas: 2026-02-24 -> 24 de febrero de 2026
-    t = ISO_DATE_RE.sub(_iso_to_es, t)
-    t = _EMOJI_RE.sub("", t)
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
-
-
-
-ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
-
-MONTHS_ES = {
-    1: "enero", 2: "febrero", 3: "marzo", 4: "abril", 5: "mayo", 6: "junio",
-    7: "julio", 8: "agosto", 9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre",
-}
-
-def _iso_to_es(m: re.Match) -> str:
-    y = int(m.group(1)); mo = int(m.group(2)); d = int(m.group(3))
-    month = MONTHS_ES.get(mo, "")
-    if not month:
-        return m.group(0)
-    # comas ayudan a pausas en TTS
-    return f"{d} de {month} de {y}"
-
 router = APIRouter()
 
 
-def _say(node, text: str):
-    node.say(text, language="es-ES", voice="Polly.Conchita")
-
-
-def _gather(clinic_slug: str, sid: int):
-    return Gather(
-        input="speech dtmf",
-        language="es-ES",
-        action=f"/twilio/process?clinic={clinic_slug}&sid={sid}",
-        method="POST",
-        speech_timeout="auto",
-        timeout=8,
-    )
+def _xml(body: str) -> Response:
+    return Response(content=body, media_type="text/xml")
 
 
-def _say_slots_with_pause(gather: Gather, prompt: str):
-    p = clean_tts(prompt)
-    _say(gather, "Estos son los horarios disponibles.")
-
-    matches = re.findall(r"\b([1-5])\)\s*([0-2]?\d:\d{2})\b", p)
-    if matches:
-        for n, hhmm in matches:
-            _say(gather, f"Opción {n}: {hhmm}.")
-            gather.pause(length=0.9)
-    else:
-        _say(gather, p)
-
-    _say(gather, "Por favor, marca el número de tu opción en el teclado.")
+# ✅ IMPORTANTE: decimos el saludo FUERA del Gather (más confiable en llamadas reales)
+_GREETING = (
+    twiml.say("Hola, soy el asistente de la clínica.")
+    + twiml.pause(1)
+    + twiml.say("¿Cuál es tu nombre completo?")
+)
 
 
 # =========================
@@ -180,23 +97,19 @@ async def twilio_call_me(payload: CallMeRequest, request: Request):
     finally:
         db.close()
 
-    # Credenciales Twilio
-    account_sid = getattr(settings, "TWILIO_ACCOUNT_SID", None) or os.getenv("TWILIO_ACCOUNT_SID")
-    auth_token = getattr(settings, "TWILIO_AUTH_TOKEN", None) or os.getenv("TWILIO_AUTH_TOKEN")
-    from_number = getattr(settings, "TWILIO_PHONE_NUMBER", None) or os.getenv("TWILIO_PHONE_NUMBER")
-
-    if not account_sid or not auth_token or not from_number:
-        raise HTTPException(
-            status_code=500,
-            detail="Faltan variables de Twilio (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER)."
-        )
+    try:
+        # cuenta de la clínica (o la global), con su Client ya conectado
+        client, from_number = await run_db(twilio_clients.client_for_clinic, clinic.id)
+    except twilio_clients.TwilioNotConfigured as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     base_url = _get_public_base_url(request)
     twiml_url = f"{base_url}/twilio/voice?clinic={clinic_slug}"
 
     try:
-        client = Client(account_sid, auth_token)
-        call = client.calls.create(
+        # llamada HTTP bloqueante a Twilio: fuera del event loop
+        call = await asyncio.to_thread(
+            client.calls.create,
             to=to_phone,
             from_=from_number,
             url=twiml_url,   # Twilio pedirá TwiML aquí
@@ -207,14 +120,42 @@ async def twilio_call_me(payload: CallMeRequest, request: Request):
         raise HTTPException(status_code=500, detail=f"Error llamando con Twilio: {repr(e)}")
 
 
+def _clinic_slug(request: Request, to_number: str = "") -> str:
+    """?clinic=... si viene en la URL; si no, el número llamado (channel_endpoints)."""
+    slug = request.query_params.get("clinic")
+    if slug:
+        return slug
+    endpoint = channel_routing.lookup(channel_routing.VOICE, to_number)
+    return endpoint.clinic_slug if endpoint is not None else "demo"
+
+
 @router.post("/twilio/voice")
 async def twilio_voice(
     request: Request,
     CallSid: str = Form(default=""),
+    To: str = Form(default=""),
 ):
-    clinic_slug = request.query_params.get("clinic", "demo")
+    clinic_slug = _clinic_slug(request, To)
+
+    if db_overloaded():
+        return _one_moment(twiml.restart_url(clinic_slug))
+
+    try:
+        sid = await _within_budget(run_db(_start_call, clinic_slug, CallSid))
+    except asyncio.TimeoutError:
+        # la sesión que se estaba creando queda huérfana; la llamada empieza otra
+        return _one_moment(twiml.restart_url(clinic_slug))
+
+    return _xml(twiml.document(
+        _GREETING,
+        # Gather solo para escuchar (speech + teclado)
+        twiml.gather(clinic_slug, sid),
+        # Fallback si no detecta voz/teclas
+        twiml.fallback(clinic_slug, "No te escuché. Intentemos otra vez."),
+    ))
 
-    vr = VoiceResponse()
+
+def _start_call(clinic_slug: str, call_sid: str) -> int:
     db = SessionLocal()
     try:
         clinic = require_clinic(db, clinic_slug)
@@ -222,114 +163,158 @@ async def twilio_voice(
         sess = crud.create_voice_session(db, clinic_id=clinic.id)
 
         try:
-            sess.data_json = {**(sess.data_json or {}), "twilio_call_sid": CallSid}
-            db.commit()
+            data = {**crud.session_data(sess), "twilio_call_sid": call_sid}
+            crud.update_voice_session(db, sess, sess.state, data, refresh=False)
         except Exception:
             db.rollback()
 
-        sid = sess.id
+        return sess.id
+    finally:
+        db.close()
 
-        # ✅ IMPORTANTE: decimos el saludo FUERA del Gather (más confiable en llamadas reales)
-        _say(vr, "Hola, soy el asistente de la clínica.")
-        vr.pause(length=1)
-        _say(vr, "¿Cuál es tu nombre completo?")
 
-        # Gather solo para escuchar (speech + teclado)
-        gather = _gather(clinic_slug, sid)
-        vr.append(gather)
+def _process_turn(clinic_slug: str, sid: int, text: str) -> dict:
+    db = SessionLocal()
+    try:
+        clinic = require_clinic(db, clinic_slug)
+        config = get_clinic_config(db, clinic.id)
 
-        # Fallback si no detecta voz/teclas
-        _say(vr, "No te escuché. Intentemos otra vez.")
-        vr.redirect(f"/twilio/voice?clinic={clinic_slug}", method="POST")
+        try:
+            return handle_message(
+                db,
+                clinic.id,
+                sid,
+                text,
+                config=config,
+            )
+        except Exception as e:
+            print("ERROR /twilio/process:", repr(e))
+            return {"prompt": "Hubo un problema técnico. Intentemos otra vez.", "done": False}
     finally:
         db.close()
 
-    return Response(content=str(vr), media_type="text/xml")
-
 
 @router.post("/twilio/process")
 async def twilio_process(
     request: Request,
     SpeechResult: str = Form(default=""),
     Digits: str = Form(default=""),
+    To: str = Form(default=""),
 ):
-    clinic_slug = request.query_params.get("clinic", "demo")
+    clinic_slug = _clinic_slug(request, To)
     sid_raw = request.query_params.get("sid", "")
 
-    raw_input = Digits or SpeechResult
-    text = normalize_speech(raw_input)
-
-    vr = VoiceResponse()
-
     try:
         sid = int(sid_raw)
     except Exception:
-        _say(vr, "Se perdió la sesión. Volvamos a empezar.")
-        vr.redirect(f"/twilio/voice?clinic={clinic_slug}", method="POST")
-        return Response(content=str(vr), media_type="text/xml")
+        return _xml(twiml.lost_session(clinic_slug))
+
+    # sin entrada nueva: puede ser el reintento de un turno que no llegó a
+    # empezar; lo dicho quedó en memoria (nunca en la URL: son datos personales)
+    raw_input = Digits or SpeechResult or _retry_text.pop(sid, ("", 0.0))[0]
+    text = normalize_speech(raw_input)
 
     if not text:
-        gather = _gather(clinic_slug, sid)
-        _say(gather, "No te escuché bien. Repite por favor.")
-        vr.append(gather)
+        return _xml(twiml.document(
+            twiml.gather(clinic_slug, sid, twiml.say("No te escuché bien. Repite por favor.")),
+            twiml.fallback(clinic_slug, "No te escuché. Intentemos otra vez."),
+        ))
+
+    if db_overloaded():
+        # el turno no empezó: se puede reintentar tal cual
+        _remember(_retry_text, sid, text)
+        return _one_moment(f"/twilio/process?{urlencode({'clinic': clinic_slug, 'sid': sid})}")
+
+    started = time.perf_counter()
+    task = asyncio.ensure_future(run_db(_process_turn, clinic_slug, sid, text))
+    try:
+        result = await _within_budget(task)
+    except asyncio.TimeoutError:
+        # el turno sigue en su hilo; Twilio vuelve a buscar la respuesta
+        _remember(_pending, sid, task)
+        metrics.observe_ms("twilio.process.over_budget_ms", metrics.since_ms(started))
+        return _one_moment(f"/twilio/pending?clinic={clinic_slug}&sid={sid}")
+    metrics.observe_ms("twilio.process_ms", metrics.since_ms(started))
 
-        _say(vr, "No te escuché. Intentemos otra vez.")
-        vr.redirect(f"/twilio/voice?clinic={clinic_slug}", method="POST")
-        return Response(content=str(vr), media_type="text/xml")
+    return _render_turn(clinic_slug, sid, result)
+
+
+@router.post("/twilio/pending")
+async def twilio_pending(request: Request):
+    """Respuesta de un turno que se pasó del presupuesto de latencia."""
+    clinic_slug = request.query_params.get("clinic", "demo")
 
-    db = SessionLocal()
     try:
-        clinic = require_clinic(db, clinic_slug)
+        sid = int(request.query_params.get("sid", ""))
+    except Exception:
+        return _xml(twiml.lost_session(clinic_slug))
 
-        prov = (
-            db.query(models.Provider)
-            .filter(models.Provider.clinic_id == clinic.id)
-            .order_by(asc(models.Provider.id))
-            .first()
-        )
-        appt = (
-            db.query(models.AppointmentType)
-            .filter(models.AppointmentType.clinic_id == clinic.id)
-            .order_by(asc(models.AppointmentType.id))
-            .first()
-        )
-        provider_id = (prov.id if prov else None) or settings.DEFAULT_PROVIDER_ID
-        type_id = (appt.id if appt else None) or settings.DEFAULT_APPT_TYPE_ID
+    task = _pending.pop(sid, (None, 0.0))[0]
+    if task is None:
+        # otro worker, o ya se respondió: pedimos que repita
+        return _xml(twiml.document(
+            twiml.gather(clinic_slug, sid, twiml.say("Disculpa la demora. ¿Me repites por favor?")),
+            twiml.redirect(twiml.restart_url(clinic_slug)),
+        ))
 
-        try:
-            result = handle_message(
-                db,
-                clinic.id,
-                sid,
-                text,
-                provider_id=provider_id,
-                type_id=type_id,
-            )
-        except Exception as e:
-            print("ERROR /twilio/process:", repr(e))
-            result = {"prompt": "Hubo un problema técnico. Intentemos otra vez.", "done": False}
-    finally:
-        db.close()
+    try:
+        result = await _within_budget(task)
+    except asyncio.TimeoutError:
+        _remember(_pending, sid, task)
+        return _one_moment(f"/twilio/pending?clinic={clinic_slug}&sid={sid}")
+
+    return _render_turn(clinic_slug, sid, result)
 
+
+def _render_turn(clinic_slug: str, sid: int, result: dict) -> Response:
     prompt = (result or {}).get("prompt") or "Perfecto. ¿Me repites por favor?"
     done = bool((result or {}).get("done", False))
 
     if done:
-        say_lines(vr, prompt, voice="Polly.Conchita", language="es-ES")
-        vr.hangup()
-        return Response(content=str(vr), media_type="text/xml")
-
-    gather = _gather(clinic_slug, sid)
+        return _xml(twiml.document(twiml.say_lines(prompt), twiml.HANGUP))
 
-    if "horarios disponibles" in (prompt or "").lower():
-        _say_slots_with_pause(gather, prompt)
+    if "horarios disponibles" in prompt.lower():
+        body = twiml.say_slots(prompt)
     else:
         # Para doctores/especialidad y otros listados: decir por líneas con pausas
-        say_lines(gather, prompt, voice="Polly.Conchita", language="es-ES")
+        body = twiml.say_lines(prompt)
+
+    return _xml(twiml.document(
+        twiml.gather(clinic_slug, sid, body),
+        twiml.fallback(clinic_slug, "Si prefieres, marca el número en el teclado. Intentemos otra vez."),
+    ))
+
+
+# =========================
+# Presupuesto de latencia
+# =========================
+# Twilio corta el webhook a los 15 s. Si un turno no termina dentro de
+# TWILIO_LATENCY_BUDGET_SECONDS respondemos "un momento" y un <Redirect> a
+# /twilio/pending, que entrega la respuesta cuando el turno termina. El turno
+# no se cancela: ya puede haber escrito la sesión o reservado la cita.
+TWILIO_LATENCY_BUDGET_SECONDS = float(os.getenv("TWILIO_LATENCY_BUDGET_SECONDS", "6"))
+TWILIO_PENDING_TTL_SECONDS = 120.0
+
+# sid -> (tarea del turno, creada_en)
+_pending: dict[int, tuple[asyncio.Future, float]] = {}
+# sid -> (texto del turno a reintentar por sobrecarga, creado_en)
+_retry_text: dict[int, tuple[str, float]] = {}
+
+
+async def _within_budget(aw):
+    task = asyncio.ensure_future(aw)
+    # shield: al vencer el plazo la tarea sigue corriendo
+    return await asyncio.wait_for(asyncio.shield(task), TWILIO_LATENCY_BUDGET_SECONDS)
+
 
-    vr.append(gather)
+def _remember(store: dict, sid: int, value) -> None:
+    """Guarda `value` para el próximo request de la llamada (en este worker)."""
+    now = time.monotonic()
+    for old_sid, (_, created) in list(store.items()):
+        if now - created > TWILIO_PENDING_TTL_SECONDS:
+            store.pop(old_sid, None)
+    store[sid] = (value, now)
 
-    _say(vr, "Si prefieres, marca el número en el teclado. Intentemos otra vez.")
-    vr.redirect(f"/twilio/voice?clinic={clinic_slug}", method="POST")
 
-    return Response(content=str(vr), media_type="text/xml")
+def _one_moment(redirect_url: str) -> Response:
+    return _xml(twiml.one_moment(redirect_url))
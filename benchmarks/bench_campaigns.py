@@ -0,0 +1,214 @@
+"""
+Benchmark de campañas de llamadas contra un Twilio falso local.
+
+Levanta la app real con uvicorn, el despachador en un hilo aparte y un
+servidor HTTP que imita la API de llamadas de Twilio: responde a
+POST /2010-04-01/Accounts/<sid>/Calls.json y, como Twilio, manda los status
+callbacks (initiated, ringing, in-progress, completed) a la app, firmados con
+X-Twilio-Signature. No se llama a Twilio ni hacen falta credenciales reales.
+
+Resultado simulado según el teléfono: los que terminan en 7 dan "busy" en el
+primer intento (prueba reintento + backoff) y los que terminan en 9 nunca
+contestan (terminan en failed tras max_attempts).
+
+Mide cuánto tarda en vaciarse la cola y verifica los límites: llamadas en
+curso por clínica y llamadas por segundo del mismo número de origen.
+
+Uso:
+    python benchmarks/bench_campaigns.py [--jobs 200] [--workers 8] [--cps 20] [--concurrency 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+from twilio.request_validator import RequestValidator
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--jobs", type=int, default=200)
+parser.add_argument("--workers", type=int, default=8)
+parser.add_argument("--cps", type=float, default=20.0, help="llamadas por segundo por número de origen")
+parser.add_argument("--concurrency", type=int, default=5, help="llamadas en curso por clínica")
+parser.add_argument("--call-seconds", type=float, default=0.2, help="duración de cada llamada simulada")
+args = parser.parse_args()
+
+TWILIO_PORT = _free_port()
+APP_PORT = _free_port()
+FROM_NUMBER = "+15005550006"
+AUTH_TOKEN = "fake-token"
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_campaigns_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}",
+    "TTS_PREWARM": "0",
+    "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+    "TWILIO_AUTH_TOKEN": AUTH_TOKEN,
+    "TWILIO_PHONE_NUMBER": FROM_NUMBER,
+    "TWILIO_API_BASE_URL": f"http://127.0.0.1:{TWILIO_PORT}",
+    "CAMPAIGN_WORKERS": str(args.workers),
+    "CAMPAIGN_POLL_SECONDS": "0.05",
+    "CAMPAIGN_CALLS_PER_SECOND": str(args.cps),
+    "CAMPAIGN_MAX_CONCURRENCY_PER_CLINIC": str(args.concurrency),
+    "CAMPAIGN_RETRY_BASE_SECONDS": "0.2",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn  # noqa: E402
+
+from app.db import Base, SessionLocal, engine  # noqa: E402
+import app.models  # noqa: E402,F401
+from app.main import app as fastapi_app  # noqa: E402
+from app.models import CallCampaign  # noqa: E402
+from app.seed import seed_data  # noqa: E402
+from app.services import campaigns  # noqa: E402
+
+
+class FakeTwilio(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, call_seconds: float):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.call_seconds = call_seconds
+        self.validator = RequestValidator(AUTH_TOKEN)
+        self.lock = threading.Lock()
+        self.dials: list[tuple[float, str, str]] = []  # (t, from, to)
+        self.attempts: Counter = Counter()
+        self.live = 0
+        self.max_live = 0
+
+    def place(self, form: dict) -> str:
+        with self.lock:
+            n = len(self.dials)
+            self.dials.append((time.monotonic(), form["From"], form["To"]))
+            self.attempts[form["To"]] += 1
+            attempt = self.attempts[form["To"]]
+            self.live += 1
+            self.max_live = max(self.max_live, self.live)
+        sid = f"CA{n:032d}"
+        threading.Thread(target=self._play, args=(sid, form, attempt), daemon=True).start()
+        return sid
+
+    def _play(self, sid: str, form: dict, attempt: int) -> None:
+        to = form["To"]
+        if to.endswith("9"):
+            events = ["initiated", "ringing", "no-answer"]
+        elif to.endswith("7") and attempt == 1:
+            events = ["initiated", "ringing", "busy"]
+        else:
+            events = ["initiated", "ringing", "in-progress", "completed"]
+        for status in events:
+            if status == "completed":
+                time.sleep(self.call_seconds)
+            if status in ("no-answer", "busy", "completed"):
+                # la línea queda libre antes de avisar, como en Twilio
+                with self.lock:
+                    self.live -= 1
+            params = {"CallSid": sid, "CallStatus": status}
+            url = form["StatusCallback"]
+            req = urllib.request.Request(url, data=urlencode(params).encode(), headers={
+                "X-Twilio-Signature": self.validator.compute_signature(url, params),
+            })
+            urllib.request.urlopen(req, timeout=5).read()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        if not self.path.endswith("/Calls.json"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        sid = self.server.place(form)
+        payload = json.dumps({"sid": sid, "status": "queued", "to": form["To"], "from": form["From"]}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *a):
+        pass
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    seed_data()
+
+    twilio = FakeTwilio(TWILIO_PORT, args.call_seconds)
+    threading.Thread(target=twilio.serve_forever, daemon=True).start()
+
+    db = SessionLocal()
+    recipients = [{"phone": f"+59399{i:07d}", "name": f"Paciente {i}"} for i in range(args.jobs)]
+    campaign, rejected = campaigns.create_campaign(
+        db, clinic_id=1, name="Recall", recipients=recipients,
+        base_url=f"http://127.0.0.1:{APP_PORT}", max_attempts=3,
+    )
+    assert not rejected, rejected
+    campaign_id = campaign.id
+    db.close()
+
+    server = uvicorn.Server(uvicorn.Config(fastapi_app, host="127.0.0.1", port=APP_PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    # como `python -m app.services.campaigns` en start.sh
+    threading.Thread(target=asyncio.run, args=(campaigns.run_forever(args.workers),), daemon=True).start()
+    t0 = time.perf_counter()
+
+    pending = args.jobs
+    while pending:
+        time.sleep(0.1)
+        db = SessionLocal()
+        try:
+            jobs = campaigns.campaign_summary(db, db.get(CallCampaign, campaign_id))["jobs"]
+        finally:
+            db.close()
+        pending = jobs["queued"] + jobs["dialing"] + jobs["in_progress"]
+        if time.perf_counter() - t0 > 300:
+            raise SystemExit(f"timeout: {jobs}")
+    elapsed = time.perf_counter() - t0
+
+    server.should_exit = True
+    twilio.shutdown()
+
+    times = sorted(t for t, src, _ in twilio.dials if src == FROM_NUMBER)
+    # llamadas en cualquier ventana de 1 s (así mide Twilio el CPS)
+    j = 0
+    max_per_second = 0
+    for i, t in enumerate(times):
+        while times[j] <= t - 1.0:
+            j += 1
+        max_per_second = max(max_per_second, i - j + 1)
+    expected_failed = sum(1 for r in recipients if r["phone"].endswith("9"))
+
+    print(f"trabajos            {args.jobs}")
+    print(f"llamadas hechas     {len(twilio.dials)}")
+    print(f"tiempo total        {elapsed:.2f} s ({len(twilio.dials) / elapsed:.1f} llamadas/s)")
+    print(f"en curso máx        {twilio.max_live} (límite {args.concurrency})")
+    print(f"llamadas en 1 s máx {max_per_second} (límite {args.cps:g} por número)")
+    print(f"estado final        {jobs}")
+
+    assert jobs["completed"] == args.jobs - expected_failed, jobs
+    assert jobs["failed"] == expected_failed, jobs
+    assert twilio.max_live <= args.concurrency
+    # +1: la ventana incluye ambos bordes
+    assert max_per_second <= args.cps + 1, max_per_second
+
+
+if __name__ == "__main__":
+    main()
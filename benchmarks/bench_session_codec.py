@@ -0,0 +1,105 @@
+"""
+Benchmark del codec de data_json: JSON (formato anterior) vs compacto.
+
+Usa una sesión típica en CONFIRM (nombre, teléfono, menú de especialidades,
+5 horarios ofrecidos, menú de doctores y horario elegido) y mide tamaño
+guardado y tiempo de encode/decode por turno. "compacto" es el caso normal
+(decode de lo que escribió el turno anterior en el mismo proceso, desde el
+cache); "compacto frío" es el decode completo (otro worker o reinicio).
+
+Uso:
+    python benchmarks/bench_session_codec.py [--n 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services import session_codec  # noqa: E402
+from app.services.clinic_config import build_config, build_provider_menu  # noqa: E402
+from app.tenancy import ClinicSnapshot  # noqa: E402
+
+
+class _Row:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+def sample(config) -> dict:
+    day = datetime(2026, 10, 19, 9, 0)
+    slots = [
+        {
+            "start": (day + timedelta(minutes=30 * i)).isoformat(),
+            "end": (day + timedelta(minutes=30 * (i + 1))).isoformat(),
+            "provider_ids": [1, 2, 3],
+        }
+        for i in range(5)
+    ]
+    _, doctor_options = build_provider_menu(config.providers_for([1, 2, 3]))
+    return {
+        "full_name": "María José Fernández",
+        "phone": "0991234567",
+        "specialty_options": config.specialty_option_dicts(),
+        "specialty": "Evaluación de cataratas",
+        "type_id": 1,
+        "date": "2026-10-19",
+        "slot_options": slots,
+        "chosen_slot": slots[1],
+        "doctor_options": doctor_options,
+        "doctor": 2,
+        "doctor_name": doctor_options[1]["label"],
+    }
+
+
+def bench(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    args = parser.parse_args()
+
+    clinic = ClinicSnapshot(
+        id=1, name="Clínica Demo", slug="demo", phone=None, address=None,
+        logo_url=None, welcome_message=None, active=True, created_at=None,
+    )
+    providers = [_Row(id=i, name=f"Dr. Especialista {i}") for i in (1, 2, 3)]
+    types = [
+        _Row(id=1, name="Evaluación de cataratas", code="EVAL", duration_minutes=30),
+        _Row(id=2, name="Control postoperatorio", code="CTRL", duration_minutes=20),
+        _Row(id=3, name="Cirugía de cataratas", code="CIRU", duration_minutes=60),
+    ]
+    config = build_config(clinic, providers, types)
+    data = sample(config)
+
+    as_json = json.dumps(data, ensure_ascii=False)
+    compact = session_codec.encode(data, config)
+    assert session_codec.decode(compact, config) == data, "el round-trip no coincide"
+    assert session_codec.decode(as_json, config) == data, "no lee el JSON anterior"
+
+    rows = [
+        ("json", lambda: json.dumps(data, ensure_ascii=False), lambda: json.loads(as_json), as_json),
+        ("compacto", lambda: session_codec.encode(data, config), lambda: session_codec.decode(compact, config), compact),
+        (
+            "compacto frío",
+            lambda: session_codec._encode_binary(data, config),
+            lambda: session_codec._decode_binary(compact, config),
+            compact,
+        ),
+    ]
+    print(f"{'formato':14} {'bytes':>6} {'encode µs':>10} {'decode µs':>10}")
+    for name, enc, dec, stored in rows:
+        print(f"{name:14} {len(stored.encode()):6d} {bench(enc, args.n):10.2f} {bench(dec, args.n):10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de throughput del STT local (faster-whisper en CPU).
+
+Lanza N transcripciones concurrentes de Recording.m4a, como si N sesiones
+hablaran a la vez, y compara:
+  - sin batching: un clip por pasada del modelo (max_batch=1)
+  - con batching: los clips que llegan dentro de la ventana van juntos
+
+Con --smoke solo corre un batch de dos clips y lo compara con el camino
+normal (model.transcribe): sirve para validar una versión nueva de
+faster-whisper, ya que el batch usa sus internals.
+
+Uso:
+    pip install -r requirements-local-stt.txt
+    python benchmarks/bench_stt.py [--clips 8] [--model small] [--wait-ms 50] [--smoke]
+
+La primera ejecución descarga el modelo de Hugging Face.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.local_stt import FasterWhisperBatch, LocalBatchedSTT  # noqa: E402
+
+
+async def run(stt: LocalBatchedSTT, clip: bytes, n: int) -> tuple[float, list[str]]:
+    t0 = time.perf_counter()
+    texts = await asyncio.gather(*(stt.transcribe(clip, "Recording.m4a") for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    await stt.aclose()
+    return elapsed, texts
+
+
+def smoke(infer: FasterWhisperBatch, clip: bytes) -> None:
+    import io
+
+    batch = infer([clip, clip], "es")
+    segments, _ = infer._load().transcribe(io.BytesIO(clip), language="es", beam_size=1)
+    expected = " ".join(s.text.strip() for s in segments)
+    print(f"batch:      {batch!r}")
+    print(f"transcribe: {expected!r}")
+    if len(batch) != 2 or not all(batch) or batch[0] != batch[1]:
+        sys.exit("FALLA: el batch no devolvió un texto por clip")
+    # greedy en los dos caminos; puede variar la puntuación, no el contenido
+    normalize = lambda t: "".join(ch for ch in t.lower() if ch.isalnum())  # noqa: E731
+    if normalize(batch[0]) != normalize(expected):
+        sys.exit("FALLA: el batch no coincide con model.transcribe")
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=8, help="transcripciones concurrentes")
+    parser.add_argument("--model", default=os.getenv("LOCAL_STT_MODEL", "small"))
+    parser.add_argument("--wait-ms", type=float, default=50, help="ventana para armar un batch")
+    parser.add_argument("--audio", default=os.path.join(ROOT, "Recording.m4a"))
+    parser.add_argument("--smoke", action="store_true", help="solo valida un batch contra model.transcribe")
+    args = parser.parse_args()
+
+    try:
+        import faster_whisper  # noqa: F401
+    except ImportError:
+        sys.exit("Falta faster-whisper: pip install -r requirements-local-stt.txt")
+
+    with open(args.audio, "rb") as f:
+        clip = f.read()
+
+    infer = FasterWhisperBatch(args.model)
+    if args.smoke:
+        smoke(infer, clip)
+        return
+
+    # carga del modelo + warm-up fuera de la medición
+    print(f"Cargando modelo {args.model}...")
+    print(f"Transcripción: {infer([clip], 'es')[0]!r}")
+
+    single = LocalBatchedSTT(infer=infer, max_batch=1, max_wait_ms=0)
+    before, _ = asyncio.run(run(single, clip, args.clips))
+
+    batched = LocalBatchedSTT(infer=infer, max_batch=args.clips, max_wait_ms=args.wait_ms)
+    after, _ = asyncio.run(run(batched, clip, args.clips))
+
+    print(f"\n{args.clips} clips concurrentes ({os.path.basename(args.audio)}), modelo {args.model}")
+    print(f"  sin batching: {before:6.2f}s  -> {args.clips / before:5.2f} clips/s ({single.batches} pasadas)")
+    print(f"  con batching: {after:6.2f}s  -> {args.clips / after:5.2f} clips/s ({batched.batches} pasadas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark del TwiML de /twilio/process: twilio.twiml (VoiceResponse) vs
+fragmentos cacheados de app.services.twiml.
+
+Arma las respuestas de una llamada típica (nombre, menú de especialidades,
+horarios, resumen de confirmación, despedida) con los dos caminos, verifica
+que el XML sea idéntico y mide CPU por respuesta. Cada respuesta lleva un sid
+distinto, como en producción.
+
+    repetidos  prompts que se repiten entre llamadas (caso común)
+    únicos     cada prompt lleva un nombre distinto: los caches no ayudan
+
+Uso:
+    python benchmarks/bench_twiml.py [--n 20000]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from twilio.twiml.voice_response import Gather, VoiceResponse  # noqa: E402
+
+from app.services import twiml  # noqa: E402
+
+# camino anterior: las regex de limpieza corren en cada request
+clean_tts = twiml.clean_tts.__wrapped__
+
+
+def _say(node, text: str):
+    node.say(text, language="es-ES", voice="Polly.Conchita")
+
+
+def _gather(clinic_slug: str, sid: int):
+    return Gather(
+        input="speech dtmf",
+        language="es-ES",
+        action=f"/twilio/process?clinic={clinic_slug}&sid={sid}",
+        method="POST",
+        speech_timeout="auto",
+        timeout=8,
+    )
+
+
+def _say_lines(node, text: str, pause_seconds: float = 0.9):
+    lines = [ln.strip() for ln in (text or "").strip().splitlines() if ln.strip()]
+    for i, ln in enumerate(lines):
+        ln_clean = clean_tts(ln)
+        if ln_clean:
+            _say(node, ln_clean)
+        if i != len(lines) - 1:
+            node.pause(length=pause_seconds)
+
+
+def _say_slots_with_pause(gather: Gather, prompt: str):
+    p = clean_tts(prompt)
+    _say(gather, "Estos son los horarios disponibles.")
+    matches = re.findall(r"\b([1-5])\)\s*([0-2]?\d:\d{2})\b", p)
+    if matches:
+        for n, hhmm in matches:
+            _say(gather, f"Opción {n}: {hhmm}.")
+            gather.pause(length=0.9)
+    else:
+        _say(gather, p)
+    _say(gather, "Por favor, marca el número de tu opción en el teclado.")
+
+
+def render_voiceresponse(clinic_slug: str, sid: int, prompt: str, done: bool) -> str:
+    vr = VoiceResponse()
+    if done:
+        _say_lines(vr, prompt)
+        vr.hangup()
+        return str(vr)
+    gather = _gather(clinic_slug, sid)
+    if "horarios disponibles" in prompt.lower():
+        _say_slots_with_pause(gather, prompt)
+    else:
+        _say_lines(gather, prompt)
+    vr.append(gather)
+    _say(vr, "Si prefieres, marca el número en el teclado. Intentemos otra vez.")
+    vr.redirect(f"/twilio/voice?clinic={clinic_slug}", method="POST")
+    return str(vr)
+
+
+def render_twiml(clinic_slug: str, sid: int, prompt: str, done: bool) -> str:
+    # mismo armado que twilio_voice._render_turn, sin el Response de Starlette
+    if done:
+        return twiml.document(twiml.say_lines(prompt), twiml.HANGUP)
+    if "horarios disponibles" in prompt.lower():
+        body = twiml.say_slots(prompt)
+    else:
+        body = twiml.say_lines(prompt)
+    return twiml.document(
+        twiml.gather(clinic_slug, sid, body),
+        twiml.fallback(clinic_slug, "Si prefieres, marca el número en el teclado. Intentemos otra vez."),
+    )
+
+
+def call_prompts(name: str) -> list[tuple[str, bool]]:
+    return [
+        ("Perfecto ✅ ¿Cuál es tu número de teléfono?", False),
+        (
+            f"Gracias, {name}. ¿Qué especialidad necesitas?\n"
+            "1) Evaluación de cataratas\n2) Control postoperatorio\n3) Cirugía de cataratas",
+            False,
+        ),
+        ("¿Para qué fecha? (Ej: mañana, lunes, 2026-03-18)", False),
+        (
+            "Estos son los horarios disponibles para lunes 19 de octubre:\n"
+            "1) 09:00\n2) 09:30\n3) 10:00\n4) 10:30\n5) 11:00\nElige el número del 1 al 5.",
+            False,
+        ),
+        (
+            "Voy a agendar tu cita con estos datos:\n"
+            f"Paciente: {name} <Fernández & Hijos>\n"
+            "Teléfono: 0991234567\nEspecialidad: Evaluación de cataratas\n"
+            "Doctor: Dr. Especialista 2\nFecha: 2026-10-19\nHora: 09:30\n\n"
+            "Para confirmar tu cita, presiona 1. Para cancelar, presiona 2.",
+            False,
+        ),
+        ("✅ ¡Listo! Tu cita quedó agendada para el 2026-10-19 a las 09:30. 👋", True),
+    ]
+
+
+def bench(render, turns: list, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        prompt, done = turns[i % len(turns)]
+        render("demo", 1000 + i, prompt, done)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    args = parser.parse_args()
+
+    repeated = call_prompts("María José")
+    unique = [turn for i in range(args.n // 6 + 1) for turn in call_prompts(f"Paciente {i}")]
+
+    for sid, (prompt, done) in enumerate(repeated + unique[:60]):
+        old = render_voiceresponse("demo", sid, prompt, done)
+        new = render_twiml("demo", sid, prompt, done)
+        assert old == new, f"el XML no coincide:\n{old}\n{new}"
+
+    print(f"{'caso':10} {'voiceresponse µs':>17} {'twiml µs':>10}")
+    for name, turns in (("repetidos", repeated), ("únicos", unique)):
+        old = bench(render_voiceresponse, turns, args.n)
+        new = bench(render_twiml, turns, args.n)
+        print(f"{name:10} {old:17.2f} {new:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
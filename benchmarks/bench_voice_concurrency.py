@@ -0,0 +1,123 @@
+"""
+Benchmark de concurrencia para /voice/chat-audio-json.
+
+Compara el endpoint actual (backend de voz async + BD en pool de hilos)
+contra una réplica del endpoint anterior (cliente síncrono y BD en el event
+loop). El backend de voz es FakeSpeech: simula la latencia de Whisper con un sleep,
+así que no se llama a OpenAI ni hace falta API key.
+
+Uso:
+    python benchmarks/bench_voice_concurrency.py [--requests 10] [--latency 0.3]
+
+Nota: con más turnos concurrentes que conexiones del pool de SQLAlchemy
+(15 por defecto) la versión anterior se traba: cada request retiene su
+conexión hasta responder y el checkout bloqueante corre en el event loop.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_voice_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI, File, Form, Header, Request, UploadFile  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.db import Base, SessionLocal, engine, get_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.routers import voice  # noqa: E402
+from app.seed import seed_data  # noqa: E402
+from app.services.speech import FakeSpeech, set_speech_backends  # noqa: E402
+from app.tenancy import get_clinic_slug, require_clinic  # noqa: E402
+
+
+class _Obj:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class FakeSyncOpenAI:
+    def __init__(self, latency: float):
+        def transcribe(**_):
+            time.sleep(latency)
+            return _Obj(text="Ana Perez")
+
+        self.audio = _Obj(transcriptions=_Obj(create=transcribe))
+
+
+def build_legacy_app(latency: float) -> FastAPI:
+    """Réplica del endpoint previo: async def con llamadas bloqueantes dentro."""
+    legacy = FastAPI()
+
+    @legacy.post("/voice/chat-audio-json")
+    async def chat_audio_json(
+        request: Request,
+        session_id: int = Form(...),
+        file: UploadFile = File(...),
+        db: Session = Depends(get_db),
+        x_clinic_slug: str | None = Header(default=None, alias="X-Clinic-Slug"),
+    ):
+        await file.read()
+        client = FakeSyncOpenAI(latency)
+        user_text = client.audio.transcriptions.create(model="whisper-1", file=None).text
+        clinic = require_clinic(db, get_clinic_slug(request, x_clinic_slug, None))
+        result = voice.handle_message(db, clinic.id, session_id, user_text)
+        return {"session_id": session_id, "prompt": result.get("prompt")}
+
+    return legacy
+
+
+def new_sessions(n: int) -> list[int]:
+    from app import crud
+
+    db = SessionLocal()
+    try:
+        return [crud.create_voice_session(db, clinic_id=1).id for _ in range(n)]
+    finally:
+        db.close()
+
+
+async def run(target_app, n: int) -> float:
+    session_ids = new_sessions(n)
+    transport = httpx.ASGITransport(app=target_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(sid):
+            r = await client.post(
+                "/voice/chat-audio-json",
+                data={"session_id": str(sid)},
+                files={"file": ("clip.webm", b"\x00" * 2048, "audio/webm")},
+                headers={"X-Clinic-Slug": "demo"},
+            )
+            r.raise_for_status()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(sid) for sid in session_ids))
+        return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="latencia simulada de Whisper (s)")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    seed_data()
+
+    set_speech_backends(FakeSpeech(transcript="Ana Perez", latency=args.latency))
+
+    before = asyncio.run(run(build_legacy_app(args.latency), args.requests))
+    after = asyncio.run(run(app, args.requests))
+
+    print(f"\n{args.requests} turnos concurrentes, latencia STT simulada {args.latency:.2f}s")
+    print(f"  antes  (bloqueante): {before:6.2f}s  -> {args.requests / before:6.1f} turnos/s")
+    print(f"  después (async)    : {after:6.2f}s  -> {args.requests / after:6.1f} turnos/s")
+
+
+if __name__ == "__main__":
+    main()
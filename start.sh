@@ -1 +1,16 @@
-uvicorn app.main:app --host 0.0.0.0 --port 10000
+# Por defecto un solo worker. Las sesiones de WhatsApp viven en la BD y las de
+# voz pueden ir a Redis (VOICE_SESSION_STORE=redis://...), pero los holds de
+# horarios (slot_holds) y el cache de horarios ocupados (slot_cache) siguen en
+# memoria de cada proceso: con WEB_CONCURRENCY > 1 un worker no ve los holds
+# de otro (dos llamadas pueden apartar el mismo horario) y las citas que
+# agenda otro worker tardan hasta SLOT_CACHE_TTL_SECONDS en verse. La cita
+# igual se valida contra la BD al confirmar.
+if [ "${WEB_CONCURRENCY:-1}" -gt 1 ]; then
+  echo "⚠️ WEB_CONCURRENCY=${WEB_CONCURRENCY}: los holds de horarios y el cache de slots no se comparten entre workers" >&2
+fi
+# Despachador de campañas de llamadas: un único proceso aparte de los workers
+# web, así sus límites (CPS por número, llamadas por clínica) valen para todos.
+if [ "${CAMPAIGN_WORKERS:-0}" -gt 0 ]; then
+  python -m app.services.campaigns &
+fi
+uvicorn app.main:app --host 0.0.0.0 --port 10000 --workers "${WEB_CONCURRENCY:-1}"
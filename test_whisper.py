@@ -1,7 +1,9 @@
-from openai import OpenAI
+import asyncio
 import os
 
-client = OpenAI()
+from app.services.speech import get_stt
+
+# STT_BACKEND=local usa faster-whisper en CPU; por defecto, OpenAI (whisper-1)
 
 AUDIO_PATH = "Recording.m4a"  # usa el nombre real
 
@@ -9,10 +11,7 @@ if not os.path.exists(AUDIO_PATH):
     raise FileNotFoundError(f"No existe el archivo: {AUDIO_PATH}")
 
 with open(AUDIO_PATH, "rb") as f:
-    transcript = client.audio.transcriptions.create(
-        model="whisper-1",
-        file=f,
-    )
+    text = asyncio.run(get_stt().transcribe(f, AUDIO_PATH))
 
 print("=== TRANSCRIPCIÓN ===")
-print(transcript.text)
+print(text)